@@ -1,60 +1,103 @@
+import hashlib
 import logging
-import subprocess
 import os
-import yaml
-import shutil
-import aiofiles
 import asyncio
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers import intent
+from homeassistant.helpers.network import NoURLAvailableError, get_url
 from .intent import LBEQueryLogbookHandler
 
 # Import dependencies from the local directory
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_CONNECTION_LIMIT,
+    CONF_REQUEST_TIMEOUT,
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_REQUEST_TIMEOUT,
+    CONF_CACHE_SIZE,
+    CONF_CACHE_TTL,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL,
+    CONF_BUFFER_HOURS,
+    CONF_BUFFER_MAX_EVENTS,
+    DEFAULT_BUFFER_HOURS,
+    DEFAULT_BUFFER_MAX_EVENTS,
+    CONF_ARCHIVE_DAYS,
+    DEFAULT_ARCHIVE_DAYS,
+    CONF_ACTIVITY_PRUNING,
+    DEFAULT_ACTIVITY_PRUNING,
+    CONF_TRACE_HISTORY,
+    DEFAULT_TRACE_HISTORY,
+    CONF_STORE_LAST_RESULT,
+    DEFAULT_STORE_LAST_RESULT,
+    CONF_BACKEND,
+    BACKEND_WEBSOCKET,
+    DEFAULT_BACKEND,
+)
 #import dependencies from logbook_processor
 from .logbook_processor.query import run_log_query as log_query
+from .logbook_processor.client import LogbookClient
+from .logbook_processor.index import EntityIndex
+from .logbook_processor.areas import AreaResolver
+from .logbook_processor.cache import QueryCache
+from .logbook_processor.metrics import QueryMetrics
+from .logbook_processor.planner import QueryPlanner
+# The optional components are imported in async_setup_entry, only when they are enabled
 _LOGGER = logging.getLogger(__name__)
 
-# Ensure the log and response directories exist
+PLATFORMS = ["sensor"]
+
 script_dir = os.path.dirname(__file__)
 log_dir = os.path.join(script_dir, "log")
-response_dir = os.path.join(script_dir, "response")
-os.makedirs(log_dir, exist_ok=True)
-os.makedirs(response_dir, exist_ok=True)
+INTENT_SCRIPT = "logbook_expose_intent_scripts.yaml"
 
-async def run_log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, char_limit, start_time, end_time):
+async def run_log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, char_limit, start_time, end_time, runtime=None, **kwargs):
     """Run the log_query logic and return the result."""
 
     try:
-        result = await log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, char_limit, start_time, end_time)
+        result = await log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, char_limit, start_time, end_time, runtime=runtime, **kwargs)
         return result
     except Exception as e:
         _LOGGER.error("Error running log_query logic: %s", e)
         return "Error: Unable to process the log query."
 
+def sync_intent_script(source_file, dest_dir):
+    """Copy the intent script unless the installed copy has the same content hash; runs in an executor.
+
+    Returns True if the file was written, False if it was up to date and None if the source is missing.
+    """
+    if not os.path.exists(source_file):
+        return None
+    with open(source_file, "rb") as src:
+        content = src.read()
+    dest_file = os.path.join(dest_dir, INTENT_SCRIPT)
+    try:
+        with open(dest_file, "rb") as dst:
+            if hashlib.sha256(dst.read()).digest() == hashlib.sha256(content).digest():
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(dest_dir, exist_ok=True)
+    with open(dest_file, "wb") as dst:
+        dst.write(content)
+    return True
+
 async def copy_intent_script(hass: HomeAssistant):
-    """Copy the intent script file to the intent_scripts directory asynchronously."""
+    """Copy the intent script file to the intent_scripts directory if it changed."""
+    source_file = os.path.join(script_dir, INTENT_SCRIPT)
+    dest_dir = os.path.join(hass.config.config_dir, "intent_scripts")
     try:
-        source_file = os.path.join(script_dir, "logbook_expose_intent_scripts.yaml")
-        config_dir = hass.config.config_dir
-        dest_dir = os.path.join(config_dir, "intent_scripts")
-        dest_file = os.path.join(dest_dir, "logbook_expose_intent_scripts.yaml")
-
-        os.makedirs(dest_dir, exist_ok=True)
-
-        if os.path.exists(source_file):
-            async with aiofiles.open(source_file, 'rb') as src, aiofiles.open(dest_file, 'wb') as dst:
-                while True:
-                    chunk = await src.read(1024 * 1024)  # Read in chunks of 1MB
-                    if not chunk:
-                        break
-                    await dst.write(chunk)
-            _LOGGER.info(f"Successfully copied {source_file} to {dest_file}")
-        else:
-            _LOGGER.warning(f"Source file {source_file} does not exist, could not copy to intent_scripts directory")
+        copied = await hass.async_add_executor_job(sync_intent_script, source_file, dest_dir)
     except Exception as e:
         _LOGGER.error(f"Error copying intent scripts file: {e}")
+        return
+    if copied is None:
+        _LOGGER.warning(f"Source file {source_file} does not exist, could not copy to intent_scripts directory")
+    elif copied:
+        _LOGGER.info(f"Successfully copied {source_file} to {dest_dir}")
+    else:
+        _LOGGER.debug("Intent scripts file in %s is up to date", dest_dir)
 
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up the logbook_expose integration."""
@@ -76,32 +119,40 @@ async def async_setup(hass: HomeAssistant, config: dict):
         state = call.data.get("state", "")
         start_time = call.data.get("start_time", "")
         end_time = call.data.get("end_time", "")
+        max_events = call.data.get("max_events")
+        newest_first = call.data.get("newest_first", False)
+        output_format = call.data.get("output_format")
 
 
-        result = await run_log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, config.get("char_limit", 262144), start_time, end_time)
-
-        hass.states.async_set(
-            "logbook_expose.last_result",
-            "ok",  # Set a short state value
-            {
-                "question": question,
-                "question_type": question_type,
-                "area": area,
-                "time_period": time_period,
-                "entity": entity,
-                "domain": domain,
-                "device_class": device_class,
-                "state": state,
-                "logbook": result,  # Store the log result in attributes
-                "start_time": start_time,
-                "end_time": end_time,
-            }
-        )
+        result = await run_log_query(hass, ha_token, question, question_type, area, time_period, entity, domain, device_class, state, config.get("char_limit", 262144), start_time, end_time, max_events=max_events, newest_first=newest_first, output_format=output_format)
+
+        # Opt-in: the recorder writes every state change and it is pushed to every websocket client
+        if config.get(CONF_STORE_LAST_RESULT, DEFAULT_STORE_LAST_RESULT):
+            hass.states.async_set(
+                "logbook_expose.last_result",
+                "ok",  # Set a short state value
+                {
+                    "question": question,
+                    "question_type": question_type,
+                    "area": area,
+                    "time_period": time_period,
+                    "entity": entity,
+                    "domain": domain,
+                    "device_class": device_class,
+                    "state": state,
+                    "logbook": result,  # Store the log result in attributes
+                    "start_time": start_time,
+                    "end_time": end_time,
+                }
+            )
+        if call.return_response:
+            return {"logbook": result}
 
-    hass.services.async_register("logbook_expose", "log_query", handle_log_query)
+    hass.services.async_register("logbook_expose", "log_query", handle_log_query, supports_response=SupportsResponse.OPTIONAL)
     _LOGGER.info("Registered log_query service with set_logbook_expose trigger.")
 
     if enable_file_logging:
+        await hass.async_add_executor_job(lambda: os.makedirs(log_dir, exist_ok=True))
         _LOGGER.info("File logging is enabled.")
     else:
         _LOGGER.info("File logging is disabled.")
@@ -111,7 +162,91 @@ async def async_setup(hass: HomeAssistant, config: dict):
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up logbook_expose from a config entry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    # One keep-alive HTTP client per config entry, closed again on unload
+    client = LogbookClient(
+        connection_limit=entry.options.get(CONF_CONNECTION_LIMIT, DEFAULT_CONNECTION_LIMIT),
+        request_timeout=entry.options.get(CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT),
+    )
+    # Local URL of this instance for the logbook API and websocket; never the cloud URL
+    try:
+        base_url = get_url(hass, allow_cloud=False, prefer_external=False)
+    except NoURLAvailableError:
+        base_url = None
+    # One authenticated websocket connection for the websocket backend, opened on first use
+    websocket = None
+    if entry.options.get(CONF_BACKEND, DEFAULT_BACKEND) == BACKEND_WEBSOCKET:
+        if base_url is None:
+            _LOGGER.warning("No URL of this Home Assistant instance is available, the websocket backend falls back to the logbook API")
+        else:
+            from .logbook_processor.websocket import LogbookWebsocket
+
+            websocket = LogbookWebsocket(
+                LogbookWebsocket.url_from_base(base_url),
+                entry.data.get("ha_token"),
+                request_timeout=entry.options.get(CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT),
+            )
+    # Entity/area index kept current from registry and state events
+    index = EntityIndex(hass)
+    index.async_start()
+    area_resolver = AreaResolver(hass)
+    area_resolver.async_start()
+    # Result cache for repeated questions; closed windows stay until evicted
+    cache = None
+    cache_size = entry.options.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE)
+    if cache_size:
+        cache = QueryCache(
+            max_bytes=cache_size * 1024 * 1024,
+            open_ttl=entry.options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL),
+        )
+    # Opt-in ring buffer of recent state changes for short windows
+    buffer = None
+    buffer_hours = entry.options.get(CONF_BUFFER_HOURS, DEFAULT_BUFFER_HOURS)
+    if buffer_hours:
+        from .logbook_processor.buffer import EventBuffer
+
+        buffer = EventBuffer(
+            hass,
+            index.is_exposed,
+            hours=buffer_hours,
+            max_events=entry.options.get(CONF_BUFFER_MAX_EVENTS, DEFAULT_BUFFER_MAX_EVENTS),
+        )
+        buffer.async_start()
+    # Opt-in daily files of state changes for windows older than the recorder keeps
+    archive = None
+    archive_days = entry.options.get(CONF_ARCHIVE_DAYS, DEFAULT_ARCHIVE_DAYS)
+    if archive_days:
+        from .logbook_processor.archive import EventArchive
+
+        # Under .storage, so it survives updates that replace the integration directory
+        archive_dir = hass.config.path(".storage", f"{DOMAIN}_archive")
+        archive = EventArchive(hass, index.is_exposed, archive_dir, days=archive_days)
+        archive.async_start()
+    # Hourly activity of the entities, to skip candidates that did not change in a window
+    activity = None
+    if entry.options.get(CONF_ACTIVITY_PRUNING, DEFAULT_ACTIVITY_PRUNING):
+        from .logbook_processor.activity import ActivityIndex
+
+        activity = ActivityIndex(hass)
+        activity.async_start()
+    runtime = {
+        # Options are read from the live entry, so they are current in every query
+        "entry": entry,
+        "base_url": base_url,
+        "client": client,
+        "websocket": websocket,
+        "index": index,
+        "areas": area_resolver,
+        "cache": cache,
+        "buffer": buffer,
+        "archive": archive,
+        "activity": activity,
+        # Stage timings and volumes of recent queries, shown by the sensors and diagnostics
+        "metrics": QueryMetrics(entry.options.get(CONF_TRACE_HISTORY, DEFAULT_TRACE_HISTORY)),
+        # Learned event rates the retrieval strategy of each query is planned from
+        "planner": QueryPlanner(entry.options.get(CONF_TRACE_HISTORY, DEFAULT_TRACE_HISTORY)),
+    }
+    hass.data[DOMAIN][entry.entry_id] = runtime
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     #await copy_intent_script(hass)
     hass.helpers.intent.async_register(LBEQueryLogbookHandler())
@@ -128,37 +263,67 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         state = call.data.get("state", "")
         start_time = call.data.get("start_time", "")
         end_time = call.data.get("end_time", "")
+        max_events = call.data.get("max_events")
+        newest_first = call.data.get("newest_first", False)
+        output_format = call.data.get("output_format")
 
-        result = await run_log_query(hass, entry.data.get("ha_token"), question, question_type, area, time_period, entity, domain, device_class, state, entry.options.get("char_limit", 262144), start_time, end_time)
-        hass.states.async_set(
-            "logbook_expose.last_result",
-            "ok",  # Set a short state value
-            {
-                "question": question,
-                "question_type": question_type,
-                "area": area,
-                "time_period": time_period,
-                "start_time": start_time,
-                "end_time": end_time,
-                "entity": entity,
-                "domain": domain,
-                "device_class": device_class,
-                "state": state,
-                "logbook": result,  # Store the log result in attributes
-                "start_time": start_time,
-                "end_time": end_time,
-            }
-        )
+        result = await run_log_query(hass, entry.data.get("ha_token"), question, question_type, area, time_period, entity, domain, device_class, state, entry.options.get("char_limit", 262144), start_time, end_time, runtime, max_events=max_events, newest_first=newest_first, output_format=output_format)
+        # Opt-in: the recorder writes every state change and it is pushed to every websocket client
+        if entry.options.get(CONF_STORE_LAST_RESULT, DEFAULT_STORE_LAST_RESULT):
+            hass.states.async_set(
+                "logbook_expose.last_result",
+                "ok",  # Set a short state value
+                {
+                    "question": question,
+                    "question_type": question_type,
+                    "area": area,
+                    "time_period": time_period,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "entity": entity,
+                    "domain": domain,
+                    "device_class": device_class,
+                    "state": state,
+                    "logbook": result,  # Store the log result in attributes
+                }
+            )
+        if call.return_response:
+            return {"logbook": result}
 
-    hass.services.async_register(DOMAIN, "log_query", handle_log_query)
+    hass.services.async_register(DOMAIN, "log_query", handle_log_query, supports_response=SupportsResponse.OPTIONAL)
     _LOGGER.info("Registered log_query service with set_logbook_expose trigger.")
 
+    # Options that size the components above only take effect when the entry is set up again
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
+    return True
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Unload a logbook_expose config entry."""
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
+    runtime = hass.data.get(DOMAIN, {}).pop(entry.entry_id, None)
+    # The service of the entry would keep using its closed clients
+    hass.services.async_remove(DOMAIN, "log_query")
+    if runtime and runtime.get("index"):
+        runtime["index"].async_stop()
+    if runtime and runtime.get("areas"):
+        runtime["areas"].async_stop()
+    if runtime and runtime.get("buffer"):
+        runtime["buffer"].async_stop()
+    if runtime and runtime.get("archive"):
+        runtime["archive"].async_stop()
+    if runtime and runtime.get("activity"):
+        runtime["activity"].async_stop()
+    if runtime and runtime.get("client"):
+        await runtime["client"].async_close()
+    if runtime and runtime.get("websocket"):
+        await runtime["websocket"].async_close()
     return True
 
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry):
-    """Reload logbook_expose from a config entry."""
-    # Unload the entry if it exists
-    await hass.config_entries.async_unload(entry.entry_id)
-    await async_setup_entry(hass, entry)
+    """Reload logbook_expose when the options of the config entry change."""
+    # Unloads the entry and sets it up again through Home Assistant, so its state stays consistent
+    await hass.config_entries.async_reload(entry.entry_id)
 
     await copy_intent_script(hass)
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""Stage-level benchmarks of logbook_processor/query.py on synthetic data.
+
+Run from the integration directory:
+
+    python benchmarks/bench_query.py                      # 1k, 100k and 1M entries
+    python benchmarks/bench_query.py --sizes 1000 100000
+    python benchmarks/bench_query.py --compare benchmarks/results/1.0.0-20250101-120000.json
+
+Results are written to benchmarks/results/<version>-<timestamp>.json.
+"""
+import argparse
+from datetime import datetime, timezone
+import gc
+import importlib
+import json
+import logging
+from pathlib import Path
+import platform
+import statistics
+import sys
+import time
+import types
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+PACKAGE = "logbook_expose"
+
+sys.path.insert(0, str(BENCH_DIR))
+from synthetic import build_dataset  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+# Registry and time range stages do not consume entries; they run this many queries per measurement
+QUERY_BATCH = 1000
+# No truncation, so formatting cost scales with the number of entries
+UNLIMITED_CHARS = sys.maxsize
+
+TIME_PERIODS = ["today", "yesterday", "3 days ago", "last 3 hours", "last 15 minutes", "last 2 days", "now"]
+
+
+def load_query_module():
+    # The integration's __init__ needs a running Home Assistant; registering the
+    # directory as a bare package lets logbook_processor be imported on its own
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [str(ROOT)]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.logbook_processor.query")
+
+
+def manifest_version():
+    with open(ROOT / "manifest.json", encoding="utf-8") as manifest:
+        return json.load(manifest).get("version", "unknown")
+
+
+# --- Stages ---
+# Each stage takes the dataset and returns a callable that runs the measured work once.
+def stage_calculate_time_range(query, hass, entities, entries):
+    now = datetime(2025, 1, 8, 12, 0, tzinfo=timezone.utc)
+
+    def run():
+        for i in range(QUERY_BATCH):
+            query.calculate_time_range(TIME_PERIODS[i % len(TIME_PERIODS)], now)
+    return run
+
+
+def stage_gather_candidate_entities(query, hass, entities, entries):
+    area_ids = {entities[0].area_id}
+    filters = [
+        {},
+        {"domain": "light"},
+        {"device_classes": ["motion", "door"]},
+        {"area_ids": area_ids},
+        {"entity_name_or_id": entities[len(entities) // 2].name},
+    ]
+
+    def run():
+        for i in range(QUERY_BATCH // 100):
+            query.gather_candidate_entities(hass, **filters[i % len(filters)])
+    return run
+
+
+def stage_resolve_area_ids(query, hass, entities, entries):
+    area_count = len(hass.data["area_registry"].areas)
+    names = [f"Area {i % area_count}, zone {(i * 7) % area_count}" for i in range(QUERY_BATCH)]
+
+    def run():
+        for name in names:
+            query.resolve_area_ids(query.fetch_area_mappings(hass), name)
+    return run
+
+
+def stage_filter_logbook_entries(query, hass, entities, entries):
+    candidates = [hass.states.get(entity.entity_id) for entity in entities]
+
+    def run():
+        query.filter_logbook_entries(entries, candidates)
+    return run
+
+
+def stage_inject_resolved_properties(query, hass, entities, entries):
+    records = list(query.records_from_entries(entries))
+
+    def run():
+        query.inject_resolved_properties(hass, records, ["area", "device_class"])
+    return run
+
+
+def stage_format_logbook_entries(query, hass, entities, entries):
+    records = list(query.records_from_entries(entries))
+    query.inject_resolved_properties(hass, records, ["area", "device_class"])
+
+    def run():
+        query.format_logbook_entries(records, UNLIMITED_CHARS)
+    return run
+
+
+STAGES = {
+    "calculate_time_range": stage_calculate_time_range,
+    "gather_candidate_entities": stage_gather_candidate_entities,
+    "resolve_area_ids": stage_resolve_area_ids,
+    "filter_logbook_entries": stage_filter_logbook_entries,
+    "inject_resolved_properties": stage_inject_resolved_properties,
+    "format_logbook_entries": stage_format_logbook_entries,
+}
+
+
+# --- Runner ---
+def measure(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": len(timings)}
+
+
+def run_benchmarks(sizes, stages, repeat, seed):
+    query = load_query_module()
+    results = {name: {} for name in stages}
+    for size in sizes:
+        started = time.perf_counter()
+        hass, entities, entries = build_dataset(size, seed=seed)
+        print(f"{size:>9} entries: {len(entities)} entities generated in {time.perf_counter() - started:.1f}s")
+        # Big inputs take seconds per run, so they are measured fewer times
+        size_repeat = max(1, repeat if size < 1_000_000 else repeat // 3)
+        for name in stages:
+            run = STAGES[name](query, hass, entities, entries)
+            result = measure(run, size_repeat)
+            results[name][str(size)] = result
+            print(f"    {name:<28} best {result['best'] * 1000:10.2f} ms   median {result['median'] * 1000:10.2f} ms")
+        del hass, entities, entries
+    return results
+
+
+def save_results(results, sizes, seed, output=None):
+    version = manifest_version()
+    created = datetime.now(timezone.utc)
+    report = {
+        "version": version,
+        "created": created.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "sizes": sizes,
+        "results": results,
+    }
+    path = Path(output) if output else RESULTS_DIR / f"{version}-{created.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {path}")
+    return report
+
+
+def compare_results(baseline_path, report):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline.get('version')} ({baseline.get('created')}), best times:")
+    for name, sizes in report["results"].items():
+        for size, result in sizes.items():
+            old = baseline.get("results", {}).get(name, {}).get(size)
+            if not old:
+                continue
+            ratio = result["best"] / old["best"] if old["best"] else float("inf")
+            marker = "  slower" if ratio > 1.1 else ("  faster" if ratio < 0.9 else "")
+            print(f"    {name:<28} {size:>9}: {old['best'] * 1000:10.2f} ms -> {result['best'] * 1000:10.2f} ms  x{ratio:.2f}{marker}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of logbook entries")
+    parser.add_argument("--stages", nargs="+", choices=sorted(STAGES), default=list(STAGES), help="Stages to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Measurements per stage and size")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<version>-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args(argv)
+
+    # Warnings of the pipeline (e.g. truncation) would only add noise to the timings
+    logging.basicConfig(level=logging.ERROR)
+    results = run_benchmarks(args.sizes, args.stages, args.repeat, args.seed)
+    report = save_results(results, args.sizes, args.seed, args.output)
+    if args.compare:
+        compare_results(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
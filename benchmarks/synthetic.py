@@ -0,0 +1,200 @@
+"""Deterministic synthetic logbook data and registries for the benchmarks."""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import random
+
+# domain, device_class, possible states; sensors are the chatty ones
+ENTITY_KINDS = [
+    ("light", None, ["on", "off"]),
+    ("switch", None, ["on", "off"]),
+    ("binary_sensor", "motion", ["on", "off"]),
+    ("binary_sensor", "door", ["on", "off"]),
+    ("binary_sensor", "window", ["on", "off"]),
+    ("climate", None, ["heat", "cool", "off"]),
+    ("media_player", None, ["playing", "paused", "idle", "off"]),
+    ("lock", None, ["locked", "unlocked"]),
+]
+SENSOR_KIND = ("sensor", "temperature", None)
+UNKNOWN_STATES = ["unknown", "unavailable"]
+
+
+@dataclass
+class SyntheticEntity:
+    entity_id: str
+    name: str
+    domain: str
+    device_class: str
+    states: list
+    area_id: str
+    device_id: str
+    chatty: bool
+    # Take the area from the device instead of the entity registry entry
+    inherit_area: bool = False
+
+
+# --- Fake registries ---
+class FakeState:
+    def __init__(self, entity_id, state, attributes):
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes
+        self.domain = entity_id.split(".", 1)[0]
+
+
+class FakeStates:
+    def __init__(self, states):
+        self._states = {state.entity_id: state for state in states}
+
+    def get(self, entity_id):
+        return self._states.get(entity_id)
+
+    def async_all(self):
+        return list(self._states.values())
+
+
+@dataclass
+class RegistryEntity:
+    entity_id: str
+    area_id: str = None
+    device_id: str = None
+    options: dict = field(default_factory=dict)
+
+
+@dataclass
+class RegistryDevice:
+    id: str
+    area_id: str = None
+
+
+@dataclass
+class RegistryArea:
+    id: str
+    name: str
+    aliases: set = field(default_factory=set)
+
+
+@dataclass
+class Registry:
+    entities: dict = field(default_factory=dict)
+    devices: dict = field(default_factory=dict)
+    areas: dict = field(default_factory=dict)
+
+
+@dataclass
+class FakeConfig:
+    internal_url: str = "http://127.0.0.1:8123"
+    external_url: str = None
+
+
+class FakeHass:
+    """Just the parts of hass the query pipeline reads: registries, states and config."""
+
+    def __init__(self, entities, area_count):
+        areas = {
+            f"area_{i}": RegistryArea(f"area_{i}", f"Area {i}", {f"Zone {i}"})
+            for i in range(area_count)
+        }
+        devices = {}
+        registry_entities = {}
+        states = []
+        for entity in entities:
+            own_area = None if entity.inherit_area else entity.area_id
+            devices.setdefault(entity.device_id, RegistryDevice(entity.device_id, entity.area_id))
+            registry_entities[entity.entity_id] = RegistryEntity(
+                entity.entity_id,
+                area_id=own_area,
+                device_id=entity.device_id,
+                options={"conversation": {"should_expose": True}, "aliases": [f"{entity.name} alias"]},
+            )
+            attributes = {"friendly_name": entity.name}
+            if entity.device_class:
+                attributes["device_class"] = entity.device_class
+            states.append(FakeState(entity.entity_id, entity.states[0], attributes))
+        self.data = {
+            "entity_registry": Registry(entities=registry_entities),
+            "device_registry": Registry(devices=devices),
+            "area_registry": Registry(areas=areas),
+        }
+        self.states = FakeStates(states)
+        self.config = FakeConfig()
+
+
+# --- Generators ---
+def generate_entities(count, area_count=10, chatty_ratio=0.1, seed=42):
+    rng = random.Random(seed)
+    entities = []
+    chatty_count = max(1, int(count * chatty_ratio)) if chatty_ratio else 0
+    for i in range(count):
+        chatty = i < chatty_count
+        domain, device_class, states = SENSOR_KIND if chatty else ENTITY_KINDS[i % len(ENTITY_KINDS)]
+        if states is None:
+            states = [f"{20 + step / 10:.1f}" for step in range(40)]
+        area = rng.randrange(area_count)
+        entities.append(SyntheticEntity(
+            entity_id=f"{domain}.synthetic_{i}",
+            name=f"Synthetic {domain.replace('_', ' ')} {i}",
+            domain=domain,
+            device_class=device_class,
+            states=states,
+            area_id=f"area_{area}",
+            device_id=f"device_{i // 2}",
+            chatty=chatty,
+            inherit_area=i % 2 == 1,
+        ))
+    return entities
+
+
+def generate_entries(
+    entities,
+    count,
+    events_per_minute=60,
+    chatty_share=0.6,
+    unknown_burst_rate=0.002,
+    unknown_burst_length=5,
+    start=None,
+    seed=42,
+):
+    """Logbook API entries in time order.
+
+    chatty_share of the events belong to the chatty entities; with probability
+    unknown_burst_rate an entity starts a burst of unknown_burst_length
+    unknown/unavailable states.
+    """
+    rng = random.Random(seed)
+    chatty = [entity for entity in entities if entity.chatty]
+    quiet = [entity for entity in entities if not entity.chatty] or chatty
+    interval = 60.0 / events_per_minute
+    ts = (start or datetime(2025, 1, 1, tzinfo=timezone.utc)).timestamp()
+    bursts = {}  # entity_id -> remaining unknown states
+
+    entries = []
+    for _ in range(count):
+        ts += rng.expovariate(1.0 / interval)
+        pool = chatty if chatty and rng.random() < chatty_share else quiet
+        entity = pool[rng.randrange(len(pool))]
+        if entity.entity_id not in bursts and rng.random() < unknown_burst_rate:
+            bursts[entity.entity_id] = unknown_burst_length
+        if entity.entity_id in bursts:
+            state = rng.choice(UNKNOWN_STATES)
+            bursts[entity.entity_id] -= 1
+            if not bursts[entity.entity_id]:
+                del bursts[entity.entity_id]
+        else:
+            state = rng.choice(entity.states)
+        entries.append({
+            "when": datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z"),
+            "entity_id": entity.entity_id,
+            "state": state,
+            "name": entity.name,
+        })
+    return entries
+
+
+def build_dataset(size, seed=42, **options):
+    # Registries grow with the data: about one entity per hundred entries
+    entity_count = options.pop("entity_count", None) or max(20, size // 100)
+    area_count = options.pop("area_count", None) or max(5, entity_count // 20)
+    entities = generate_entities(entity_count, area_count, options.pop("chatty_ratio", 0.1), seed)
+    hass = FakeHass(entities, area_count)
+    entries = generate_entries(entities, size, seed=seed, **options)
+    return hass, entities, entries
@@ -3,7 +3,44 @@ from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.helpers import config_validation as cv
 
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_CONNECTION_LIMIT,
+    CONF_REQUEST_TIMEOUT,
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_REQUEST_TIMEOUT,
+    CONF_MAX_PER_ENTITY_REQUESTS,
+    CONF_FETCH_CONCURRENCY,
+    DEFAULT_MAX_PER_ENTITY_REQUESTS,
+    DEFAULT_FETCH_CONCURRENCY,
+    CONF_MAX_BATCHED_ENTITIES,
+    DEFAULT_MAX_BATCHED_ENTITIES,
+    CONF_BACKEND,
+    BACKEND_HTTP,
+    BACKEND_RECORDER,
+    BACKEND_WEBSOCKET,
+    DEFAULT_BACKEND,
+    CONF_STREAMING,
+    DEFAULT_STREAMING,
+    CONF_CACHE_SIZE,
+    CONF_CACHE_TTL,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL,
+    CONF_BUFFER_HOURS,
+    CONF_BUFFER_MAX_EVENTS,
+    DEFAULT_BUFFER_HOURS,
+    DEFAULT_BUFFER_MAX_EVENTS,
+    CONF_SHARD_HOURS,
+    DEFAULT_SHARD_HOURS,
+    CONF_TRACE_HISTORY,
+    DEFAULT_TRACE_HISTORY,
+    CONF_STORE_LAST_RESULT,
+    DEFAULT_STORE_LAST_RESULT,
+    CONF_ARCHIVE_DAYS,
+    DEFAULT_ARCHIVE_DAYS,
+    CONF_ACTIVITY_PRUNING,
+    DEFAULT_ACTIVITY_PRUNING,
+)
 
 class LogbookExposeConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Logbook Expose."""
@@ -57,12 +94,44 @@ class LogbookExposeOptionsFlowHandler(config_entries.OptionsFlow):
             vol.Required("ha_token", default=self.config_entry.options.get("ha_token", "")): vol.All(str, vol.Length(min=1)),
             vol.Optional("enable_file_logging", default=self.config_entry.options.get("enable_file_logging", False)): bool,
             vol.Optional("char_limit", default=self.config_entry.options.get("char_limit", 262144)): vol.All(vol.Coerce(int), vol.Range(min=1, max=262144)),
+            vol.Optional(CONF_CONNECTION_LIMIT, default=self.config_entry.options.get(CONF_CONNECTION_LIMIT, DEFAULT_CONNECTION_LIMIT)): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+            vol.Optional(CONF_REQUEST_TIMEOUT, default=self.config_entry.options.get(CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT)): vol.All(vol.Coerce(int), vol.Range(min=1, max=300)),
+            vol.Optional(CONF_MAX_PER_ENTITY_REQUESTS, default=self.config_entry.options.get(CONF_MAX_PER_ENTITY_REQUESTS, DEFAULT_MAX_PER_ENTITY_REQUESTS)): vol.All(vol.Coerce(int), vol.Range(min=1, max=500)),
+            vol.Optional(CONF_FETCH_CONCURRENCY, default=self.config_entry.options.get(CONF_FETCH_CONCURRENCY, DEFAULT_FETCH_CONCURRENCY)): vol.All(vol.Coerce(int), vol.Range(min=1, max=32)),
+            vol.Optional(CONF_MAX_BATCHED_ENTITIES, default=self.config_entry.options.get(CONF_MAX_BATCHED_ENTITIES, DEFAULT_MAX_BATCHED_ENTITIES)): vol.All(vol.Coerce(int), vol.Range(min=0, max=5000)),
+            vol.Optional(CONF_BACKEND, default=self.config_entry.options.get(CONF_BACKEND, DEFAULT_BACKEND)): vol.In([BACKEND_HTTP, BACKEND_RECORDER, BACKEND_WEBSOCKET]),
+            vol.Optional(CONF_STREAMING, default=self.config_entry.options.get(CONF_STREAMING, DEFAULT_STREAMING)): bool,
+            vol.Optional(CONF_CACHE_SIZE, default=self.config_entry.options.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE)): vol.All(vol.Coerce(int), vol.Range(min=0, max=256)),
+            vol.Optional(CONF_CACHE_TTL, default=self.config_entry.options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL)): vol.All(vol.Coerce(int), vol.Range(min=0, max=3600)),
+            vol.Optional(CONF_BUFFER_HOURS, default=self.config_entry.options.get(CONF_BUFFER_HOURS, DEFAULT_BUFFER_HOURS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=48)),
+            vol.Optional(CONF_BUFFER_MAX_EVENTS, default=self.config_entry.options.get(CONF_BUFFER_MAX_EVENTS, DEFAULT_BUFFER_MAX_EVENTS)): vol.All(vol.Coerce(int), vol.Range(min=1000, max=1000000)),
+            vol.Optional(CONF_ARCHIVE_DAYS, default=self.config_entry.options.get(CONF_ARCHIVE_DAYS, DEFAULT_ARCHIVE_DAYS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=3650)),
+            vol.Optional(CONF_ACTIVITY_PRUNING, default=self.config_entry.options.get(CONF_ACTIVITY_PRUNING, DEFAULT_ACTIVITY_PRUNING)): bool,
+            vol.Optional(CONF_SHARD_HOURS, default=self.config_entry.options.get(CONF_SHARD_HOURS, DEFAULT_SHARD_HOURS)): vol.All(vol.Coerce(int), vol.Range(min=0, max=168)),
+            vol.Optional(CONF_TRACE_HISTORY, default=self.config_entry.options.get(CONF_TRACE_HISTORY, DEFAULT_TRACE_HISTORY)): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+            vol.Optional(CONF_STORE_LAST_RESULT, default=self.config_entry.options.get(CONF_STORE_LAST_RESULT, DEFAULT_STORE_LAST_RESULT)): bool,
         })
 
         descriptions = {
             "ha_token": "The Home Assistant Long-Lived Access Token used for authentication.",
             "enable_file_logging": "Enable or disable logging to files for debugging purposes.",
             "char_limit": "Maximum number of characters allowed in the response text (default: 262,144).",
+            "connection_limit": "Maximum number of simultaneous connections to the logbook API (default: 10).",
+            "request_timeout": "Timeout in seconds for a single logbook API request (default: 30).",
+            "max_per_entity_requests": "Below this number of candidate entities, each entity is fetched with its own request (default: 20).",
+            "fetch_concurrency": "Maximum number of logbook requests running in parallel for a single query (default: 4).",
+            "max_batched_entities": "Up to this number of candidate entities, they are fetched as comma-separated entity lists instead of the whole logbook, 0 disables batching (default: 500).",
+            "backend": "Where logbook data is read from: the logbook REST API (http), the recorder database (recorder) or a persistent websocket connection (websocket).",
+            "streaming": "Decode large logbook responses incrementally and filter entries while they arrive (default: enabled).",
+            "cache_size": "Memory budget of the query result cache in MiB, 0 disables it (default: 8).",
+            "cache_ttl": "Seconds a cached result of a window that is still open (today, last N minutes) stays valid (default: 30).",
+            "buffer_hours": "Hours of recent state changes kept in memory to answer short windows without an API call, 0 disables it (default: 0).",
+            "buffer_max_events": "Maximum number of state changes held by the in-memory buffer (default: 50,000).",
+            "archive_days": "Days of state changes kept in daily files under .storage/logbook_expose_archive in the configuration directory, answering windows older than the recorder keeps, 0 disables the archive (default: 0).",
+            "activity_pruning": "Skip candidate entities whose state did not change during the queried window, so they are never fetched (default: enabled).",
+            "shard_hours": "Ranges longer than this many hours are split into shards fetched in parallel, 0 disables sharding (default: 24).",
+            "trace_history": "Number of recent queries the p50/p95 sensors and the diagnostics download are based on (default: 50).",
+            "store_last_result": "Also write every result to the logbook_expose.last_result state, which the recorder stores (default: disabled).",
         }
 
         return self.async_show_form(
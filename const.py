@@ -1 +1,59 @@
 DOMAIN = "logbook_expose"
+
+CONF_CONNECTION_LIMIT = "connection_limit"
+CONF_REQUEST_TIMEOUT = "request_timeout"
+
+DEFAULT_CONNECTION_LIMIT = 10
+DEFAULT_REQUEST_TIMEOUT = 30
+
+CONF_MAX_PER_ENTITY_REQUESTS = "max_per_entity_requests"
+CONF_FETCH_CONCURRENCY = "fetch_concurrency"
+
+CONF_MAX_BATCHED_ENTITIES = "max_batched_entities"
+
+DEFAULT_MAX_PER_ENTITY_REQUESTS = 20
+DEFAULT_FETCH_CONCURRENCY = 4
+DEFAULT_MAX_BATCHED_ENTITIES = 500  # 0 fetches the whole logbook above max_per_entity_requests
+
+CONF_BACKEND = "backend"
+
+BACKEND_HTTP = "http"
+BACKEND_RECORDER = "recorder"
+BACKEND_WEBSOCKET = "websocket"
+DEFAULT_BACKEND = BACKEND_HTTP
+
+CONF_STREAMING = "streaming"
+
+DEFAULT_STREAMING = True
+
+CONF_CACHE_SIZE = "cache_size"
+CONF_CACHE_TTL = "cache_ttl"
+
+DEFAULT_CACHE_SIZE = 8  # MiB, 0 disables the result cache
+DEFAULT_CACHE_TTL = 30  # seconds, for windows that are still open
+
+CONF_BUFFER_HOURS = "buffer_hours"
+CONF_BUFFER_MAX_EVENTS = "buffer_max_events"
+
+DEFAULT_BUFFER_HOURS = 0  # 0 disables the in-memory event buffer
+DEFAULT_BUFFER_MAX_EVENTS = 50000
+
+CONF_ARCHIVE_DAYS = "archive_days"
+
+DEFAULT_ARCHIVE_DAYS = 0  # 0 disables the local event archive
+
+CONF_ACTIVITY_PRUNING = "activity_pruning"
+
+DEFAULT_ACTIVITY_PRUNING = True
+
+CONF_SHARD_HOURS = "shard_hours"
+
+DEFAULT_SHARD_HOURS = 24  # 0 fetches long ranges with a single request
+
+CONF_TRACE_HISTORY = "trace_history"
+
+DEFAULT_TRACE_HISTORY = 50  # queries kept for the p50/p95 sensors and diagnostics
+
+CONF_STORE_LAST_RESULT = "store_last_result"
+
+DEFAULT_STORE_LAST_RESULT = False  # the result is returned as a service response instead
@@ -0,0 +1,31 @@
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {"ha_token"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry):
+    """Return options, component statistics and the traces of the last queries."""
+    runtime = hass.data.get(DOMAIN, {}).get(entry.entry_id, {})
+    metrics = runtime.get("metrics")
+    client = runtime.get("client")
+    websocket = runtime.get("websocket")
+    cache = runtime.get("cache")
+    planner = runtime.get("planner")
+    archive = runtime.get("archive")
+    activity = runtime.get("activity")
+    return {
+        "data": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": async_redact_data(dict(entry.options), TO_REDACT),
+        "metrics": metrics.stats if metrics else None,
+        "client": dict(client.stats) if client else None,
+        "websocket": dict(websocket.stats) if websocket else None,
+        "cache": cache.stats if cache else None,
+        "planner": planner.stats if planner else None,
+        "archive": dict(archive.stats) if archive else None,
+        "activity": activity.stats if activity else None,
+        "traces": [trace.as_dict() for trace in metrics.traces] if metrics else [],
+    }
@@ -5,6 +5,12 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.intent import IntentHandler, IntentResponse
 from homeassistant.helpers.template import Template
 from homeassistant.util.dt import parse_datetime
+import logging
+
+from .const import DOMAIN
+from .logbook_processor.query import run_log_query
+
+_LOGGER = logging.getLogger(__name__)
 
 
 INTENT_TYPE = "LBEQueryLogbook"
@@ -26,6 +32,7 @@ class LBEQueryLogbookHandler(IntentHandler):
         domain = slots.get("domain", {}).get("value", "")
         device_class = slots.get("device_class", {}).get("value", "")
         state = slots.get("state", {}).get("value", "")
+        question_type = slots.get("question_type", {}).get("value", "") or "custom_query"
 
         # Lekérdezés szöveg dinamikusan
         if start_time and end_time:
@@ -39,30 +46,32 @@ class LBEQueryLogbookHandler(IntentHandler):
         else:
             query = f"What happened in the {time_period}?"
 
-        # Szolgáltatás meghívása
-        await hass.services.async_call(
-            "logbook_expose",
-            "log_query",
-            {
-                "question": query,
-                "question_type": "custom_query",
-                "time_period": time_period,
-                "start_time": start_time,
-                "end_time": end_time,
-                "area": area,
-                "entity": entity,
-                "domain": domain,
-                "device_class": device_class,
-                "state": state,
-            },
-            blocking=True,
-        )
-
-        # Válasz összeállítása
-        log_result = hass.states.get("logbook_expose.last_result")
-        if log_result and "logbook" in log_result.attributes:
-            log_output = log_result.attributes["logbook"]
+        # Lekérdezés közvetlenül a motoron keresztül, szolgáltatáshívás és állapot-attribútum nélkül
+        log_output = None
+        runtime = next(iter(hass.data.get(DOMAIN, {}).values()), None)
+        if runtime is None:
+            _LOGGER.warning("No logbook_expose config entry is loaded, cannot answer %s", query)
         else:
+            try:
+                log_output = await run_log_query(
+                    hass,
+                    runtime["entry"].data.get("ha_token"),
+                    query,
+                    question_type,
+                    area,
+                    time_period,
+                    entity,
+                    domain,
+                    device_class,
+                    state,
+                    runtime["entry"].options.get("char_limit", 262144),
+                    start_time,
+                    end_time,
+                    runtime=runtime,
+                )
+            except Exception as e:
+                _LOGGER.error("Error running log_query logic: %s", e)
+        if not log_output:
             log_output = "no events found."
 
         response = intent_obj.create_response()
@@ -0,0 +1,99 @@
+import logging
+import time
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+ACTIVITY_HOURS = 168  # hours of activity kept per entity
+HOUR = 3600
+
+
+class ActivityIndex:
+    """Hourly activity bitmap of every entity, kept current from state_changed events.
+
+    Bit h of an entity's bitmap is set if its state changed in hour h since the
+    origin hour. Together with the last_changed of the current state this tells
+    which candidates cannot have a logbook entry in a window, so they are not
+    fetched at all. Every entity is tracked, not only the exposed ones, so an
+    entity exposed later still has a complete bitmap.
+    """
+
+    def __init__(self, hass, hours=ACTIVITY_HOURS):
+        self.hass = hass
+        self.hours = hours
+        self._bitmaps = {}  # entity_id -> int
+        self._since = {}  # entity_id -> time from which its state changes are observed
+        self._origin = None  # epoch hour of bit 0
+        self._started_at = None
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        self._started_at = time.time()
+        self._origin = int(self._started_at // HOUR)
+        # Entities that already have a state are observed from now on, later ones from their first event
+        self._since = dict.fromkeys(self.hass.states.async_entity_ids(), self._started_at)
+        self._unsub = self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._async_state_changed)
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+        self._bitmaps.clear()
+        self._since.clear()
+
+    @callback
+    def _async_state_changed(self, event):
+        entity_id = event.data.get("entity_id")
+        new_state = event.data.get("new_state")
+        if entity_id not in self._since:
+            self._since[entity_id] = new_state.last_changed.timestamp() if new_state is not None else time.time()
+        old_state = event.data.get("old_state")
+        # Same rule as the logbook: only real state changes
+        if new_state is None or old_state is None or new_state.state == old_state.state:
+            return
+        hour = int(new_state.last_changed.timestamp() // HOUR)
+        if hour - self._origin >= 2 * self.hours:
+            self._rebase(hour - self.hours)
+        offset = hour - self._origin
+        if offset >= 0:
+            self._bitmaps[entity_id] = self._bitmaps.get(entity_id, 0) | (1 << offset)
+
+    def _rebase(self, origin):
+        # Drop the bits before the new origin hour; amortized over self.hours hours of events
+        shift = origin - self._origin
+        bitmaps = {}
+        for entity_id, bits in self._bitmaps.items():
+            bits >>= shift
+            if bits:
+                bitmaps[entity_id] = bits
+        self._bitmaps = bitmaps
+        self._origin = origin
+
+    def idle(self, entity_id, start_ts, end_ts):
+        """True if the entity's state certainly did not change between start_ts and end_ts.
+
+        Windows the index has not observed the entity for in full are never idle.
+        """
+        since = self._since.get(entity_id)
+        if since is None or start_ts < since:
+            return False
+        first = int(start_ts // HOUR) - self._origin
+        if first < 0:
+            return False
+        last = int(end_ts // HOUR) - self._origin
+        mask = ((1 << (last - first + 1)) - 1) << first
+        return not self._bitmaps.get(entity_id, 0) & mask
+
+    @property
+    def stats(self):
+        return {
+            "entities": len(self._since),
+            "active_entities": len(self._bitmaps),
+            "started_at": self._started_at,
+            "hours": self.hours,
+        }
+
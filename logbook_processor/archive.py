@@ -0,0 +1,335 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+
+from .recorder import query_recorder_states
+from .records import LogbookEvent, is_continuous
+
+_LOGGER = logging.getLogger(__name__)
+
+# Day file layout, all numbers little-endian:
+#   MAGIC
+#   header length (uint32)
+#   header (JSON): day start, row count, entity and state tables, the first row of
+#                  every hour and the type and offset of every column
+#   padding to a multiple of 8 bytes
+#   ts column:     uint32 milliseconds since the start of the day, in time order
+#   entity column: uint16/uint32 index into the entity table
+#   state column:  uint16/uint32 index into the state table
+MAGIC = b"LBEARCH1"
+HEADER_LENGTH = struct.Struct("<I")
+SUFFIX = ".lba"
+VERSION = 1
+
+DAY = 86400  # days are UTC days, so every file holds exactly 24 hours
+COMPACT_INTERVAL = timedelta(hours=1)
+STARTUP_DELAY = 120  # seconds; the recorder and the entity index are ready by then
+# A day is sealed this long after the recorder's commit interval has passed its end, so
+# the state changes of its last seconds are in the database even if the recorder lags
+SEAL_MARGIN = 900
+
+
+def day_path(directory, day_start):
+    return os.path.join(directory, datetime.fromtimestamp(day_start, timezone.utc).strftime("%Y-%m-%d") + SUFFIX)
+
+
+def list_days(directory):
+    """Start timestamps of the days archived in directory."""
+    days = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return days
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        try:
+            day = datetime.strptime(name[:-len(SUFFIX)], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        days.append(int(day.timestamp()))
+    return sorted(days)
+
+
+def _pad(length):
+    return -length % 8
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _codes(values, table):
+    # Smallest column type that holds every index into the table
+    return array("H" if len(table) <= 0x10000 else "I", values)
+
+
+def write_day_file(path, day_start, records):
+    """Write the time-ordered records of one day as a columnar file.
+
+    The file is written next to its final name and renamed, so readers never see
+    a partial file. Day files are never changed once written.
+    """
+    entities = {}
+    states = {}
+    offsets = array("I", (int((record.ts - day_start) * 1000) for record in records))
+    entity_codes = [entities.setdefault(record.entity_id, len(entities)) for record in records]
+    state_codes = [states.setdefault(record.state, len(states)) for record in records]
+    columns = (
+        ("ts", offsets),
+        ("entity", _codes(entity_codes, entities)),
+        ("state", _codes(state_codes, states)),
+    )
+    layout = {}
+    blobs = []
+    position = 0
+    for name, values in columns:
+        blob = _little_endian(values).tobytes()
+        blob += b"\0" * _pad(len(blob))
+        layout[name] = [values.typecode, position]
+        blobs.append(blob)
+        position += len(blob)
+    header = json.dumps({
+        "version": VERSION,
+        "start": day_start,
+        "count": len(records),
+        "entities": list(entities),
+        "states": list(states),
+        # hours[h] is the first row at or after hour h; hours[24] is the row count
+        "hours": [bisect_left(offsets, hour * 3600000) for hour in range(24)] + [len(records)],
+        "columns": layout,
+    }, separators=(",", ":")).encode()
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(HEADER_LENGTH.pack(len(header)))
+        file.write(header)
+        file.write(b"\0" * _pad(len(MAGIC) + HEADER_LENGTH.size + len(header)))
+        for blob in blobs:
+            file.write(blob)
+    os.replace(temp_path, path)
+
+
+def _read_header(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a logbook archive file")
+    (length,) = HEADER_LENGTH.unpack_from(data, len(MAGIC))
+    header_end = len(MAGIC) + HEADER_LENGTH.size + length
+    header = json.loads(data[len(MAGIC) + HEADER_LENGTH.size:header_end])
+    return header, header_end + _pad(header_end)
+
+
+def _column(data, data_start, column, first, last):
+    # Only the pages of the requested rows are read from the mapping
+    typecode, offset = column
+    values = array(typecode)
+    start = data_start + offset
+    values.frombytes(data[start + first * values.itemsize:start + last * values.itemsize])
+    return _little_endian(values)
+
+
+def read_day_file(path, names, start_ts, end_ts, records):
+    """Append the records of the candidates in names between start_ts and end_ts to records."""
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header, data_start = _read_header(data)
+        codes = {code: entity_id for code, entity_id in enumerate(header["entities"]) if entity_id in names}
+        if not codes:
+            return
+        # The hour index narrows the rows down to the hours overlapping the window
+        day_start = header["start"]
+        hours = header["hours"]
+        first = hours[min(24, max(0, int((start_ts - day_start) // 3600)))]
+        last = hours[min(24, max(0, math.ceil((end_ts - day_start) / 3600)))]
+        if first >= last:
+            return
+        columns = header["columns"]
+        offsets = _column(data, data_start, columns["ts"], first, last)
+        entity_codes = _column(data, data_start, columns["entity"], first, last)
+        state_codes = _column(data, data_start, columns["state"], first, last)
+
+    states = header["states"]
+    for offset, entity_code, state_code in zip(offsets, entity_codes, state_codes):
+        entity_id = codes.get(entity_code)
+        if entity_id is None:
+            continue
+        ts = day_start + offset / 1000
+        if start_ts <= ts < end_ts:
+            records.append(LogbookEvent(ts, entity_id, states[state_code], names[entity_id]))
+
+
+def read_archive(directory, names, start_ts, end_ts):
+    """Time-ordered records of the candidates in names between start_ts and end_ts.
+
+    Runs blocking file I/O, so it must be called from an executor thread.
+    """
+    records = []
+    day_start = int(start_ts // DAY) * DAY
+    while day_start < end_ts:
+        path = day_path(directory, day_start)
+        try:
+            read_day_file(path, names, start_ts, end_ts, records)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Cannot read archive file %s: %s", path, e)
+        day_start += DAY
+    return records
+
+
+def compact_archive(engine, directory, entity_ids, now_ts, keep_days, archive_days, seal_delay=0):
+    """Archive every completed day the recorder still holds in full and drop days older than archive_days.
+
+    A day counts as completed seal_delay seconds after its end, once the recorder has
+    committed its last state changes. Runs blocking database and file I/O, so it must
+    be called from an executor thread.
+    """
+    os.makedirs(directory, exist_ok=True)
+    today = int((now_ts - seal_delay) // DAY) * DAY
+    oldest = int(now_ts // DAY) * DAY - archive_days * DAY
+    # The recorder purges up to keep_days back, so only later days are complete
+    first = max(oldest, math.ceil((now_ts - keep_days * DAY) / DAY) * DAY)
+    existing = set(list_days(directory))
+    days = events = pruned = 0
+    for day_start in range(first, today, DAY):
+        if day_start in existing:
+            continue
+        records = query_recorder_states(engine, entity_ids, day_start, day_start + DAY)
+        write_day_file(day_path(directory, day_start), day_start, records)
+        days += 1
+        events += len(records)
+    for day_start in existing:
+        if day_start < oldest:
+            os.remove(day_path(directory, day_start))
+            pruned += 1
+    return days, events, pruned
+
+
+def archive_usage(directory):
+    days = list_days(directory)
+    size = sum(os.path.getsize(day_path(directory, day_start)) for day_start in days)
+    return days, size
+
+
+class EventArchive:
+    """Daily columnar files of the state changes of exposed entities.
+
+    Once a day is complete it is compacted from the recorder into one file, which
+    is never changed afterwards. The part of a query window that is older than the
+    recorder's retention is read from these files instead, so long-range questions
+    ("30 days ago") work without keeping more history in the recorder database.
+    """
+
+    def __init__(self, hass, is_exposed, directory, days=90):
+        self.hass = hass
+        self.is_exposed = is_exposed
+        self.directory = directory
+        self.days = days
+        self.keep_days = None  # retention of the recorder, read when it is available
+        self._compacting = False
+        self._unsubs = []
+        self.stats = {
+            "days": 0,
+            "first_day": None,
+            "bytes": 0,
+            "days_compacted": 0,
+            "events_compacted": 0,
+            "days_pruned": 0,
+            "last_compaction": None,
+        }
+
+    @callback
+    def async_start(self):
+        self._unsubs.append(async_track_time_interval(self.hass, self._async_schedule_compaction, COMPACT_INTERVAL))
+        self._unsubs.append(async_call_later(self.hass, STARTUP_DELAY, self._async_schedule_compaction))
+
+    @callback
+    def async_stop(self):
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+
+    @callback
+    def _async_schedule_compaction(self, now=None):
+        self.hass.async_create_background_task(self.async_compact(), "logbook_expose archive compaction")
+
+    def _recorder(self):
+        from homeassistant.components.recorder import get_instance
+
+        instance = get_instance(self.hass)
+        self.keep_days = instance.keep_days
+        return instance
+
+    def _archived_entity_ids(self):
+        # Same rules as the logbook and the event buffer: no continuous entities
+        entity_ids = []
+        for state_obj in self.hass.states.async_all():
+            if not is_continuous(state_obj) and self.is_exposed(state_obj.entity_id):
+                entity_ids.append(state_obj.entity_id)
+        return entity_ids
+
+    async def async_compact(self):
+        if self._compacting:
+            return
+        self._compacting = True
+        try:
+            instance = self._recorder()
+            days, events, pruned = await instance.async_add_executor_job(
+                compact_archive, instance.engine, self.directory, self._archived_entity_ids(),
+                time.time(), self.keep_days, self.days, instance.commit_interval + SEAL_MARGIN
+            )
+            archived, size = await self.hass.async_add_executor_job(archive_usage, self.directory)
+        except Exception as e:
+            _LOGGER.error("Exception during archive compaction: %s", e)
+            return
+        finally:
+            self._compacting = False
+        self.stats.update({
+            "days": len(archived),
+            "first_day": datetime.fromtimestamp(archived[0], timezone.utc).date().isoformat() if archived else None,
+            "bytes": size,
+            "last_compaction": datetime.now(timezone.utc).isoformat(),
+        })
+        self.stats["days_compacted"] += days
+        self.stats["events_compacted"] += events
+        self.stats["days_pruned"] += pruned
+        if days or pruned:
+            _LOGGER.debug("Archived %d days (%d events), pruned %d days. Archive stats: %s", days, events, pruned, self.stats)
+
+    def cutoff(self, start_dt, end_dt, now):
+        """End of the part of a window older than the recorder's retention, or None if there is none."""
+        if self.keep_days is None:
+            try:
+                self._recorder()
+            except Exception:
+                return None
+        recorder_start = now - timedelta(days=self.keep_days)
+        if start_dt >= recorder_start:
+            return None
+        return min(end_dt, recorder_start)
+
+    async def async_entries(self, candidate_entities, start_dt, end_dt):
+        """Return the archived records of the candidates between start_dt and end_dt, in time order."""
+        # The archive has no friendly names, take them from the current states
+        names = {
+            state_obj.entity_id: state_obj.attributes.get("friendly_name")
+            for state_obj in candidate_entities
+        }
+        records = await self.hass.async_add_executor_job(
+            read_archive, self.directory, names, start_dt.timestamp(), end_dt.timestamp()
+        )
+        _LOGGER.debug("Archive returned %d entries", len(records))
+        return records
@@ -0,0 +1,45 @@
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.area_registry import EVENT_AREA_REGISTRY_UPDATED
+
+from .query import build_area_lookup, fetch_area_mappings, lookup_area_ids
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AreaResolver:
+    """Area name/alias lookup table that is rebuilt only when the area registry changes."""
+
+    def __init__(self, hass):
+        self.hass = hass
+        self._area_name_to_id = None
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        self._unsub = self.hass.bus.async_listen(EVENT_AREA_REGISTRY_UPDATED, self._async_area_registry_updated)
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_area_registry_updated(self, event):
+        _LOGGER.debug("Area registry updated (%s), invalidating area lookup table", event.data.get("action"))
+        self._area_name_to_id = None
+
+    @property
+    def area_name_to_id(self):
+        if self._area_name_to_id is None:
+            self._area_name_to_id = build_area_lookup(fetch_area_mappings(self.hass))
+            _LOGGER.debug("Built area lookup table with %d names and aliases", len(self._area_name_to_id))
+        return self._area_name_to_id
+
+    def resolve(self, area_name_or_alias):
+        """Resolve a comma-separated list of area names or aliases to a set of area ids."""
+        if not area_name_or_alias:
+            return set()
+        return lookup_area_ids(self.area_name_to_id, area_name_or_alias)
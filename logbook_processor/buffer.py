@@ -0,0 +1,94 @@
+from collections import deque
+import logging
+import sys
+import time
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import callback
+
+from .records import LogbookEvent, is_continuous
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    """Ring buffer of recent state changes of exposed entities.
+
+    Short windows ("last 5 minutes") that lie completely inside the buffered
+    period are answered from memory instead of a logbook API round trip.
+    """
+
+    def __init__(self, hass, is_exposed, hours=1, max_events=50000):
+        self.hass = hass
+        self.is_exposed = is_exposed
+        self.horizon = hours * 3600
+        # (timestamp, entity_id, state) tuples in time order; maxlen bounds the memory
+        self._events = deque(maxlen=max_events)
+        self._started_at = None
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        self._started_at = time.time()
+        self._unsub = self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._async_state_changed)
+
+    @callback
+    def async_stop(self):
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+        self._events.clear()
+
+    @callback
+    def _async_state_changed(self, event):
+        new_state = event.data.get("new_state")
+        old_state = event.data.get("old_state")
+        # Same rules as the logbook: only real state changes of non-continuous entities
+        if new_state is None or old_state is None or new_state.state == old_state.state:
+            return
+        entity_id = event.data.get("entity_id")
+        if not self.is_exposed(entity_id):
+            return
+        if is_continuous(new_state):
+            return
+
+        ts = new_state.last_changed.timestamp()
+        events = self._events
+        events.append((ts, sys.intern(entity_id), sys.intern(new_state.state)))
+        horizon = ts - self.horizon
+        while events and events[0][0] < horizon:
+            events.popleft()
+
+    @property
+    def coverage_start(self):
+        """Earliest time from which every state change is guaranteed to be buffered."""
+        if self._started_at is None:
+            return None
+        coverage = max(self._started_at, time.time() - self.horizon)
+        if len(self._events) == self._events.maxlen:
+            # Events have been pushed out by maxlen, not by age
+            coverage = max(coverage, self._events[0][0])
+        return coverage
+
+    def covers(self, start_dt, end_dt):
+        coverage = self.coverage_start
+        return coverage is not None and start_dt.timestamp() >= coverage and end_dt.timestamp() <= time.time()
+
+    def entries(self, candidate_entities, start_dt, end_dt):
+        """Return records of the candidates between start_dt and end_dt, in time order."""
+        names = {
+            state_obj.entity_id: state_obj.attributes.get("friendly_name")
+            for state_obj in candidate_entities
+        }
+        start_ts = start_dt.timestamp()
+        end_ts = end_dt.timestamp()
+        matched = []
+        # Short windows sit at the end of the buffer, so walk it backwards
+        for ts, entity_id, state in reversed(self._events):
+            if ts < start_ts:
+                break
+            if ts >= end_ts or entity_id not in names:
+                continue
+            matched.append(LogbookEvent(ts, entity_id, state, names[entity_id]))
+        matched.reverse()
+        return matched
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import logging
+import sys
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """LRU cache of formatted query results, bounded by the memory size of the results.
+
+    Results of windows that are fully in the past never change and stay until they
+    are evicted. Results of open windows ("today", "last 5 minutes") expire after
+    open_ttl seconds.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, open_ttl=30):
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self._entries = OrderedDict()  # key -> (result, size, expires_at or None)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(candidate_ids, start_dt, end_dt, time_period, closed, *extra):
+        if closed or not time_period:
+            window = (start_dt.timestamp(), end_dt.timestamp())
+        else:
+            # Relative windows move with "now", so they are keyed on the period name.
+            # The start date keeps "today" from leaking across midnight.
+            window = ("open", time_period, start_dt.date())
+        return (frozenset(candidate_ids), window) + tuple(extra)
+
+    def get(self, key):
+        cached = self._entries.get(key)
+        if cached is not None:
+            result, size, expires_at = cached
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, result, closed):
+        size = sys.getsizeof(result)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires_at = None if closed else time.monotonic() + self.open_ttl
+        self._entries[key] = (result, size, expires_at)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    @property
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,137 @@
+import codecs
+import json
+import logging
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LogbookClient:
+    """Keep-alive HTTP session shared by all logbook API requests of a config entry."""
+
+    def __init__(self, connection_limit=10, request_timeout=30, connect_timeout=10):
+        self.connection_limit = connection_limit
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self._session = None
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "bytes_received": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+        }
+
+    def _build_trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats["requests"] += 1
+
+        async def on_request_exception(session, ctx, params):
+            self.stats["errors"] += 1
+
+        async def on_response_chunk_received(session, ctx, params):
+            # Fired once with the whole body when a response is read at once
+            self.stats["bytes_received"] += len(params.chunk)
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_response_chunk_received.append(on_response_chunk_received)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    @property
+    def session(self):
+        # The session is created lazily so it always binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout, connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                trace_configs=[self._build_trace_config()],
+            )
+            _LOGGER.debug("Created logbook HTTP session (limit=%d, timeout=%ss)", self.connection_limit, self.request_timeout)
+        return self._session
+
+    async def count_bytes(self, chunks):
+        # Streamed bodies bypass the chunk trace, so their size is counted here
+        async for chunk in chunks:
+            self.stats["bytes_received"] += len(chunk)
+            yield chunk
+
+    async def async_close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        _LOGGER.debug("Closed logbook HTTP session. Stats: %s", self.stats)
+
+
+async def iter_json_array(chunks):
+    """Yield the items of a top-level JSON array from an async iterator of byte chunks.
+
+    Only the item currently being decoded is kept in memory, so the size of the
+    whole response does not matter.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+    finished = False
+    eof = False
+
+    chunk_iter = chunks.__aiter__()
+    while not finished:
+        if not eof:
+            try:
+                chunk = await chunk_iter.__anext__()
+                buffer = buffer[pos:] + utf8.decode(chunk)
+            except StopAsyncIteration:
+                buffer = buffer[pos:] + utf8.decode(b"", final=True)
+                eof = True
+            pos = 0
+
+        while True:
+            # Skip whitespace and item separators
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Logbook response is not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break  # Incomplete item, wait for more data
+            # The item is complete only once the next separator is visible,
+            # otherwise a number like "2." could still continue in the next chunk
+            look = end
+            while look < len(buffer) and buffer[look] in " \t\r\n":
+                look += 1
+            if look >= len(buffer) or buffer[look] not in ",]":
+                if eof:
+                    raise ValueError("Malformed JSON array in logbook response")
+                break
+            pos = end
+            yield item
+
+        if eof and not finished:
+            raise ValueError("Logbook response ended before the JSON array was closed")
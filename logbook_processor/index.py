@@ -0,0 +1,219 @@
+from collections import defaultdict
+import itertools
+import logging
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import callback
+from homeassistant.helpers.area_registry import EVENT_AREA_REGISTRY_UPDATED
+from homeassistant.helpers.device_registry import EVENT_DEVICE_REGISTRY_UPDATED
+from homeassistant.helpers.entity_registry import EVENT_ENTITY_REGISTRY_UPDATED
+
+from .query import normalize_text
+
+_LOGGER = logging.getLogger(__name__)
+
+# Entities that are never returned as candidates
+EXCLUDED_ENTITIES = {"sensor.date_time"}
+
+
+class EntityIndex:
+    """In-memory index of exposed entities used for candidate selection.
+
+    Built once from the registries and kept current from registry and
+    state_changed events, so a query only intersects a few sets instead of
+    scanning the whole entity registry.
+    """
+
+    def __init__(self, hass):
+        self.hass = hass
+        self.by_domain = defaultdict(set)
+        self.by_device_class = defaultdict(set)
+        self.by_area = defaultdict(set)
+        self.by_name = defaultdict(set)
+        self.device_entities = defaultdict(set)
+        # entity_id -> (domain, device_classes, area_id, names, device_id, friendly_name) of every exposed entity
+        self._keys = {}
+        # Registry order, so candidates come back in the same order as a registry scan
+        self._order = {}
+        self._counter = itertools.count()
+        self._unsubs = []
+
+    # --- Building ---
+    @callback
+    def async_build(self):
+        for index in (self.by_domain, self.by_device_class, self.by_area, self.by_name, self.device_entities):
+            index.clear()
+        self._keys.clear()
+        self._order.clear()
+        entity_registry = self.hass.data.get("entity_registry")
+        if not entity_registry:
+            _LOGGER.warning("Entity registry not available, entity index is empty")
+            return
+        for ent in entity_registry.entities.values():
+            self._index_entity(ent.entity_id)
+        _LOGGER.debug("Entity index built with %d exposed entities", len(self._keys))
+
+    def _index_entity(self, entity_id):
+        self._remove_entity(entity_id)
+        if entity_id in EXCLUDED_ENTITIES:
+            return
+        entity_registry = self.hass.data.get("entity_registry")
+        ent = entity_registry.entities.get(entity_id) if entity_registry else None
+        if ent and entity_id not in self._order:
+            # Unexposed entities get their place too, in case they are exposed later
+            self._order[entity_id] = next(self._counter)
+        if not ent or not ent.options.get("conversation", {}).get("should_expose", False):
+            return
+
+        domain = entity_id.split(".", 1)[0]
+        state_obj = self.hass.states.get(entity_id)
+        attributes = state_obj.attributes if state_obj else {}
+        device_classes = _as_tuple(attributes.get("device_class"))
+
+        area_id = ent.area_id
+        device_reg = self.hass.data.get("device_registry")
+        if not area_id and device_reg and ent.device_id in device_reg.devices:
+            area_id = device_reg.devices[ent.device_id].area_id
+
+        names = {normalize_text(entity_id)}
+        friendly_name = attributes.get("friendly_name", "")
+        names.add(normalize_text(friendly_name))
+        names.update(normalize_text(alias) for alias in ent.options.get("aliases", []))
+        names.discard("")
+
+        self.by_domain[domain].add(entity_id)
+        for device_class in device_classes:
+            self.by_device_class[device_class].add(entity_id)
+        if area_id:
+            self.by_area[area_id].add(entity_id)
+        for name in names:
+            self.by_name[name].add(entity_id)
+        if ent.device_id:
+            self.device_entities[ent.device_id].add(entity_id)
+
+        self._keys[entity_id] = (domain, device_classes, area_id, tuple(names), ent.device_id, friendly_name)
+
+    def _remove_entity(self, entity_id):
+        keys = self._keys.pop(entity_id, None)
+        if keys is None:
+            return
+        domain, device_classes, area_id, names, device_id, _ = keys
+        _discard(self.by_domain, domain, entity_id)
+        for device_class in device_classes:
+            _discard(self.by_device_class, device_class, entity_id)
+        if area_id:
+            _discard(self.by_area, area_id, entity_id)
+        for name in names:
+            _discard(self.by_name, name, entity_id)
+        if device_id:
+            _discard(self.device_entities, device_id, entity_id)
+
+    # --- Event handling ---
+    @callback
+    def async_start(self):
+        self.async_build()
+        bus = self.hass.bus
+        self._unsubs = [
+            bus.async_listen(EVENT_ENTITY_REGISTRY_UPDATED, self._async_entity_registry_updated),
+            bus.async_listen(EVENT_DEVICE_REGISTRY_UPDATED, self._async_device_registry_updated),
+            bus.async_listen(EVENT_AREA_REGISTRY_UPDATED, self._async_area_registry_updated),
+            bus.async_listen(EVENT_STATE_CHANGED, self._async_state_changed),
+        ]
+
+    @callback
+    def async_stop(self):
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    @callback
+    def _async_entity_registry_updated(self, event):
+        entity_id = event.data.get("entity_id")
+        old_entity_id = event.data.get("old_entity_id")
+        if old_entity_id:
+            self._remove_entity(old_entity_id)
+            self._order.pop(old_entity_id, None)
+        if event.data.get("action") == "remove":
+            self._remove_entity(entity_id)
+            self._order.pop(entity_id, None)
+        elif entity_id:
+            self._index_entity(entity_id)
+
+    @callback
+    def _async_device_registry_updated(self, event):
+        # Entities without an own area inherit the area of their device
+        for entity_id in list(self.device_entities.get(event.data.get("device_id"), ())):
+            self._index_entity(entity_id)
+
+    @callback
+    def _async_area_registry_updated(self, event):
+        if event.data.get("action") != "remove":
+            return
+        for entity_id in list(self.by_area.get(event.data.get("area_id"), ())):
+            self._index_entity(entity_id)
+
+    @callback
+    def _async_state_changed(self, event):
+        entity_id = event.data.get("entity_id")
+        keys = self._keys.get(entity_id)
+        new_state = event.data.get("new_state")
+        if keys is None or new_state is None:
+            return
+        # Only device_class and friendly_name come from the state, everything else is registry data
+        attributes = new_state.attributes
+        if _as_tuple(attributes.get("device_class")) != keys[1] or attributes.get("friendly_name", "") != keys[5]:
+            self._index_entity(entity_id)
+
+    # --- Lookup ---
+    def is_exposed(self, entity_id):
+        return entity_id in self._keys
+
+    def candidates(self, entity_name_or_id=None, domain=None, device_classes=None, area_ids=None):
+        selections = []
+        if entity_name_or_id:
+            selections.append(self.by_name.get(normalize_text(entity_name_or_id), set()))
+        if domain:
+            domains = [domain] if isinstance(domain, str) else domain
+            selections.append(_union(self.by_domain, domains))
+        if device_classes:
+            classes = [device_classes] if isinstance(device_classes, str) else device_classes
+            selections.append(_union(self.by_device_class, classes))
+        if area_ids:
+            selections.append(_union(self.by_area, area_ids))
+
+        if selections:
+            selections.sort(key=len)
+            entity_ids = set(selections[0]).intersection(*selections[1:])
+        else:
+            entity_ids = set(self._keys)
+
+        candidate_entities = []
+        for entity_id in sorted(entity_ids, key=self._order.get):
+            state_obj = self.hass.states.get(entity_id)
+            if state_obj:
+                candidate_entities.append(state_obj)
+        _LOGGER.debug("Entity index selected %d of %d exposed entities", len(candidate_entities), len(self._keys))
+        return candidate_entities
+
+
+def _as_tuple(value):
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, list):
+        return tuple(value)
+    return ()
+
+
+def _union(index, keys):
+    result = set()
+    for key in keys:
+        result |= index.get(key, set())
+    return result
+
+
+def _discard(index, key, entity_id):
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.discard(entity_id)
+        if not bucket:
+            del index[key]
@@ -0,0 +1,149 @@
+from collections import deque
+from datetime import datetime, timezone
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pipeline stages in execution order
+STAGES = ("resolve", "cache", "fetch", "filter", "congestion", "enrich", "format")
+
+
+class QueryTrace:
+    """Stage timings and volumes of one log query."""
+
+    def __init__(self, question=None, question_type=None):
+        self.started = datetime.now(timezone.utc)
+        self.question = question
+        self.question_type = question_type
+        self.source = None  # cache, buffer, archive, recorder, websocket or http
+        self.stages = {}  # stage -> seconds
+        self.counters = {}
+        self.truncated = None  # char_limit or max_events
+        self.plan = None  # QueryPlan of the retrieval
+        self.error = False
+        self.total = None
+        self._start = time.perf_counter()
+        self._lap_start = self._start
+        # Time accounted to lazy stages; nested stages and laps subtract it from their own time
+        self._timed = 0.0
+        self._lap_timed = 0.0
+
+    def lap(self, name):
+        # Charge the time since the previous lap to a stage, minus what lazy stages took meanwhile
+        now = time.perf_counter()
+        self.add_time(name, now - self._lap_start - (self._timed - self._lap_timed))
+        self._lap_start = now
+        self._lap_timed = self._timed
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timed(self, name, iterable):
+        # Time spent producing the items of a lazy stage, without the lazy stages it pulls from
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            inner = self._timed
+            try:
+                item = next(iterator)
+            except StopIteration:
+                item = StopIteration
+            own = time.perf_counter() - start - (self._timed - inner)
+            self.add_time(name, own)
+            self._timed += own
+            if item is StopIteration:
+                return
+            yield item
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, result):
+        self.total = time.perf_counter() - self._start
+        self.error = result is None
+        if isinstance(result, str):
+            self.counters["result_chars"] = len(result)
+
+    def as_dict(self):
+        return {
+            "started": self.started.isoformat(),
+            "question": self.question,
+            "question_type": self.question_type,
+            "source": self.source,
+            "total_ms": round(self.total * 1000, 2) if self.total is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "truncated": self.truncated,
+            "error": self.error,
+            "plan": self.plan.as_dict() if self.plan else None,
+        }
+
+
+class QueryMetrics:
+    """The last traces of a config entry with rolling p50/p95 statistics."""
+
+    def __init__(self, history=50):
+        self.traces = deque(maxlen=history)
+        self.queries = 0
+        self._listeners = []
+
+    def record(self, trace):
+        self.traces.append(trace)
+        self.queries += 1
+        _LOGGER.debug("Log query trace: %s", trace.as_dict())
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+        def remove_listener():
+            self._listeners.remove(listener)
+        return remove_listener
+
+    def values(self, metric):
+        # "total", a stage name or a counter name
+        values = []
+        for trace in self.traces:
+            if metric == "total":
+                value = trace.total
+            elif metric in STAGES:
+                value = trace.stages.get(metric)
+            else:
+                value = trace.counters.get(metric)
+            if value is not None:
+                values.append(value)
+        return values
+
+    def percentile(self, metric, percent):
+        return percentile(self.values(metric), percent)
+
+    @property
+    def stats(self):
+        return {
+            "queries": self.queries,
+            "window": len(self.traces),
+            "total_ms": _percentiles_ms(self.values("total")),
+            "stages_ms": {stage: _percentiles_ms(self.values(stage)) for stage in STAGES if self.values(stage)},
+            "truncated": sum(1 for trace in self.traces if trace.truncated),
+            "errors": sum(1 for trace in self.traces if trace.error),
+        }
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile; None without values
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def _percentiles_ms(values):
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+    }
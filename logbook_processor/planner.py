@@ -0,0 +1,149 @@
+from collections import deque
+import logging
+import math
+
+_LOGGER = logging.getLogger(__name__)
+
+STRATEGY_CACHE = "cache"
+STRATEGY_BUFFER = "buffer"
+STRATEGY_RECORDER = "recorder"
+STRATEGY_ARCHIVE = "archive"
+STRATEGY_IDLE = "idle"
+STRATEGY_PER_ENTITY = "per_entity"
+STRATEGY_BATCHED = "batched"
+STRATEGY_FULL = "full"
+
+# Cost model in milliseconds. The estimated and actual costs of every plan are
+# logged and kept in the traces, so these can be tuned from real data.
+REQUEST_COST_MS = 10.0  # fixed cost of one HTTP request
+WEBSOCKET_REQUEST_COST_MS = 1.0  # fixed cost of one command on the open websocket
+SERVER_ENTRY_COST_MS = 0.004  # reading and serializing one entry; parallel requests share it
+LOCAL_ENTRY_COST_MS = 0.004  # decoding and filtering one entry on the event loop
+
+DEFAULT_ENTITY_RATE = 4.0  # events per hour assumed for an entity without history
+RATE_SMOOTHING = 0.3  # weight of the newest observation in the learned rates
+
+
+class QueryPlan:
+    """The retrieval strategy chosen for a query, with its estimated and actual cost."""
+
+    def __init__(self, strategy, shards=1, transport="http", requests=0, entries=0, cost_ms=0.0):
+        self.strategy = strategy
+        self.shards = shards
+        self.transport = transport
+        self.requests = requests
+        self.entries = entries
+        self.cost_ms = cost_ms
+        self.alternatives = {}  # rejected plan name -> estimated cost in ms
+        self.actual = None
+
+    @property
+    def name(self):
+        return f"{self.strategy}+sharded" if self.shards > 1 else self.strategy
+
+    def record_actual(self, requests, entries, seconds):
+        self.actual = {"requests": requests, "entries": entries, "cost_ms": round(seconds * 1000, 2)}
+
+    def as_dict(self):
+        return {
+            "strategy": self.strategy,
+            "shards": self.shards,
+            "transport": self.transport,
+            "estimated": {"requests": self.requests, "entries": round(self.entries), "cost_ms": round(self.cost_ms, 2)},
+            "actual": self.actual,
+            "alternatives": {name: round(cost, 2) for name, cost in self.alternatives.items()},
+        }
+
+    def __str__(self):
+        text = f"{self.name} over {self.transport}: estimated {self.requests} requests, {self.entries:.0f} entries, {self.cost_ms:.1f} ms"
+        if self.actual:
+            text += f"; actual {self.actual['requests']} requests, {self.actual['entries']} entries, {self.actual['cost_ms']:.1f} ms"
+        return text
+
+
+class QueryPlanner:
+    """Chooses the cheapest retrieval strategy from candidate count, window length and learned event rates."""
+
+    def __init__(self, history=50):
+        self.rates = {}  # entity_id -> events per hour
+        self.house_rate = None  # events per hour of all entities, learned from full fetches
+        self.plans = deque(maxlen=history)
+
+    def entity_rate(self, entity_id):
+        return self.rates.get(entity_id, DEFAULT_ENTITY_RATE)
+
+    def plan(self, candidate_ids, hours, total_entities, per_entity_limit, batch_count, shard_count, concurrency, transport="http"):
+        """Plan the fetch of a window.
+
+        per_entity_limit and batch_count are the options' caps: per-entity requests are
+        allowed below per_entity_limit candidates and batch_count is None when batching
+        is not allowed. shard_count is the number of shards the window splits into.
+        """
+        candidate_entries = sum(self.entity_rate(entity_id) for entity_id in candidate_ids) * hours
+        house_rate = self.house_rate or DEFAULT_ENTITY_RATE * max(total_entities, len(candidate_ids))
+        full_entries = max(house_rate * hours, candidate_entries)
+
+        options = []
+        if transport == "websocket":
+            # One command per window; the entity list has no length limit
+            if batch_count is not None:
+                options.append((STRATEGY_BATCHED, 1, candidate_entries))
+        else:
+            if len(candidate_ids) < per_entity_limit:
+                options.append((STRATEGY_PER_ENTITY, len(candidate_ids), candidate_entries))
+            if batch_count is not None:
+                options.append((STRATEGY_BATCHED, batch_count, candidate_entries))
+        options.append((STRATEGY_FULL, 1, full_entries))
+
+        best = None
+        alternatives = {}
+        for strategy, requests, entries in options:
+            for shards in sorted({1, shard_count}):
+                cost = self.cost(requests * shards, entries, concurrency, transport)
+                name = f"{strategy}+sharded" if shards > 1 else strategy
+                alternatives[name] = cost
+                if best is None or cost < best.cost_ms:
+                    best = QueryPlan(strategy, shards, transport, requests * shards, entries, cost)
+        del alternatives[best.name]
+        best.alternatives = alternatives
+        return best
+
+    @staticmethod
+    def cost(requests, entries, concurrency, transport="http"):
+        # Requests run concurrency at a time; the server side of the entries spreads over the
+        # parallel requests, their decoding and filtering on the event loop does not
+        request_cost = WEBSOCKET_REQUEST_COST_MS if transport == "websocket" else REQUEST_COST_MS
+        parallel = max(1, min(concurrency, requests))
+        return (
+            math.ceil(requests / parallel) * request_cost
+            + entries * SERVER_ENTRY_COST_MS / parallel
+            + entries * LOCAL_ENTRY_COST_MS
+        )
+
+    def learn(self, plan, candidate_ids, counts, hours, candidate_entries, entries_fetched):
+        """Update the event rates from a fetched window.
+
+        counts holds the accepted records per entity; they are scaled up to the
+        candidate entries fetched, which include the unknown and repeated states.
+        """
+        self.plans.append(plan)
+        if hours <= 0:
+            return
+        accepted = sum(counts.values())
+        scale = candidate_entries / accepted if accepted else 1.0
+        for entity_id in candidate_ids:
+            observed = counts.get(entity_id, 0) * scale / hours
+            old = self.rates.get(entity_id)
+            self.rates[entity_id] = observed if old is None else old + RATE_SMOOTHING * (observed - old)
+        if plan.strategy == STRATEGY_FULL:
+            observed = entries_fetched / hours
+            old = self.house_rate
+            self.house_rate = observed if old is None else old + RATE_SMOOTHING * (observed - old)
+
+    @property
+    def stats(self):
+        return {
+            "entities_with_rates": len(self.rates),
+            "house_rate": round(self.house_rate, 1) if self.house_rate is not None else None,
+            "plans": [plan.as_dict() for plan in self.plans],
+        }
@@ -1,8 +1,54 @@
 from datetime import datetime, timedelta, timezone
 import logging
-import pytz
 import unicodedata
 import re
+import asyncio
+import heapq
+from collections import deque
+import json
+from functools import lru_cache
+from operator import attrgetter
+
+import aiohttp
+
+from ..const import (
+    BACKEND_RECORDER,
+    BACKEND_WEBSOCKET,
+    CONF_ACTIVITY_PRUNING,
+    CONF_BACKEND,
+    CONF_FETCH_CONCURRENCY,
+    CONF_MAX_PER_ENTITY_REQUESTS,
+    CONF_SHARD_HOURS,
+    CONF_STREAMING,
+    DEFAULT_ACTIVITY_PRUNING,
+    DEFAULT_BACKEND,
+    DEFAULT_FETCH_CONCURRENCY,
+    DEFAULT_MAX_PER_ENTITY_REQUESTS,
+    CONF_MAX_BATCHED_ENTITIES,
+    DEFAULT_MAX_BATCHED_ENTITIES,
+    DEFAULT_SHARD_HOURS,
+    DEFAULT_STREAMING,
+)
+from .client import iter_json_array
+from .recorder import fetch_recorder_entries
+from .metrics import QueryTrace
+from .planner import (
+    QueryPlan,
+    QueryPlanner,
+    STRATEGY_ARCHIVE,
+    STRATEGY_BATCHED,
+    STRATEGY_BUFFER,
+    STRATEGY_CACHE,
+    STRATEGY_FULL,
+    STRATEGY_IDLE,
+    STRATEGY_PER_ENTITY,
+    STRATEGY_RECORDER,
+)
+from .records import records_from_entries
+from .resolvers import EnrichmentContext
+from .summary import SUMMARY_QUESTION_TYPE, summarize_records
+from .websocket import WebsocketError
+from . import vectorized
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -11,12 +57,22 @@ LOCAL_TZ = datetime.now().astimezone().tzinfo
 
 
 # --- Utility Functions ---
+NORMALIZE_CACHE_SIZE = 4096
+
+# Names and aliases repeat across queries, so their normalized forms are memoized
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_text(text):
     if not text:
         return ""
     normalized = unicodedata.normalize('NFD', text)
     return ''.join([c for c in normalized if unicodedata.category(c) != 'Mn']).lower()
 
+def get_option(runtime, key, default):
+    # Read from the live config entry, so changed options apply to the next query
+    if runtime and runtime.get("entry"):
+        return runtime["entry"].options.get(key, default)
+    return default
+
 def calculate_time_range(time_period, now, start_time_str=None, end_time_str=None):
     time_units = {
         "minutes": lambda x: timedelta(minutes=x),
@@ -137,7 +193,7 @@ def fetch_entity_mappings(hass):
         return {}, {}
 
 # --- Area Name Resolution ---
-def resolve_area_ids(area_mappings, area_name_or_alias):
+def build_area_lookup(area_mappings):
     area_id_to_name = {}
     area_alias_to_id = {}
 
@@ -151,7 +207,9 @@ def resolve_area_ids(area_mappings, area_name_or_alias):
                 normalized_alias = normalize_text(alias)
                 area_alias_to_id[normalized_alias] = area_id
 
-    area_name_to_id = {**area_id_to_name, **area_alias_to_id}
+    return {**area_id_to_name, **area_alias_to_id}
+
+def lookup_area_ids(area_name_to_id, area_name_or_alias):
     resolved_ids = set()
 
     if area_name_or_alias:
@@ -164,51 +222,130 @@ def resolve_area_ids(area_mappings, area_name_or_alias):
             else:
                 _LOGGER.warning("Area '%s' could not be resolved to an area ID.", name)
 
-    # Log the area mappings for debugging
-    #_LOGGER.debug("Area mappings: %s", area_mappings)
-
     return resolved_ids
 
+def resolve_area_ids(area_mappings, area_name_or_alias):
+    return lookup_area_ids(build_area_lookup(area_mappings), area_name_or_alias)
+
 # --- Logbook API Call ---
-import aiohttp
+STREAM_CHUNK_SIZE = 64 * 1024
 
-async def fetch_logbook_data(hass, url, headers, params):
+class LogbookFetchError(Exception):
+    """Raised when the logbook API does not return a usable response."""
+
+async def fetch_logbook_data(hass, url, headers, params, client=None, raise_errors=False, on_error=None):
+    # With raise_errors the caller handles failures itself (e.g. to retry a single shard);
+    # otherwise on_error is told about the failure and the entries are missing
     try:
+        if client is not None:
+            # Reuse the pooled keep-alive session of the config entry
+            return await _request_logbook(client.session, url, headers, params, hass)
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                _LOGGER.debug("Logbook API response status: %s", response.status)
-                if response.status != 200:
-                    _LOGGER.error("Failed to fetch logbook data. Status: %s", response.status)
-                    return []
-                return await response.json()
+            return await _request_logbook(session, url, headers, params, hass)
+    except LogbookFetchError as e:
+        if raise_errors:
+            raise
+        _LOGGER.error("%s", e)
+        if on_error is not None:
+            on_error(e)
+        return []
     except Exception as e:
+        if raise_errors:
+            raise LogbookFetchError(f"Exception during logbook fetch: {e}") from e
         _LOGGER.error("Exception during logbook fetch: %s", e)
+        if on_error is not None:
+            on_error(e)
         return []
 
+async def _request_logbook(session, url, headers, params, hass=None):
+    async with session.get(url, headers=headers, params=params) as response:
+        _LOGGER.debug("Logbook API response status: %s", response.status)
+        if response.status != 200:
+            raise LogbookFetchError(f"Failed to fetch logbook data. Status: {response.status}")
+        body = await response.read()
+    # Large bodies are decoded in an executor thread, like the stages that follow
+    if hass is not None and len(body) >= OFFLOAD_BYTES:
+        return await hass.async_add_executor_job(json.loads, body)
+    return json.loads(body)
+
+async def stream_logbook_data(hass, url, headers, params, client=None, raise_errors=False, on_error=None):
+    # Yield entries while the response is still arriving instead of decoding it as a whole
+    session = client.session if client is not None else aiohttp.ClientSession()
+    try:
+        async with session.get(url, headers=headers, params=params) as response:
+            _LOGGER.debug("Logbook API response status: %s", response.status)
+            if response.status != 200:
+                raise LogbookFetchError(f"Failed to fetch logbook data. Status: {response.status}")
+            chunks = response.content.iter_chunked(STREAM_CHUNK_SIZE)
+            if client is not None:
+                chunks = client.count_bytes(chunks)
+            async for entry in iter_json_array(chunks):
+                yield entry
+    except LogbookFetchError as e:
+        if raise_errors:
+            raise
+        _LOGGER.error("%s", e)
+        if on_error is not None:
+            on_error(e)
+    except Exception as e:
+        if raise_errors:
+            raise LogbookFetchError(f"Exception during streamed logbook fetch: {e}") from e
+        _LOGGER.error("Exception during streamed logbook fetch: %s", e)
+        if on_error is not None:
+            on_error(e)
+    finally:
+        if client is None:
+            await session.close()
+
+async def get_websocket_entries(websocket, start_str, end_str, candidate_entities, strategy=STRATEGY_BATCHED):
+    # Time-ordered records of a window fetched over the websocket connection. Unless the
+    # strategy is a full fetch the server only returns the candidates' entries.
+    entity_ids = None
+    if candidate_entities and strategy != STRATEGY_FULL:
+        entity_ids = [state_obj.entity_id for state_obj in candidate_entities]
+    try:
+        entries = await websocket.get_events(start_str, end_str, entity_ids)
+    except WebsocketError as e:
+        raise LogbookFetchError(f"Websocket logbook fetch failed: {e}") from e
+    records = list(records_from_entries(entries or ()))
+    # Unlike the REST API the websocket entries carry no names, so the friendly names are added
+    names = {state_obj.entity_id: state_obj.attributes.get("friendly_name") for state_obj in candidate_entities}
+    for record in records:
+        if record.name is None:
+            record.name = names.get(record.entity_id)
+    records.sort(key=attrgetter("ts"))
+    return records
+
 # --- Logbook Filtering ---
-def filter_logbook_entries(entries, candidate_entities, state=None, events_per_second=1, congestion="skip"):
-    # Filter entries only for candidate entity_ids and matching state (if provided)
-    if candidate_entities is None:
-        candidate_entities = []
-    if len(candidate_entities) == 0:
-        _LOGGER.warning("No candidate entities provided for filtering.")
-        return []
+class EntryDeduplicator:
+    """Candidate, unknown-state and repeated-state filter fed one entry at a time.
 
-    filtered = []
-    total_entries = len(entries)
-    # Build a set of candidate entity_ids from the state objects
-    candidate_ids = {s.entity_id for s in candidate_entities} if candidate_entities else set()
-    
-    last_states = {}
-    for entry in entries:
-        eid = entry.get("entity_id")
-        est = entry.get("state")
+    Entries must arrive in time order. Keeping the per-entity state between calls
+    lets the filter run while a logbook response is still being streamed.
+    """
+
+    def __init__(self, candidate_entities):
+        # Build a set of candidate entity_ids from the state objects
+        self.candidate_ids = {s.entity_id for s in candidate_entities} if candidate_entities else set()
+        self.last_states = {}
+        self.total = 0
+        self.accepted = 0
+        # Entries dropped by each filter
+        self.dropped_unknown = 0
+        self.dropped_candidate = 0
+        self.dropped_repeated = 0
+
+    def accept(self, eid, est):
+        self.total += 1
+        last_states = self.last_states
 
         if est == "unknown":
             last_states[eid] = est  # Store the last state as "unknown" for this entity 
-            continue
-        if candidate_ids and eid not in candidate_ids:
-            continue
+            self.dropped_unknown += 1
+            return False
+        if self.candidate_ids and eid not in self.candidate_ids:
+            self.dropped_candidate += 1
+            return False
 
         # Check if the state is the same as the last recorded state for this entity
         if eid in last_states and (last_states[eid] == est or last_states.get(eid) == "unknown"):
@@ -216,111 +353,331 @@ def filter_logbook_entries(entries, candidate_entities, state=None, events_per_s
             # If the state is the same or the last state was "unknown", skip this entry
             #but update the last state to the current one
             last_states[eid] = est #to move out from unknown state
-            continue
+            self.dropped_repeated += 1
+            return False
 
         # Update the last state for this entity
         last_states[eid] = est
+        self.accepted += 1
+        return True
 
-        filtered.append(entry)
+def filter_logbook_entries(entries, candidate_entities, state=None, events_per_second=1, congestion="skip"):
+    # Filter entries only for candidate entity_ids and matching state (if provided)
+    if candidate_entities is None:
+        candidate_entities = []
+    if len(candidate_entities) == 0:
+        _LOGGER.warning("No candidate entities provided for filtering.")
+        return []
 
-    _LOGGER.debug("Logbook filtering: Total entries: %d, After candidate and state filtering: %d", total_entries, len(filtered))
-    
-    # Group entries by second (timestamp truncated to seconds)
-    groups = {}
-    for entry in filtered:
-        try:
-            ts = datetime.fromisoformat(entry.get("when", "").replace("Z", "+00:00")).replace(microsecond=0)
-        except Exception as e:
-            _LOGGER.warning("Invalid timestamp in entry: %s", e)
-            continue
-        groups.setdefault(ts, []).append(entry)
-    
+    dedup = EntryDeduplicator(candidate_entities)
+    filtered = list(records_from_entries(
+        entry for entry in entries if dedup.accept(entry.get("entity_id"), entry.get("state"))
+    ))
+
+    _LOGGER.debug("Logbook filtering: Total entries: %d, After candidate and state filtering: %d", dedup.total, len(filtered))
+    return apply_congestion_control(filtered, events_per_second, congestion)
+
+def apply_congestion_control(filtered, events_per_second=1, congestion="skip"):
+    # Group records by second (epoch timestamp truncated to seconds); the stable
+    # sort keeps the arrival order of the records within a second
+    return list(iter_congestion_control(sorted(filtered, key=lambda record: int(record.ts)), events_per_second, congestion))
+
+def iter_congestion_control(records, events_per_second=1, congestion="skip", stats=None):
+    # Lazily apply congestion control to time-ordered records, one second group at a time.
+    # Large lists are grouped with array operations; only the kept records are touched.
+    # The number of dropped records is added to stats["dropped_congestion"] when given.
+    stats = {} if stats is None else stats
+    stats.setdefault("dropped_congestion", 0)
+    if isinstance(records, list) and vectorized.use_vectorized(len(records)):
+        return _iter_congestion_vectorized(records, events_per_second, congestion, stats)
+    return _iter_congestion(records, events_per_second, congestion, stats)
+
+def _iter_congestion(records, events_per_second, congestion, stats):
+    group = []
+    group_ts = None
+    for record in records:
+        ts = int(record.ts)
+        if ts != group_ts and group:
+            kept = _congest_group(group_ts, group, events_per_second, congestion)
+            stats["dropped_congestion"] += len(group) - len(kept)
+            yield from kept
+            group = []
+        group_ts = ts
+        group.append(record)
+    if group:
+        kept = _congest_group(group_ts, group, events_per_second, congestion)
+        stats["dropped_congestion"] += len(group) - len(kept)
+        yield from kept
+
+def _congest_group(ts, group, events_per_second, congestion):
     # Apply congestion control per second group.
-    result = []
-    for ts in sorted(groups.keys()):
-        group = groups[ts]
-        if len(group) <= events_per_second:
-            result.extend(group)
-        else:
-            if congestion == "skip":
-                result.extend(group[:events_per_second])
-            elif congestion == "summarize":
-                # Use the first event as base and summarize the rest.
-                summary = group[0].copy()
-                extra = len(group) - 1
-                summary_msg = f"and {extra} more events at {ts.strftime('%Y-%m-%d %H:%M:%S')}"
-                # Append the summary info to the description if present.
-                orig_desc = summary.get("description", "")
-                summary["description"] = (orig_desc + " " if orig_desc else "") + summary_msg
-                result.append(summary)
-            else:
-                # Unknown congestion option; fallback to no congestion handling.
-                result.extend(group)
-    return result
+    if len(group) <= events_per_second:
+        return group
+    if congestion == "skip":
+        return group[:events_per_second]
+    if congestion == "summarize":
+        return [_summarize_group(group[0], len(group) - 1, ts)]
+    # Unknown congestion option; fallback to no congestion handling.
+    return group
+
+def _summarize_group(first, extra, ts):
+    # Use the first event as base and summarize the rest.
+    summary = first.copy()
+    second = datetime.fromtimestamp(ts, timezone.utc)
+    summary_msg = f"and {extra} more events at {second.strftime('%Y-%m-%d %H:%M:%S')}"
+    # Append the summary info to the description if present.
+    orig_desc = summary.description or ""
+    summary.description = (orig_desc + " " if orig_desc else "") + summary_msg
+    return summary
+
+def _iter_congestion_vectorized(records, events_per_second, congestion, stats):
+    if congestion not in ("skip", "summarize"):
+        # Unknown congestion option; fallback to no congestion handling.
+        yield from records
+        return
+    indices, summarized, extra, seconds = vectorized.congestion_plan(
+        list(map(attrgetter("ts"), records)), events_per_second, congestion == "summarize"
+    )
+    stats["dropped_congestion"] += len(records) - len(indices)
+    for index, is_summary, count, ts in zip(indices.tolist(), summarized.tolist(), extra.tolist(), seconds.tolist()):
+        yield _summarize_group(records[index], count, ts) if is_summary else records[index]
 
 # --- Logbook Formatting ---
-def format_logbook_entries(entries, char_limit=262144):
-    output = "Time, Entity, Event\n"  # header with newline
+OUTPUT_HEADER = "Time, Entity, Event\n"
+SUMMARY_HEADER = "Entity, Event, Count, Time in state, First, Last\n"
+# Shortest possible row: timestamp, one-character name and the shortest description ("locked")
+MIN_LINE_LENGTH = len("2025-01-01 00:00:00, x, locked\n")
+
+def event_budget(char_limit, max_events=None):
+    # Upper bound of the number of events that can still reach the output
+    budget = max(0, char_limit - len(OUTPUT_HEADER)) // MIN_LINE_LENGTH
+    if max_events:
+        budget = min(budget, max_events)
+    return budget
+
+def format_logbook_entries(entries, char_limit=262144, max_events=None, stats=None):
+    # Entries are consumed lazily, so upstream generators stop as soon as the budget is used.
+    # stats, when given, receives the number of events written and the truncation reason.
+    stats = {} if stats is None else stats
+    output = OUTPUT_HEADER  # header with newline
     used = len(output)
-    safe_char_limit = char_limit - (len(output) + 1024)  # reserve space for header
-    for entry in entries:
-        try:
-            utc_time = datetime.fromisoformat(entry.get("when", "").replace("Z", "+00:00"))
-            local_time = utc_time.astimezone(LOCAL_TZ)
-            timestamp = local_time.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception as e:
-            _LOGGER.warning("Invalid or missing timestamp: %s", e)
-            continue
+    count = 0
+    for record in entries:
+        if max_events and count >= max_events:
+            _LOGGER.debug("Reached max_events limit of %d. Truncating output.", max_events)
+            stats["truncated"] = "max_events"
+            break
+        timestamp = datetime.fromtimestamp(record.ts, LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
 
-        eid = entry.get("entity_id", "unknown")
-        state = entry.get("state", "")
-        dc = entry.get("device_class", "")
+        eid = record.entity_id or "unknown"
+        state = record.state or ""
+        dc = record.device_class or ""
 
-        name = entry.get("name") or entry.get("attributes", {}).get("friendly_name") or eid
-        device_class = entry.get("device_class", "")
+        name = record.name or eid
 
         description = generate_event_description(dc, state)
         line = f"{timestamp}, {name}, {description}\n"  # add newline after each entry
         if used + len(line) > char_limit:
             _LOGGER.warning("Reached character limit of %d. Truncating output.", char_limit)
+            stats["truncated"] = "char_limit"
             break
         output += line
         used += len(line)
+        count += 1
+    stats["events"] = count
     return output
 
 # Sample output row:
 # 2025-04-17 16:38:26, Bejárati kamera, motion detected
 
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def format_summary(summaries, char_limit=262144, stats=None):
+    # One row per entity and state: times entered, total time spent in it, first and last entry
+    stats = {} if stats is None else stats
+    output = SUMMARY_HEADER
+    used = len(output)
+    for summary in summaries:
+        record = summary.record
+        name = record.name or record.entity_id or "unknown"
+        for state, state_stats in summary.states.items():
+            description = generate_event_description(record.device_class or "", state or "")
+            first = datetime.fromtimestamp(state_stats.first, LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
+            last = datetime.fromtimestamp(state_stats.last, LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
+            line = f"{name}, {description}, {state_stats.count}, {format_duration(state_stats.seconds)}, {first}, {last}\n"
+            if used + len(line) > char_limit:
+                _LOGGER.warning("Reached character limit of %d. Truncating summary.", char_limit)
+                stats["truncated"] = "char_limit"
+                return output
+            output += line
+            used += len(line)
+    return output
+
+# Sample summary row:
+# Bejárati ajtó, door opened, 12, 0:34:10, 2025-04-14 07:02:11, 2025-04-17 16:38:26
+
+# --- Compact Formatting ---
+OUTPUT_FORMAT_CSV = "csv"
+OUTPUT_FORMAT_COMPACT = "compact"
+COMPACT_HEADER = "Time (first of a day absolute, then +delta to previous event), entity, event; xN over D = N events repeating the listed ones during D\n"
+COMPACT_ENTITIES = "Entities: "
+COMPACT_EVENTS = "Events: "
+# Shorter runs are listed event by event
+COMPACT_MIN_RUN = 3
+
+def _letter_id(index):
+    # a, b, ..., z, aa, ab, ...
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("a") + remainder) + letters
+    return letters
+
+def format_delta(seconds):
+    sign = "-" if seconds < 0 else "+"
+    minutes, seconds = divmod(abs(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{sign}{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{sign}{minutes}:{seconds:02d}"
+
+class CompactWriter:
+    """Dictionary-encoded event list: names and descriptions are listed once in a
+    legend, dates once per day, times as deltas and repeating events as runs."""
+
+    def __init__(self, char_limit):
+        self.char_limit = char_limit
+        self.entities = {}  # entity_id -> (short id, name)
+        self.events = {}  # description -> short id
+        self.lines = []
+        # Fixed parts of the output; every legend entry adds its text plus a separator
+        self.used = len(COMPACT_HEADER) + len(COMPACT_ENTITIES) + 1 + len(COMPACT_EVENTS) + 1
+        self.day = None
+        self.last_ts = None
+        self.full = False
+        self.written = 0  # events in the written lines
+
+    def write(self, entity, name, run):
+        # run: list of (second, description) of one entity, oldest first in output order
+        first_ts = run[0][0]
+        moment = datetime.fromtimestamp(first_ts, LOCAL_TZ)
+        text = ""
+        day = moment.date()
+        if day != self.day:
+            text += moment.strftime("%Y-%m-%d") + "\n" + moment.strftime("%H:%M:%S")
+        else:
+            text += format_delta(first_ts - self.last_ts)
+
+        new_entity = entity not in self.entities
+        entity_id = f"E{len(self.entities) + 1}" if new_entity else self.entities[entity][0]
+        new_events = {}
+        event_ids = []
+        for _, description in run[:2] if len(run) >= COMPACT_MIN_RUN else run[:1]:
+            event_id = self.events.get(description) or new_events.get(description)
+            if event_id is None:
+                event_id = new_events[description] = _letter_id(len(self.events) + len(new_events))
+            if event_id not in event_ids:
+                event_ids.append(event_id)
+
+        text += f" {entity_id} {' '.join(event_ids)}"
+        if len(run) >= COMPACT_MIN_RUN:
+            text += f" x{len(run)} over {format_duration(abs(run[-1][0] - first_ts))}"
+        text += "\n"
+
+        # Legend entries after the first of their line add a "; " separator
+        legend = len(f"{entity_id}={name}") + (2 if self.entities else 0) if new_entity else 0
+        for position, (description, event_id) in enumerate(new_events.items(), len(self.events)):
+            legend += len(f"{event_id}={description}") + (2 if position else 0)
+        if self.used + len(text) + legend > self.char_limit:
+            self.full = True
+            return False
+        if new_entity:
+            self.entities[entity] = (entity_id, name)
+        self.events.update(new_events)
+        self.lines.append(text)
+        self.used += len(text) + legend
+        self.day = day
+        self.last_ts = run[-1][0]
+        self.written += len(run)
+        return True
+
+    def output(self):
+        entities = "; ".join(f"{entity_id}={name}" for entity_id, name in self.entities.values())
+        events = "; ".join(f"{event_id}={description}" for description, event_id in self.events.items())
+        return COMPACT_HEADER + COMPACT_ENTITIES + entities + "\n" + COMPACT_EVENTS + events + "\n" + "".join(self.lines)
+
+def format_compact_entries(entries, char_limit=262144, max_events=None, stats=None):
+    # Consecutive events of one entity that keep repeating the same one or two
+    # events are collapsed into a single run line
+    stats = {} if stats is None else stats
+    writer = CompactWriter(char_limit)
+    run_entity = None
+    run_name = None
+    run = []
+    cycle = ()
+    count = 0
+
+    def flush():
+        if len(run) >= COMPACT_MIN_RUN:
+            return writer.write(run_entity, run_name, run)
+        return all(writer.write(run_entity, run_name, [event]) for event in run)
+
+    for record in entries:
+        if max_events and count >= max_events:
+            _LOGGER.debug("Reached max_events limit of %d. Truncating output.", max_events)
+            stats["truncated"] = "max_events"
+            break
+        entity = record.entity_id or "unknown"
+        description = generate_event_description(record.device_class or "", record.state or "")
+        event = (int(record.ts), description)
+        count += 1
+        if run and entity == run_entity:
+            if len(run) == 1:
+                cycle = (run[0][1],) if description == run[0][1] else (run[0][1], description)
+                run.append(event)
+                continue
+            if description == cycle[len(run) % len(cycle)]:
+                run.append(event)
+                continue
+        if run and not flush():
+            break
+        run_entity = entity
+        run_name = record.name or entity
+        run = [event]
+    if run and not writer.full:
+        flush()
+    if writer.full:
+        _LOGGER.warning("Reached character limit of %d. Truncating output.", char_limit)
+        stats["truncated"] = "char_limit"
+    stats["events"] = writer.written
+    return writer.output()
+
 # --- Utility: Inject Resolved Properties ---
-def inject_resolved_properties(hass, entries, properties):
-    for entry in entries:
-        if entry.get("entity_id") == "sensor.date_time":
-            continue  # Skip sensor.date_time entity
+# Properties the output formats use; see resolvers.py for the others
+ENRICHED_PROPERTIES = ["area", "device_class"]
 
-        entity_reg = hass.data.get("entity_registry")
-        device_reg = hass.data.get("device_registry")
-        if not entity_reg:
-            continue
-        ent = entity_reg.entities.get(entry.get("entity_id"))
-        if not ent:
-            continue
-        for prop in properties:
-            if prop == "area":
-                resolved_area_id = ent.area_id or (device_reg.devices.get(ent.device_id).area_id if device_reg and ent.device_id in device_reg.devices else None)
-                area_registry = hass.data.get("area_registry")
-                if area_registry and resolved_area_id and resolved_area_id in area_registry.areas:
-                    entry["area"] = area_registry.areas[resolved_area_id]
-                else:
-                    entry["area"] = None
-            elif prop == "device_class":
-                state = hass.states.get(entry.get("entity_id"))
-                if state:
-                    entry["device_class"] = state.attributes.get("device_class")
-            # ...future property injections...
+def inject_resolved_properties(hass, entries, properties, context=None):
+    for _ in iter_resolved_properties(hass, entries, properties, context):
+        pass
     return entries
 
-def gather_candidate_entities(hass, entity_name_or_id=None, domain=None, device_classes=None, area_ids=None):
+def iter_resolved_properties(hass, entries, properties, context=None):
+    # Lazily enrich records, so nothing is resolved for records past the output budget;
+    # the context resolves each entity once and the records share its projection
+    apply = (context or EnrichmentContext(hass, properties)).apply
+    for entry in entries:
+        apply(entry)
+        yield entry
+
+def gather_candidate_entities(hass, entity_name_or_id=None, domain=None, device_classes=None, area_ids=None, index=None):
     _LOGGER.debug("Gathering candidate entities with filters: entity_id=%s, domain=%s, device_classes=%s, area_ids=%s", entity_name_or_id, domain, device_classes, area_ids)
+    if index is not None:
+        # The prebuilt entity index turns the registry scan into set intersections
+        return index.candidates(entity_name_or_id, domain, device_classes, area_ids)
     _LOGGER.debug("Gathering version:  v1.0.1")
     candidate_entities = []
     entity_registry = hass.data.get("entity_registry")
@@ -430,27 +787,327 @@ def gather_candidate_entities(hass, entity_name_or_id=None, domain=None, device_
 
     return list({s.entity_id: s for s in candidate_entities}.values())
 
+# --- Activity Pruning ---
+# These also write logbook entries that are not state changes (e.g. "triggered by"),
+# so an unchanged state does not mean they are absent from the logbook
+UNTRACKED_DOMAINS = {"automation", "script"}
+
+def prune_idle_candidates(candidate_entities, start_ts, end_ts, activity=None):
+    # Keep the candidates that may have a logbook entry between start_ts and end_ts. An entity
+    # whose current state last changed before the window start did not change during it; the
+    # activity index (activity.py) also rules out entities without changes in the window's hours.
+    active = []
+    for state_obj in candidate_entities:
+        if state_obj.domain in UNTRACKED_DOMAINS:
+            active.append(state_obj)
+        elif state_obj.last_changed.timestamp() < start_ts:
+            continue
+        elif activity is None or not activity.idle(state_obj.entity_id, start_ts, end_ts):
+            active.append(state_obj)
+    return active
+
 # --- High-Level Query Runner ---
-async def get_raw_entries(hass, url, headers, params, candidate_entities, end_str, max_iter):
-    # If the number of candidates is less than max_iter, fetch using each candidate's entity_id separately
-    if candidate_entities and len(candidate_entities) < max_iter:
-        raw_entries = []
-        for state_obj in candidate_entities:
-            params_local = {"end_time": end_str, "entity_id": state_obj.entity_id}
-            entries = await fetch_logbook_data(hass, url, headers, params_local)
-            raw_entries.extend(entries)
-    else:
-        if candidate_entities and len(candidate_entities) == 1:
-            params["entity_id"] = candidate_entities[0].entity_id
-        raw_entries = await fetch_logbook_data(hass, url, headers, params)
-    # Sort raw_entries by the "when" field to ensure proper time order
+def merge_sorted_entries(responses):
+    # Every per-entity response is already time-ordered, so a streaming
+    # k-way merge replaces the full re-sort of the concatenated lists.
+    return list(heapq.merge(*responses, key=attrgetter("ts")))
+
+def deduplicate_records(records, dedup):
+    if vectorized.use_vectorized(len(records)):
+        return _deduplicate_vectorized(records, dedup)
+    return [record for record in records if dedup.accept(record.entity_id, record.state)]
+
+def _deduplicate_vectorized(records, dedup):
+    # Same result and deduplicator state as feeding every record to dedup.accept
+    entity_codes, entities = vectorized.factorize(list(map(attrgetter("entity_id"), records)))
+    state_codes, states = vectorized.factorize(
+        list(map(attrgetter("state"), records)), {"unknown": vectorized.UNKNOWN_CODE}
+    )
+    np = vectorized.np
+    entity_ids = list(entities)
+    last_states = dedup.last_states
+    initial = np.array(
+        [states.get(last_states[eid], vectorized.NO_STATE) if eid in last_states else vectorized.NO_STATE for eid in entity_ids],
+        dtype=np.int64,
+    )
+    candidate_ids = dedup.candidate_ids
+    candidates = np.array([not candidate_ids or eid in candidate_ids for eid in entity_ids], dtype=bool)
+
+    mask, last_index = vectorized.dedup_mask(entity_codes, state_codes, initial, candidates)
+
+    # Candidates remember their last state, other entities only ever remember "unknown"
+    unknown_seen = np.zeros(len(entity_ids), dtype=bool)
+    unknown_seen[entity_codes[state_codes == vectorized.UNKNOWN_CODE]] = True
+    for code, eid in enumerate(entity_ids):
+        if candidates[code]:
+            last_states[eid] = records[last_index[code]].state
+        elif unknown_seen[code]:
+            last_states[eid] = "unknown"
+
+    unknown = int((state_codes == vectorized.UNKNOWN_CODE).sum())
+    non_candidate = int((~candidates[entity_codes] & (state_codes != vectorized.UNKNOWN_CODE)).sum())
+    accepted = [records[index] for index in np.flatnonzero(mask).tolist()]
+    dedup.total += len(records)
+    dedup.accepted += len(accepted)
+    dedup.dropped_unknown += unknown
+    dedup.dropped_candidate += non_candidate
+    dedup.dropped_repeated += len(records) - len(accepted) - unknown - non_candidate
+    return accepted
+
+# The request line of aiohttp's server may be at most 8190 bytes; batched entity
+# lists keep the whole URL below this length
+BATCH_URL_LENGTH = 4000
+
+def batch_entity_ids(entity_ids, max_length):
+    # Comma-separated entity lists, each at most max_length characters once URL encoded
+    batches = []
+    batch = []
+    length = 0
+    for entity_id in entity_ids:
+        added = len(entity_id) + (3 if batch else 0)  # "," is sent as %2C
+        if batch and length + added > max_length:
+            batches.append(",".join(batch))
+            batch = []
+            added = len(entity_id)
+            length = 0
+        batch.append(entity_id)
+        length += added
+    if batch:
+        batches.append(",".join(batch))
+    return batches
+
+def batch_max_length(url, end_str):
+    # Room left for the entity list in a batched request to url
+    return BATCH_URL_LENGTH - len(url) - len(end_str) - len("?end_time=&entity=")
+
+def default_strategy(candidate_count, max_iter, max_batched):
+    # Below max_iter candidates each entity is fetched on its own; up to max_batched
+    # candidates they are sent as comma-separated entity lists; above that the whole
+    # logbook is fetched
+    if candidate_count and candidate_count < max_iter:
+        return STRATEGY_PER_ENTITY
+    if 1 < candidate_count <= max_batched:
+        return STRATEGY_BATCHED
+    return STRATEGY_FULL
+
+async def get_raw_entries(hass, url, headers, params, candidate_entities, end_str, max_iter, client=None, concurrency=1, dedup=None, streaming=False, limit=None, raise_errors=False, max_batched=0, strategy=None, keep=None, on_error=None):
+    # Returns time-ordered records; when a deduplicator is given only the accepted records are kept.
+    # With a limit, streaming stops once that many distinct seconds were accepted: congestion
+    # control keeps at least one event per second, so later entries can never reach the output.
+    # Without a deduplicator, keep(entity_id, state) decides which streamed entries are kept.
+    # The strategy comes from the query planner; without one the option thresholds decide.
+    if strategy is None:
+        strategy = default_strategy(len(candidate_entities or ()), max_iter, max_batched)
+    entity_filters = None
+    if strategy == STRATEGY_PER_ENTITY:
+        entity_filters = [state_obj.entity_id for state_obj in candidate_entities]
+    elif strategy == STRATEGY_BATCHED:
+        entity_filters = batch_entity_ids(sorted(s.entity_id for s in candidate_entities), batch_max_length(url, end_str))
+        _LOGGER.debug("Fetching %d candidate entities in %d batched requests", len(candidate_entities), len(entity_filters))
+
+    if entity_filters:
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def fetch_entities(entity_filter):
+            # The logbook API filters on the "entity" query parameter, a comma-separated list
+            params_local = {"end_time": end_str, "entity": entity_filter}
+            async with semaphore:
+                return await fetch_logbook_data(hass, url, headers, params_local, client, raise_errors, on_error)
+
+        responses = await asyncio.gather(*(fetch_entities(entity_filter) for entity_filter in entity_filters))
+        return await run_offloaded(hass, sum(map(len, responses)), decode_merged_responses, responses, dedup)
+
+    if candidate_entities and len(candidate_entities) == 1:
+        params["entity"] = candidate_entities[0].entity_id
+
+    if streaming and (dedup or keep):
+        # The logbook API returns entries in time order, so non-candidates and
+        # repeated states are dropped as they arrive and never accumulate in memory
+        accept = dedup.accept if dedup else keep
+        records = []
+        seconds = 0
+        last_second = None
+        stream = stream_logbook_data(hass, url, headers, params, client, raise_errors, on_error)
+        try:
+            async for entry in stream:
+                if not accept(entry.get("entity_id"), entry.get("state")):
+                    continue
+                for record in records_from_entries((entry,)):
+                    second = int(record.ts)
+                    if second != last_second:
+                        if limit and seconds >= limit:
+                            _LOGGER.debug("Output budget of %d events reached, stopping the logbook stream", limit)
+                            return records
+                        seconds += 1
+                        last_second = second
+                    records.append(record)
+        finally:
+            # Closing the stream releases the connection even if the body was not read to the end
+            await stream.aclose()
+        return records
+
+    raw_entries = await fetch_logbook_data(hass, url, headers, params, client, raise_errors, on_error)
+    return await run_offloaded(hass, len(raw_entries), decode_response, raw_entries, dedup)
+
+def decode_merged_responses(responses, dedup=None):
+    # Every entity is in one response only, so merging keeps its events in order
+    records = merge_sorted_entries([list(records_from_entries(response)) for response in responses])
+    return deduplicate_records(records, dedup) if dedup else records
+
+def decode_response(raw_entries, dedup=None):
+    # Convert once and sort by the parsed timestamp to ensure proper time order
+    records = list(records_from_entries(raw_entries))
+    records.sort(key=attrgetter("ts"))
+    return deduplicate_records(records, dedup) if dedup else records
+
+SHARD_RETRIES = 2
+SHARD_RETRY_DELAY = 1  # seconds, doubled for every further attempt
+
+def split_time_range(start_dt, end_dt, span):
+    # Consecutive [start, end) sub-windows of at most span length covering the whole range
+    shards = []
+    shard_start = start_dt
+    while shard_start < end_dt:
+        shard_end = min(end_dt, shard_start + span)
+        shards.append((shard_start, shard_end))
+        shard_start = shard_end
+    return shards
+
+async def fetch_sharded(fetch_window, shards, consume, concurrency=1, retries=SHARD_RETRIES, on_error=None):
+    # Fetch up to concurrency shards ahead and hand their time-ordered records to consume in
+    # shard order, so a shared deduplicator sees every entry in time order and only the shards
+    # in flight are held in memory. Once consume returns True the output budget is met and the
+    # later shards are not fetched. A failing shard is retried on its own; if it keeps failing
+    # only its events are missing and on_error is told. Returns the end of the last shard consumed.
+
+    async def fetch_shard(shard_start, shard_end):
+        for attempt in range(retries + 1):
+            try:
+                return await fetch_window(shard_start, shard_end)
+            except LogbookFetchError as e:
+                if attempt == retries:
+                    _LOGGER.error("Giving up on logbook shard %s - %s: %s", shard_start, shard_end, e)
+                    if on_error is not None:
+                        on_error(e)
+                    return []
+                _LOGGER.warning("Retrying logbook shard %s - %s after error: %s", shard_start, shard_end, e)
+                await asyncio.sleep(SHARD_RETRY_DELAY * 2 ** attempt)
+
+    remaining = iter(shards)
+    pending = deque()
+
+    def schedule():
+        for shard_start, shard_end in remaining:
+            pending.append((shard_end, asyncio.ensure_future(fetch_shard(shard_start, shard_end))))
+            if len(pending) >= max(1, concurrency):
+                return
+
+    fetched_to = None
+    schedule()
     try:
-        raw_entries.sort(key=lambda entry: datetime.fromisoformat(entry.get("when", "").replace("Z", "+00:00")))
-    except Exception as e:
-        _LOGGER.warning("Failed to sort raw_entries: %s", e)
-    return raw_entries
+        while pending:
+            shard_end, task = pending.popleft()
+            records = await task
+            fetched_to = shard_end
+            if await consume(records):
+                _LOGGER.debug("Output budget filled, skipped fetching the logbook after %s", shard_end)
+                break
+            schedule()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+    return fetched_to
+
+# Windows expected to hold more entries than the output budget are fetched as
+# time-ordered sub-windows, so the fetch stops once the budget is filled
+BUDGET_MIN_SPAN = timedelta(hours=1)
+BUDGET_MAX_WINDOWS = 8
+
+def budget_span(start_dt, end_dt, budget, estimated_entries):
+    # Sub-window length expected to hold about one output budget of entries, or None
+    # when the whole window is not expected to fill it
+    if not budget or estimated_entries <= budget:
+        return None
+    span = max(BUDGET_MIN_SPAN, (end_dt - start_dt) / BUDGET_MAX_WINDOWS, (end_dt - start_dt) * (budget / estimated_entries))
+    return span if span < end_dt - start_dt else None
+
+NEWEST_FIRST_SPAN = timedelta(hours=1)
+
+async def fetch_newest_first(fetch_window, start_dt, end_dt, candidate_entities, budget):
+    # Fetch the most recent sub-windows first, doubling their length each step,
+    # until they hold enough events to fill the output budget. Returns the records
+    # and the start of the oldest window fetched.
+    chunks = []
+    found = 0
+    span = NEWEST_FIRST_SPAN
+    window_end = end_dt
+    while window_end > start_dt and (budget is None or found < budget):
+        window_start = max(start_dt, window_end - span)
+        records = await fetch_window(window_start, window_end)
+        chunks.append(records)
+        # The state an entity was in before the window is in the older window, which is not
+        # fetched yet, so its first record may only repeat it and is not counted. The count
+        # can only understate the events of the window, which only fetches a further window;
+        # the records are deduplicated exactly once they are all fetched.
+        probe = EntryDeduplicator(candidate_entities)
+        seen = set()
+        seconds = set()
+        for record in records:
+            if not probe.accept(record.entity_id, record.state):
+                continue
+            if record.entity_id in seen:
+                seconds.add(int(record.ts))
+            else:
+                seen.add(record.entity_id)
+        found += len(seconds)
+        window_end = window_start
+        span *= 2
+    if window_end > start_dt:
+        _LOGGER.debug("Output budget filled, skipped fetching %s - %s", start_dt, window_end)
+    chunks.reverse()
+    return [record for chunk in chunks for record in chunk], window_end
+
+# --- Executor Offloading ---
+# Above this many records the pure-data stages run in an executor thread, so a large
+# query does not stall the event loop; below it the hand-over costs more than it saves
+OFFLOAD_THRESHOLD = 20000
+OFFLOAD_BYTES = 2 * 1024 * 1024  # logbook responses, about 20,000 entries
+
+async def run_offloaded(hass, count, func, *args):
+    if count < OFFLOAD_THRESHOLD:
+        return func(*args)
+    return await hass.async_add_executor_job(func, *args)
+
+def format_records(hass, filtered, enrichment, newest_first, compact, char_limit, max_events, stats, trace):
+    # Step 4: Apply per-second congestion control to the filtered entries
+    records = trace.timed("congestion", iter_congestion_control(filtered, stats=stats))
+    if newest_first:
+        # Most recent events first, so truncation drops the oldest ones
+        records = reversed(list(records))
 
-async def run_log_query(
+    # Step 5: Inject resolved properties into each filtered entry via the generic helper function
+    records = trace.timed("enrich", iter_resolved_properties(hass, records, ENRICHED_PROPERTIES, enrichment))
+
+    # Step 6: Format final output; the stages above are lazy and stop with the formatter
+    if compact:
+        return format_compact_entries(records, char_limit, max_events, stats)
+    return format_logbook_entries(records, char_limit, max_events, stats)
+
+async def run_log_query(hass, ha_token, question, question_type, *args, runtime=None, **kwargs):
+    # Every query leaves a trace with stage timings and volumes in the metrics of the config entry
+    trace = QueryTrace(question, question_type)
+    metrics = runtime.get("metrics") if runtime else None
+    result = None
+    try:
+        result = await _run_log_query(hass, ha_token, question, question_type, *args, runtime=runtime, trace=trace, **kwargs)
+        return result
+    finally:
+        trace.finish(result)
+        if metrics is not None:
+            metrics.record(trace)
+
+async def _run_log_query(
     hass,
     ha_token,
     question,
@@ -463,9 +1120,19 @@ async def run_log_query(
     state=None,
     char_limit=262144,
     start_time=None,
-    end_time=None
+    end_time=None,
+    runtime=None,
+    max_events=None,
+    newest_first=False,
+    output_format=None,
+    trace=None
 ):
     _LOGGER.info("Running log query: '%s'", question)
+    # Summaries aggregate every event of the window, so there is no event budget to stop at
+    summary = question_type == SUMMARY_QUESTION_TYPE
+    if summary:
+        newest_first = False
+    compact = output_format == OUTPUT_FORMAT_COMPACT and not summary
 
     # Step 1: Resolve time range
     now = datetime.now(timezone.utc)
@@ -476,14 +1143,21 @@ async def run_log_query(
     start_str = start_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
     end_str = end_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    area_mappings = fetch_area_mappings(hass)
-
-    area_ids = resolve_area_ids(area_mappings, area_name_or_alias)
+    area_resolver = runtime.get("areas") if runtime else None
+    if area_resolver is not None:
+        area_ids = area_resolver.resolve(area_name_or_alias)
+    else:
+        area_mappings = fetch_area_mappings(hass)
+        area_ids = resolve_area_ids(area_mappings, area_name_or_alias)
     #device_class_map, _ = fetch_entity_mappings(hass)
 
     # Új megközelítés: candidate list feltöltése teljes state objektummal, nem csak entity_id-val
-    max_iter = 5
-    candidate_entities = gather_candidate_entities(hass, entity_name_or_alias, domain, device_classes, area_ids)
+    # Per-entity requests run in parallel, so the threshold can be much higher than a sequential loop allows
+    max_iter = get_option(runtime, CONF_MAX_PER_ENTITY_REQUESTS, DEFAULT_MAX_PER_ENTITY_REQUESTS)
+    concurrency = get_option(runtime, CONF_FETCH_CONCURRENCY, DEFAULT_FETCH_CONCURRENCY)
+    max_batched = get_option(runtime, CONF_MAX_BATCHED_ENTITIES, DEFAULT_MAX_BATCHED_ENTITIES)
+    index = runtime.get("index") if runtime else None
+    candidate_entities = gather_candidate_entities(hass, entity_name_or_alias, domain, device_classes, area_ids, index)
     # Deduplicate candidate state objects by entity_id
     candidate_entities = list({s.entity_id: s for s in candidate_entities}.values())
     # Extra debug logging: if extra filters applied, log detailed candidate entity_ids;
@@ -493,23 +1167,329 @@ async def run_log_query(
     else:
         _LOGGER.info("Candidate entities count (only expose filter applied): %d", len(candidate_entities))
     
+    trace.counters["candidates"] = len(candidate_entities)
+    trace.lap("resolve")
+
     #no candidate entities found
     if not candidate_entities:
         _LOGGER.warning("No candidate entities found for the given filters.")
         return "No entities found for the given filters."
 
-    url = f"{hass.config.internal_url or hass.config.external_url}/api/logbook/{start_str}"
-    headers = {"Authorization": f"Bearer {ha_token}", "Content-Type": "application/json"}
-    params = {"end_time": end_str}
-    
-    # Call the new helper function to get and sort raw entries
-    raw_entries = await get_raw_entries(hass, url, headers, params, candidate_entities, params["end_time"], max_iter)
-    
-    # Step 4: Filter entries using candidate_entities (matching via state_obj.entity_id)
-    filtered = filter_logbook_entries(raw_entries, candidate_entities, state=state)
-    
-    # Step 5: Inject resolved properties into each filtered entry via the generic helper function
-    inject_resolved_properties(hass, filtered, ["area","device_class"])
-    
-    # Step 6: Format final output
-    return format_logbook_entries(filtered, char_limit)
+    # Candidates whose state did not change during the window have no entries to fetch
+    if get_option(runtime, CONF_ACTIVITY_PRUNING, DEFAULT_ACTIVITY_PRUNING):
+        activity = runtime.get("activity") if runtime else None
+        active = prune_idle_candidates(candidate_entities, start_dt.timestamp(), end_dt.timestamp(), activity)
+        trace.counters["candidates_idle"] = len(candidate_entities) - len(active)
+        _LOGGER.debug("Activity pruning kept %d of %d candidates", len(active), len(candidate_entities))
+        candidate_entities = active
+        trace.lap("resolve")
+
+    # Step 2: Serve repeated queries from the result cache
+    cache = runtime.get("cache") if runtime else None
+    closed = end_dt < now
+    cache_key = None
+    if cache is not None:
+        period = None if (start_time and end_time) else time_period
+        cache_key = cache.make_key(
+            (s.entity_id for s in candidate_entities), start_dt, end_dt, period, closed,
+            state, char_limit, max_events, bool(newest_first), summary, compact
+        )
+        cached = cache.get(cache_key)
+        trace.lap("cache")
+        if cached is not None:
+            _LOGGER.debug("Query result served from cache. Cache stats: %s", cache.stats)
+            trace.source = "cache"
+            trace.plan = QueryPlan(STRATEGY_CACHE, transport="cache")
+            trace.plan.record_actual(0, 0, trace.stages["cache"])
+            return cached
+
+    # Step 3: Fetch entries, dropping non-candidates, unknown and repeated states on the way
+    dedup = EntryDeduplicator(candidate_entities)
+    filtered = None
+    archived = None
+    plan = None
+    archive = runtime.get("archive") if runtime else None
+    archive_end = archive.cutoff(start_dt, end_dt, now) if archive is not None and candidate_entities else None
+    if not candidate_entities:
+        # Every candidate was idle during the window
+        trace.source = "activity"
+        plan = QueryPlan(STRATEGY_IDLE, transport="activity")
+        filtered = []
+    elif archive_end is not None:
+        # The part of the window the recorder no longer holds is read from the local archive
+        records = await archive.async_entries(candidate_entities, start_dt, archive_end)
+        trace.lap("fetch")
+        archived = await run_offloaded(hass, len(records), deduplicate_records, records, dedup)
+        trace.lap("filter")
+        trace.counters["entries_archived"] = len(records)
+        if archive_end >= end_dt:
+            trace.source = "archive"
+            plan = QueryPlan(STRATEGY_ARCHIVE, transport="archive")
+            filtered, archived = archived, None
+            _LOGGER.debug("Query answered from the event archive")
+        else:
+            # The rest of the window is fetched as usual, with its own deduplicator counts for the
+            # planner. It continues from the archived states; a newest-first fetch is seeded once
+            # it is known to reach the archived part.
+            archive_dedup = dedup
+            dedup = EntryDeduplicator(candidate_entities)
+            if not newest_first:
+                dedup.last_states = archive_dedup.last_states
+            start_dt = archive_end
+            start_str = start_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    buffer = runtime.get("buffer") if runtime else None
+    backend = get_option(runtime, CONF_BACKEND, DEFAULT_BACKEND)
+    if filtered is None and buffer is not None and buffer.covers(start_dt, end_dt):
+        # The whole window is held by the in-memory event buffer
+        trace.source = "buffer"
+        plan = QueryPlan(STRATEGY_BUFFER, transport="buffer")
+        raw_entries = buffer.entries(candidate_entities, start_dt, end_dt)
+        trace.lap("fetch")
+        filtered = await run_offloaded(hass, len(raw_entries), deduplicate_records, raw_entries, dedup)
+        trace.lap("filter")
+        _LOGGER.debug("Query answered from the event buffer")
+    elif filtered is None and backend == BACKEND_RECORDER:
+        # Read straight from the recorder database, skipping the loopback HTTP call
+        trace.source = "recorder"
+        raw_entries = await fetch_recorder_entries(hass, candidate_entities, start_dt, end_dt)
+        trace.lap("fetch")
+        if raw_entries is None:
+            _LOGGER.warning("Recorder backend failed, falling back to the logbook API.")
+        else:
+            plan = QueryPlan(STRATEGY_RECORDER, transport="recorder")
+            filtered = await run_offloaded(hass, len(raw_entries), deduplicate_records, raw_entries, dedup)
+            trace.lap("filter")
+
+    if summary:
+        budget = None
+    elif compact:
+        # A collapsed run holds any number of events, so only max_events bounds a compact answer
+        budget = max_events or None
+    else:
+        budget = event_budget(char_limit, max_events)
+    if filtered is None:
+        # The URL of this instance is resolved at setup; without a runtime the configured URLs are used
+        instance_url = runtime.get("base_url") if runtime else None
+        base_url = f"{instance_url or hass.config.internal_url or hass.config.external_url}/api/logbook/"
+        url = base_url + start_str
+        headers = {"Authorization": f"Bearer {ha_token}", "Content-Type": "application/json"}
+        params = {"end_time": end_str}
+
+        # Reuse the long-lived HTTP client of the config entry when available
+        client = runtime.get("client") if runtime else None
+        trace.source = "http"
+        # Client counters are shared, so queries running at the same time blur each other's numbers
+        client_stats = dict(client.stats) if client is not None else None
+
+        candidate_ids = dedup.candidate_ids
+        websocket = runtime.get("websocket") if runtime and backend == BACKEND_WEBSOCKET else None
+        if websocket is not None:
+            trace.source = "websocket"
+            websocket_stats = dict(websocket.stats)
+
+        # Plan the retrieval: per-entity, batched or full fetch, each optionally time-sharded
+        shard_hours = get_option(runtime, CONF_SHARD_HOURS, DEFAULT_SHARD_HOURS)
+        shard_span = timedelta(hours=shard_hours) if shard_hours else None
+        shard_count = 1
+        if shard_span and not newest_first and end_dt - start_dt > shard_span:
+            shard_count = len(split_time_range(start_dt, end_dt, shard_span))
+        sorted_ids = sorted(candidate_ids)
+        batch_count = None
+        if websocket is not None:
+            # The entity list of a websocket command is not limited by the URL length
+            if len(sorted_ids) <= max(max_batched, max_iter - 1):
+                batch_count = 1
+        elif 1 < len(sorted_ids) <= max_batched:
+            batch_count = len(batch_entity_ids(sorted_ids, batch_max_length(url, end_str)))
+        entity_registry = hass.data.get("entity_registry")
+        total_entities = len(entity_registry.entities) if entity_registry else len(sorted_ids)
+        fetch_hours = max(0.0, (min(end_dt, now) - start_dt).total_seconds() / 3600)
+        planner = runtime.get("planner") if runtime else None
+        if planner is None:
+            planner = QueryPlanner()
+        plan = planner.plan(
+            sorted_ids, fetch_hours, total_entities, max_iter, batch_count, shard_count, concurrency,
+            "websocket" if websocket is not None else "http"
+        )
+        _LOGGER.debug("Query plan: %s; rejected: %s", plan, plan.alternatives)
+
+        streaming = get_option(runtime, CONF_STREAMING, DEFAULT_STREAMING)
+
+        def keep_candidate(entity_id, state):
+            if entity_id in candidate_ids:
+                return True
+            trace.count("prefiltered")
+            return False
+
+        def fetch_failed(error):
+            # Entries of this query are missing, so its result must not be cached
+            trace.count("fetch_errors")
+
+        async def fetch_window(window_start, window_end, raise_errors=False):
+            window_start_str = window_start.strftime("%Y-%m-%dT%H:%M:%SZ")
+            window_end_str = window_end.strftime("%Y-%m-%dT%H:%M:%SZ")
+            records = None
+            if websocket is not None:
+                try:
+                    records = await get_websocket_entries(
+                        websocket, window_start_str, window_end_str, candidate_entities, plan.strategy
+                    )
+                except LogbookFetchError as e:
+                    _LOGGER.warning("%s, falling back to the logbook API.", e)
+            if records is None:
+                # A websocket plan does not fit the REST API, so its fallback uses the option thresholds
+                records = await get_raw_entries(
+                    hass, base_url + window_start_str, headers,
+                    {"end_time": window_end_str}, candidate_entities, window_end_str, max_iter,
+                    client, concurrency, streaming=streaming, raise_errors=raise_errors, max_batched=max_batched,
+                    strategy=plan.strategy if websocket is None else None,
+                    keep=keep_candidate if candidate_ids else None, on_error=fetch_failed
+                )
+            # Non-candidates never reach the output, so they are dropped before the
+            # sub-windows are held in memory together
+            if not candidate_ids:
+                return records
+            kept = [record for record in records if record.entity_id in candidate_ids]
+            trace.count("prefiltered", len(records) - len(kept))
+            return kept
+
+        windows = None
+        if plan.shards > 1:
+            windows = split_time_range(start_dt, end_dt, shard_span)
+        elif websocket is not None or plan.strategy != STRATEGY_FULL or not streaming:
+            # Only the streamed full fetch stops at the output budget on its own
+            span = budget_span(start_dt, end_dt, budget, plan.entries)
+            if span is not None:
+                windows = split_time_range(start_dt, end_dt, span)
+
+        if newest_first:
+            records, fetched_from = await fetch_newest_first(fetch_window, start_dt, end_dt, candidate_entities, budget)
+            if archived is not None:
+                if fetched_from > start_dt:
+                    # The budget was filled before the fetch reached the archived part, which would only follow a gap
+                    archived = []
+                else:
+                    dedup.last_states = archive_dedup.last_states
+            trace.lap("fetch")
+            filtered = await run_offloaded(hass, len(records), deduplicate_records, records, dedup)
+            trace.lap("filter")
+        elif windows:
+            # Long ranges are split into fixed-size shards fetched in parallel, windows expected to
+            # overflow the output budget into sub-windows; they pass the deduplicator in time
+            # order and the fetch stops once the budget is filled
+            _LOGGER.debug("Fetching %d logbook windows of %s", len(windows), windows[0][1] - windows[0][0])
+            filtered = []
+            seconds = 0
+            last_second = None
+
+            async def consume(records):
+                nonlocal seconds, last_second
+                accepted = await run_offloaded(hass, len(records), deduplicate_records, records, dedup)
+                filtered.extend(accepted)
+                for record in accepted:
+                    second = int(record.ts)
+                    if second != last_second:
+                        seconds += 1
+                        last_second = second
+                return budget is not None and seconds >= budget
+
+            # Budget sub-windows are fetched one at a time, so none is fetched past the budget;
+            # the requests within a window still run in parallel
+            await fetch_sharded(
+                lambda shard_start, shard_end: fetch_window(shard_start, shard_end, raise_errors=True),
+                windows, consume, concurrency if plan.shards > 1 else 1, on_error=fetch_failed
+            )
+            # Filtering runs while the windows arrive, so it is part of the fetch time
+            trace.lap("fetch")
+        elif websocket is not None:
+            # A whole window arrives in one websocket message
+            records = await fetch_window(start_dt, end_dt)
+            trace.lap("fetch")
+            filtered = await run_offloaded(hass, len(records), deduplicate_records, records, dedup)
+            trace.lap("filter")
+        else:
+            # Call the new helper function to get, sort and filter raw entries
+            filtered = await get_raw_entries(
+                hass, url, headers, params, candidate_entities, params["end_time"], max_iter,
+                client, concurrency, dedup=dedup, streaming=streaming, limit=budget,
+                max_batched=max_batched, strategy=plan.strategy, on_error=fetch_failed
+            )
+            # Filtering runs while the entries arrive, so it is part of the fetch time
+            trace.lap("fetch")
+        if client is not None:
+            _LOGGER.debug("Logbook HTTP client stats: %s", client.stats)
+            trace.counters["http_calls"] = client.stats["requests"] - client_stats["requests"]
+            trace.counters["bytes_fetched"] = client.stats["bytes_received"] - client_stats["bytes_received"]
+        if websocket is not None:
+            trace.counters["websocket_requests"] = websocket.stats["requests"] - websocket_stats["requests"]
+            trace.counters["bytes_fetched"] = trace.counters.get("bytes_fetched", 0) + websocket.stats["bytes_received"] - websocket_stats["bytes_received"]
+
+    _LOGGER.debug("Logbook filtering: Total entries: %d, After candidate and state filtering: %d", dedup.total, len(filtered))
+    prefiltered = trace.counters.pop("prefiltered", 0)
+    trace.counters.update({
+        "entries_fetched": dedup.total + prefiltered,
+        "entries_filtered": len(filtered),
+        "dropped_candidate": dedup.dropped_candidate + prefiltered,
+        "dropped_unknown": dedup.dropped_unknown,
+        "dropped_repeated": dedup.dropped_repeated,
+    })
+
+    if plan is not None:
+        # Actual cost next to the estimate, to tune the planner's cost model from real data
+        requests = trace.counters.get("http_calls", 0) + trace.counters.get("websocket_requests", 0)
+        plan.record_actual(requests, trace.counters["entries_fetched"], trace.stages.get("fetch", 0.0) + trace.stages.get("filter", 0.0))
+        trace.plan = plan
+        _LOGGER.debug("Query plan: %s", plan)
+        # Windows cut short by newest-first fetching, a full output budget or a failed fetch would understate the rates
+        if plan.transport in ("http", "websocket") and not newest_first and not trace.counters.get("fetch_errors") and (budget is None or len(filtered) < budget):
+            counts = {}
+            for record in filtered:
+                counts[record.entity_id] = counts.get(record.entity_id, 0) + 1
+            planner.learn(
+                plan, sorted_ids, counts, fetch_hours,
+                dedup.total - dedup.dropped_candidate, trace.counters["entries_fetched"]
+            )
+
+    if archived is not None:
+        # Archived entries precede the fetched ones and count towards the totals of the query
+        filtered = archived + filtered
+        trace.count("entries_fetched", archive_dedup.total)
+        trace.count("entries_filtered", len(archived))
+        trace.count("dropped_candidate", archive_dedup.dropped_candidate)
+        trace.count("dropped_unknown", archive_dedup.dropped_unknown)
+        trace.count("dropped_repeated", archive_dedup.dropped_repeated)
+
+    if summary:
+        # One pass over the filtered entries; only one record per entity is enriched and formatted
+        summaries = await run_offloaded(hass, len(filtered), summarize_records, filtered, min(end_dt, now).timestamp())
+        inject_resolved_properties(hass, [s.record for s in summaries], ENRICHED_PROPERTIES)
+        format_stats = {}
+        result = format_summary(summaries, char_limit, format_stats)
+        trace.truncated = format_stats.get("truncated")
+        trace.lap("format")
+        if cache is not None and not trace.counters.get("fetch_errors"):
+            cache.put(cache_key, result, closed)
+        return result
+
+    # Steps 4-6: congestion control, enrichment and formatting
+    enrichment = EnrichmentContext(hass, ENRICHED_PROPERTIES)
+    if len(filtered) >= OFFLOAD_THRESHOLD:
+        # Registry and state lookups stay on the event loop; the executor only reads the projections
+        enrichment.prefetch(s.entity_id for s in candidate_entities)
+    format_stats = {}
+    result = await run_offloaded(
+        hass, len(filtered), format_records, hass, filtered, enrichment,
+        newest_first, compact, char_limit, max_events, format_stats, trace
+    )
+    trace.lap("format")
+    trace.truncated = format_stats.get("truncated")
+    trace.counters["dropped_congestion"] = format_stats["dropped_congestion"]
+    trace.counters["entities_enriched"] = enrichment.entities
+    trace.counters["events_output"] = format_stats.get("events", 0)
+    if cache is not None and trace.counters.get("fetch_errors"):
+        # A result with missing entries would be served until evicted; the next query fetches again
+        _LOGGER.debug("Query result not cached after %d failed fetches", trace.counters["fetch_errors"])
+    elif cache is not None:
+        cache.put(cache_key, result, closed)
+        _LOGGER.debug("Query result cached (closed window: %s). Cache stats: %s", closed, cache.stats)
+    return result
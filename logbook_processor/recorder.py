@@ -0,0 +1,85 @@
+import heapq
+import logging
+
+from .records import LogbookEvent, is_continuous
+
+_LOGGER = logging.getLogger(__name__)
+
+# Keep the IN (...) list well below the bound parameter limits of SQLite and MySQL
+ENTITY_CHUNK_SIZE = 500
+
+# Only real state changes end up in the logbook: the recorder leaves last_changed_ts
+# empty (or equal to last_updated_ts) when the state itself changed.
+_STATES_QUERY = """
+SELECT states_meta.entity_id, states.state, states.last_updated_ts
+FROM states
+JOIN states_meta ON states.metadata_id = states_meta.metadata_id
+WHERE states.last_updated_ts >= :start_ts
+  AND states.last_updated_ts < :end_ts
+  AND (states.last_changed_ts IS NULL OR states.last_changed_ts = states.last_updated_ts)
+  AND states_meta.entity_id IN :entity_ids
+ORDER BY states.last_updated_ts
+"""
+
+
+def _query_chunk(connection, entity_ids, start_ts, end_ts):
+    # Imported on first use, so loading the integration does not load SQLAlchemy
+    from sqlalchemy import bindparam, text
+
+    statement = text(_STATES_QUERY).bindparams(bindparam("entity_ids", expanding=True))
+    result = connection.execute(
+        statement,
+        {"start_ts": start_ts, "end_ts": end_ts, "entity_ids": list(entity_ids)},
+    )
+    return [tuple(row) for row in result]
+
+
+def query_recorder_states(engine, entity_ids, start_ts, end_ts):
+    """Read state changes of the given entities straight from the recorder database.
+
+    Runs blocking database I/O, so it must be called from an executor thread.
+    Returns LogbookEvent records ordered by time.
+    """
+    entity_ids = sorted(set(entity_ids))
+    if not entity_ids:
+        return []
+
+    with engine.connect() as connection:
+        chunks = [
+            _query_chunk(connection, entity_ids[i:i + ENTITY_CHUNK_SIZE], start_ts, end_ts)
+            for i in range(0, len(entity_ids), ENTITY_CHUNK_SIZE)
+        ]
+
+    rows = heapq.merge(*chunks, key=lambda row: row[2]) if len(chunks) > 1 else chunks[0]
+    # The database already stores epoch timestamps, so records are built without any parsing
+    return [
+        LogbookEvent(last_updated_ts, entity_id, state)
+        for entity_id, state, last_updated_ts in rows
+    ]
+
+
+async def fetch_recorder_entries(hass, candidate_entities, start_dt, end_dt):
+    # Only state changes are read; logbook events that are not state changes (automations
+    # and scripts triggered, logbook.log entries) are not in the states table
+    from homeassistant.components.recorder import get_instance
+
+    try:
+        instance = get_instance(hass)
+        # Same entities as the logbook: continuous sensors would flood the output
+        entity_ids = [state_obj.entity_id for state_obj in candidate_entities if not is_continuous(state_obj)]
+        entries = await instance.async_add_executor_job(
+            query_recorder_states, instance.engine, entity_ids, start_dt.timestamp(), end_dt.timestamp()
+        )
+    except Exception as e:
+        _LOGGER.error("Exception during recorder query: %s", e)
+        return None
+
+    # The database has no friendly names, take them from the current states
+    names = {
+        state_obj.entity_id: state_obj.attributes.get("friendly_name")
+        for state_obj in candidate_entities
+    }
+    for record in entries:
+        record.name = names.get(record.entity_id)
+    _LOGGER.debug("Recorder backend returned %d entries", len(entries))
+    return entries
@@ -0,0 +1,62 @@
+from datetime import datetime
+import logging
+import sys
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LogbookEvent:
+    """Compact logbook event passed through the filter, enrichment and format stages.
+
+    The timestamp is parsed once into epoch seconds, entity ids and states are
+    interned, and only the fields the pipeline uses are kept.
+    """
+
+    __slots__ = ("ts", "entity_id", "state", "name", "device_class", "area", "description", "properties")
+
+    def __init__(self, ts, entity_id, state, name=None):
+        self.ts = ts
+        self.entity_id = sys.intern(entity_id) if entity_id else entity_id
+        self.state = sys.intern(state) if state else state
+        self.name = name
+        self.device_class = None
+        self.area = None
+        self.description = None
+        self.properties = None  # per-entity projection shared by the records of the entity
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Build a record from a logbook API entry; raises ValueError on a bad timestamp."""
+        when = entry.get("when", "")
+        if isinstance(when, (int, float)):
+            ts = float(when)  # the websocket API sends epoch seconds
+        else:
+            ts = datetime.fromisoformat(when.replace("Z", "+00:00")).timestamp()
+        name = entry.get("name") or entry.get("attributes", {}).get("friendly_name")
+        return cls(ts, entry.get("entity_id"), entry.get("state"), name)
+
+    def copy(self):
+        record = LogbookEvent(self.ts, self.entity_id, self.state, self.name)
+        record.device_class = self.device_class
+        record.area = self.area
+        record.description = self.description
+        record.properties = self.properties
+        return record
+
+    def __repr__(self):
+        return f"LogbookEvent({self.ts!r}, {self.entity_id!r}, {self.state!r})"
+
+
+def is_continuous(state_obj):
+    """True for entities the logbook leaves out: those with a unit of measurement or state class."""
+    attributes = state_obj.attributes
+    return "unit_of_measurement" in attributes or "state_class" in attributes
+
+
+def records_from_entries(entries):
+    """Convert logbook API entries to records, dropping entries without a valid timestamp."""
+    for entry in entries:
+        try:
+            yield LogbookEvent.from_entry(entry)
+        except (TypeError, ValueError) as e:
+            _LOGGER.warning("Invalid timestamp in entry: %s", e)
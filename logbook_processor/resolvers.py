@@ -0,0 +1,127 @@
+import logging
+
+from .records import LogbookEvent
+
+_LOGGER = logging.getLogger(__name__)
+
+# Entities that are never enriched
+SKIPPED_ENTITIES = {"sensor.date_time"}
+
+# property -> resolver(context, registry entry, state); the state may be None
+RESOLVERS = {}
+
+
+def resolver(name):
+    """Register a per-entity property resolver under the given property name."""
+    def register(func):
+        RESOLVERS[name] = func
+        return func
+    return register
+
+
+class EnrichmentContext:
+    """Registries read once per query and the per-entity projections resolved from them.
+
+    Every property is resolved once per entity; records of the same entity share
+    the projection, and properties that are also record fields (area,
+    device_class) are copied onto the record.
+    """
+
+    def __init__(self, hass, properties):
+        self.hass = hass
+        self.entity_reg = hass.data.get("entity_registry")
+        self.device_reg = hass.data.get("device_registry")
+        self.area_reg = hass.data.get("area_registry")
+        unknown = [prop for prop in properties if prop not in RESOLVERS]
+        if unknown:
+            _LOGGER.warning("No resolver for properties: %s", unknown)
+        self.properties = [prop for prop in properties if prop in RESOLVERS]
+        self.fields = [prop for prop in self.properties if prop in LogbookEvent.__slots__]
+        self._projections = {}
+
+    @property
+    def entities(self):
+        return len(self._projections)
+
+    def project(self, entity_id):
+        """Resolved properties of an entity, or None if it is not enriched."""
+        try:
+            return self._projections[entity_id]
+        except KeyError:
+            projection = self._projections[entity_id] = self._resolve(entity_id)
+            return projection
+
+    def _resolve(self, entity_id):
+        if entity_id in SKIPPED_ENTITIES or not self.entity_reg:
+            return None
+        ent = self.entity_reg.entities.get(entity_id)
+        if not ent:
+            return None
+        state = self.hass.states.get(entity_id)
+        return {prop: RESOLVERS[prop](self, ent, state) for prop in self.properties}
+
+    def prefetch(self, entity_ids):
+        """Resolve the entities up front, so applying the projections needs no registry access."""
+        for entity_id in entity_ids:
+            self.project(entity_id)
+
+    def apply(self, record):
+        projection = self.project(record.entity_id)
+        if projection is None:
+            return
+        record.properties = projection
+        for field in self.fields:
+            setattr(record, field, projection[field])
+
+    # --- Registry helpers ---
+    def device(self, ent):
+        if not self.device_reg or not ent.device_id:
+            return None
+        return self.device_reg.devices.get(ent.device_id)
+
+    def area(self, ent):
+        # The entity's own area, otherwise the area of its device
+        area_id = ent.area_id
+        if not area_id:
+            device = self.device(ent)
+            area_id = device.area_id if device else None
+        if self.area_reg and area_id:
+            return self.area_reg.areas.get(area_id)
+        return None
+
+
+# --- Resolvers ---
+@resolver("area")
+def resolve_area(context, ent, state):
+    return context.area(ent)
+
+
+@resolver("area_name")
+def resolve_area_name(context, ent, state):
+    area = context.area(ent)
+    return area.name if area else None
+
+
+@resolver("device_name")
+def resolve_device_name(context, ent, state):
+    device = context.device(ent)
+    if not device:
+        return None
+    return getattr(device, "name_by_user", None) or getattr(device, "name", None)
+
+
+@resolver("device_class")
+def resolve_device_class(context, ent, state):
+    return state.attributes.get("device_class") if state else None
+
+
+@resolver("unit")
+def resolve_unit(context, ent, state):
+    return state.attributes.get("unit_of_measurement") if state else None
+
+
+@resolver("friendly_name")
+def resolve_friendly_name(context, ent, state):
+    if state and state.attributes.get("friendly_name"):
+        return state.attributes["friendly_name"]
+    return getattr(ent, "name", None) or getattr(ent, "original_name", None)
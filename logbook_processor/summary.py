@@ -0,0 +1,67 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# question_type that answers with per-entity aggregates instead of one row per event
+SUMMARY_QUESTION_TYPE = "summary"
+
+
+class StateStats:
+    """How often an entity entered a state, how long it stayed there and when."""
+
+    __slots__ = ("count", "seconds", "first", "last")
+
+    def __init__(self, ts):
+        self.count = 0
+        self.seconds = 0.0
+        self.first = ts
+        self.last = ts
+
+
+class EntitySummary:
+    """Aggregates of one entity, updated one time-ordered record at a time."""
+
+    __slots__ = ("record", "states", "current", "since")
+
+    def __init__(self, record):
+        # The first record represents the entity (name, device class) in the output
+        self.record = record.copy()
+        self.states = {}  # state -> StateStats, in order of first occurrence
+        self.current = None
+        self.since = None
+
+    def add(self, record):
+        self.close(record.ts)
+        stats = self.states.get(record.state)
+        if stats is None:
+            stats = self.states[record.state] = StateStats(record.ts)
+        stats.count += 1
+        stats.last = record.ts
+        self.current = stats
+        self.since = record.ts
+
+    def close(self, ts):
+        # Time before the first event of the window is not attributed, its state is unknown
+        if self.current is not None:
+            self.current.seconds += max(0.0, ts - self.since)
+            self.since = ts
+
+
+def summarize_records(records, end_ts):
+    """Aggregate time-ordered records per entity in a single pass.
+
+    Returns the EntitySummary objects in order of the first event of each entity.
+    The state an entity is in at the end of the window is counted up to end_ts.
+    """
+    summaries = {}
+    count = 0
+    for record in records:
+        summary = summaries.get(record.entity_id)
+        if summary is None:
+            summary = summaries[record.entity_id] = EntitySummary(record)
+        summary.add(record)
+        count += 1
+    for summary in summaries.values():
+        summary.close(end_ts)
+    _LOGGER.debug("Summarized %d entries of %d entities", count, len(summaries))
+    return list(summaries.values())
@@ -0,0 +1,103 @@
+import logging
+
+# numpy is optional, without it the pure Python engine is used. It is imported on the
+# first large batch instead of at startup; large batches run in an executor thread.
+np = None
+_numpy_loaded = False
+
+_LOGGER = logging.getLogger(__name__)
+
+# Below this many entries the array setup costs more than the Python loops
+VECTORIZE_THRESHOLD = 20000
+
+# State code of "unknown"; a previous state that is not part of the batch gets NO_STATE
+UNKNOWN_CODE = 0
+NO_STATE = -1
+
+
+def load_numpy():
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            _LOGGER.debug("NumPy is not available, using the pure Python engine")
+        _numpy_loaded = True
+    return np
+
+
+def use_vectorized(count):
+    return count >= VECTORIZE_THRESHOLD and load_numpy() is not None
+
+
+def factorize(values, codes=None):
+    """Encode values as an int array; codes maps every distinct value to its code."""
+    codes = {} if codes is None else codes
+    for value in dict.fromkeys(values):
+        codes.setdefault(value, len(codes))
+    array = np.fromiter(map(codes.__getitem__, values), dtype=np.int64, count=len(values))
+    return array, codes
+
+
+def dedup_mask(entity_codes, state_codes, initial_states, candidates):
+    """Mask of the entries accepted by the repeated and unknown state filter.
+
+    Mirrors EntryDeduplicator.accept for time-ordered entries: a candidate entry is
+    accepted if it is not "unknown" and the previous state of the same entity was
+    neither the same state nor "unknown". initial_states holds the state code each
+    entity had before the batch (NO_STATE if none), candidates is a bool per entity.
+    Returns (mask, last_index) where last_index is the last entry of every entity.
+    """
+    count = len(entity_codes)
+    # A stable sort of 16 bit keys is a radix sort, which matters with many entries
+    keys = entity_codes.astype(np.int16) if len(candidates) <= np.iinfo(np.int16).max else entity_codes
+    order = np.argsort(keys, kind="stable")
+    entities = entity_codes[order]
+    states = state_codes[order]
+
+    first = np.ones(count, dtype=bool)
+    first[1:] = entities[1:] != entities[:-1]
+    previous = np.empty(count, dtype=np.int64)
+    previous[1:] = states[:-1]
+    previous[first] = initial_states[entities[first]]
+
+    accepted = candidates[entities] & (states != UNKNOWN_CODE) & (previous != states) & (previous != UNKNOWN_CODE)
+    mask = np.empty(count, dtype=bool)
+    mask[order] = accepted
+
+    last = np.ones(count, dtype=bool)
+    last[:-1] = entities[1:] != entities[:-1]
+    last_index = np.full(len(candidates), -1, dtype=np.int64)
+    last_index[entities[last]] = order[last]
+    return mask, last_index
+
+
+def congestion_plan(timestamps, events_per_second, summarize):
+    """Select the entries kept by per-second congestion control.
+
+    Entries are grouped by consecutive equal seconds. With skip the first
+    events_per_second entries of every group are kept; with summarize a group over
+    the limit is reduced to its first entry. Returns (indices, summarized, extra,
+    seconds) for the kept entries, extra being the number of entries folded into
+    a summarized one.
+    """
+    seconds = np.asarray(timestamps, dtype=np.float64).astype(np.int64)
+    count = len(seconds)
+    new_group = np.ones(count, dtype=bool)
+    new_group[1:] = seconds[1:] != seconds[:-1]
+    starts = np.flatnonzero(new_group)
+    sizes = np.diff(np.append(starts, count))
+    group = np.cumsum(new_group) - 1
+    rank = np.arange(count) - starts[group]
+    size = sizes[group]
+
+    if summarize:
+        over = size > events_per_second
+        keep = ~over | (rank == 0)
+    else:
+        over = np.zeros(count, dtype=bool)
+        keep = rank < events_per_second
+    indices = np.flatnonzero(keep)
+    _LOGGER.debug("Vectorized congestion control kept %d of %d entries", len(indices), count)
+    return indices, over[indices], size[indices] - 1, seconds[indices]
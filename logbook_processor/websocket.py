@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1  # seconds, doubled after every further failed attempt
+RECONNECT_MAX_DELAY = 60
+HEARTBEAT = 30  # seconds between pings that keep an idle connection open
+
+
+class WebsocketError(Exception):
+    """Raised when a websocket request fails or its connection is lost."""
+
+
+class LogbookWebsocket:
+    """One authenticated websocket connection shared by all logbook requests of a config entry.
+
+    Concurrent requests are multiplexed over the connection by message id. A lost
+    connection fails the requests waiting on it and is opened again by the next
+    request. After a failed attempt requests fail at once until a backoff delay,
+    doubled with every further failure, has passed.
+    """
+
+    def __init__(self, url, token, request_timeout=30, connect_timeout=10):
+        self.url = url
+        self.token = token
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self._session = None
+        self._ws = None
+        self._reader = None
+        self._lock = asyncio.Lock()
+        self._pending = {}  # message id -> future of the current connection
+        self._next_id = 1
+        self._failures = 0
+        self._retry_at = 0.0
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "connects": 0,
+            "bytes_received": 0,
+        }
+
+    @staticmethod
+    def url_from_base(base_url):
+        # http://host:8123 -> ws://host:8123/api/websocket, https -> wss
+        return base_url.rstrip("/").replace("http", "ws", 1) + "/api/websocket"
+
+    @property
+    def connected(self):
+        return self._ws is not None and not self._ws.closed
+
+    async def _ensure_connected(self):
+        if self.connected:
+            return
+        async with self._lock:
+            if self.connected:
+                return
+            loop = asyncio.get_running_loop()
+            delay = self._retry_at - loop.time()
+            if delay > 0:
+                # Fail fast during the backoff, so callers can use another transport meanwhile
+                raise WebsocketError(f"Not connected, next attempt to reconnect in {delay:.0f}s")
+            try:
+                await self._connect()
+            except Exception as e:
+                self._failures += 1
+                self._retry_at = loop.time() + min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** (self._failures - 1))
+                raise WebsocketError(f"Cannot connect to {self.url}: {e}") from e
+            self._failures = 0
+            self._retry_at = 0.0
+
+    async def _connect(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        # Logbook results can be far larger than aiohttp's default 4 MiB message limit
+        ws = await asyncio.wait_for(
+            self._session.ws_connect(self.url, heartbeat=HEARTBEAT, max_msg_size=0),
+            self.connect_timeout,
+        )
+        try:
+            message = await asyncio.wait_for(ws.receive_json(), self.connect_timeout)
+            if message.get("type") == "auth_required":
+                await ws.send_json({"type": "auth", "access_token": self.token})
+                message = await asyncio.wait_for(ws.receive_json(), self.connect_timeout)
+            if message.get("type") != "auth_ok":
+                raise WebsocketError(f"Authentication failed: {message.get('message', message.get('type'))}")
+        except BaseException:
+            await ws.close()
+            raise
+        self._ws = ws
+        self._pending = {}
+        self.stats["connects"] += 1
+        self._reader = asyncio.create_task(self._read(ws, self._pending))
+        _LOGGER.debug("Connected logbook websocket to %s", self.url)
+
+    async def _read(self, ws, pending):
+        # Hand every result to the request waiting for its id until the connection ends
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                self.stats["bytes_received"] += len(message.data)
+                data = json.loads(message.data)
+                # Coalesced messages arrive as a list
+                for item in data if isinstance(data, list) else (data,):
+                    future = pending.pop(item.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(item)
+        except Exception as e:
+            _LOGGER.warning("Logbook websocket read failed: %s", e)
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(WebsocketError("Websocket connection lost"))
+            pending.clear()
+            _LOGGER.debug("Logbook websocket connection to %s closed", self.url)
+
+    async def request(self, message):
+        """Send a command and return the result of its response."""
+        await self._ensure_connected()
+        ws = self._ws
+        pending = self._pending
+        message_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        pending[message_id] = future
+        self.stats["requests"] += 1
+        try:
+            await ws.send_json({"id": message_id, **message})
+            response = await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError as e:
+            self.stats["errors"] += 1
+            raise WebsocketError(f"No response to {message['type']} within {self.request_timeout}s") from e
+        except WebsocketError:
+            self.stats["errors"] += 1
+            raise
+        except (aiohttp.ClientError, ConnectionError, RuntimeError) as e:
+            self.stats["errors"] += 1
+            raise WebsocketError(f"Sending {message['type']} failed: {e}") from e
+        finally:
+            pending.pop(message_id, None)
+        if not response.get("success"):
+            self.stats["errors"] += 1
+            error = response.get("error") or {}
+            raise WebsocketError(f"{message['type']} failed: {error.get('code')} {error.get('message')}")
+        return response.get("result")
+
+    async def get_events(self, start_time, end_time=None, entity_ids=None):
+        """Logbook entries of a window, optionally only of the given entities."""
+        message = {"type": "logbook/get_events", "start_time": start_time}
+        if end_time:
+            message["end_time"] = end_time
+        if entity_ids:
+            message["entity_ids"] = list(entity_ids)
+        return await self.request(message)
+
+    async def async_close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        self._ws = None
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        _LOGGER.debug("Closed logbook websocket. Stats: %s", self.stats)
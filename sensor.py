@@ -0,0 +1,82 @@
+import logging
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo
+
+from .const import DOMAIN
+from .logbook_processor.metrics import STAGES
+
+_LOGGER = logging.getLogger(__name__)
+
+# key, name, metric, percentile, unit; durations are reported in milliseconds
+SENSORS = [
+    ("query_duration_p50", "Query duration p50", "total", 50, UnitOfTime.MILLISECONDS),
+    ("query_duration_p95", "Query duration p95", "total", 95, UnitOfTime.MILLISECONDS),
+    ("entries_fetched_p50", "Entries fetched p50", "entries_fetched", 50, "entries"),
+    ("entries_fetched_p95", "Entries fetched p95", "entries_fetched", 95, "entries"),
+    ("http_calls_p95", "HTTP calls p95", "http_calls", 95, "calls"),
+    ("output_chars_p95", "Output characters p95", "result_chars", 95, "characters"),
+]
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities):
+    metrics = hass.data[DOMAIN][entry.entry_id]["metrics"]
+    async_add_entities(QueryMetricSensor(entry, metrics, *sensor) for sensor in SENSORS)
+
+
+class QueryMetricSensor(SensorEntity):
+    """Rolling percentile of a log query metric over the recent queries."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, entry, metrics, key, name, metric, percent, unit):
+        self._metrics = metrics
+        self._metric = metric
+        self._percent = percent
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self._attr_name = name
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name="Logbook Expose",
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+    @property
+    def _is_duration(self):
+        return self._metric == "total" or self._metric in STAGES
+
+    @property
+    def native_value(self):
+        value = self._metrics.percentile(self._metric, self._percent)
+        if value is None:
+            return None
+        return round(value * 1000, 1) if self._is_duration else value
+
+    @property
+    def extra_state_attributes(self):
+        attributes = {
+            "queries": self._metrics.queries,
+            "window": len(self._metrics.traces),
+        }
+        if self._is_duration:
+            # Same percentile for every stage, so a slow query shows where its time went
+            for stage in STAGES:
+                value = self._metrics.percentile(stage, self._percent)
+                if value is not None:
+                    attributes[f"{stage}_ms"] = round(value * 1000, 1)
+            attributes["truncated"] = sum(1 for trace in self._metrics.traces if trace.truncated)
+        return attributes
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._metrics.add_listener(self._async_metrics_updated))
+
+    @callback
+    def _async_metrics_updated(self):
+        self.async_write_ha_state()
@@ -0,0 +1,57 @@
+"""Load the integration as the logbook_expose package, as Home Assistant does from custom_components.
+
+Only the package path is registered; __init__.py is not executed, so the
+pure-Python modules can be tested without Home Assistant installed.
+"""
+import pathlib
+import sys
+import types
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+if "logbook_expose" not in sys.modules:
+    package = types.ModuleType("logbook_expose")
+    package.__path__ = [str(ROOT)]
+    sys.modules["logbook_expose"] = package
+
+# The columns of the recorder schema the recorder backend and the archive read
+RECORDER_SCHEMA = (
+    "CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id VARCHAR(255))",
+    "CREATE TABLE states ("
+    " state_id INTEGER PRIMARY KEY, metadata_id INTEGER, state VARCHAR(255),"
+    " last_updated_ts FLOAT, last_changed_ts FLOAT)",
+)
+
+
+@pytest.fixture
+def recorder_engine():
+    """Factory of in-memory recorder databases; rows are (entity_id, state, last_updated_ts, last_changed_ts)."""
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    from sqlalchemy.pool import StaticPool
+
+    def create(entity_ids, rows):
+        engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+        metadata_ids = {entity_id: i + 1 for i, entity_id in enumerate(entity_ids)}
+        with engine.begin() as connection:
+            for statement in RECORDER_SCHEMA:
+                connection.execute(sqlalchemy.text(statement))
+            connection.execute(
+                sqlalchemy.text("INSERT INTO states_meta (metadata_id, entity_id) VALUES (:metadata_id, :entity_id)"),
+                [{"metadata_id": metadata_id, "entity_id": entity_id} for entity_id, metadata_id in metadata_ids.items()],
+            )
+            if rows:
+                connection.execute(
+                    sqlalchemy.text(
+                        "INSERT INTO states (metadata_id, state, last_updated_ts, last_changed_ts)"
+                        " VALUES (:metadata_id, :state, :last_updated_ts, :last_changed_ts)"
+                    ),
+                    [
+                        {"metadata_id": metadata_ids[entity_id], "state": state, "last_updated_ts": updated, "last_changed_ts": changed}
+                        for entity_id, state, updated, changed in rows
+                    ],
+                )
+        return engine
+
+    return create
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from logbook_expose.logbook_processor.query import prune_idle_candidates
+
+HOUR = 3600
+NOW = 1_760_000_000.0
+
+
+def state(entity_id, last_changed):
+    return SimpleNamespace(
+        entity_id=entity_id,
+        domain=entity_id.split(".")[0],
+        last_changed=datetime.fromtimestamp(last_changed, timezone.utc),
+    )
+
+
+class FakeActivity:
+    def __init__(self, idle_ids):
+        self.idle_ids = idle_ids
+
+    def idle(self, entity_id, start_ts, end_ts):
+        return entity_id in self.idle_ids
+
+
+def test_prune_by_last_changed():
+    candidates = [
+        state("light.idle", NOW - 5 * HOUR),
+        state("light.busy", NOW - 10),
+        state("automation.morning", NOW - 5 * HOUR),
+    ]
+    active = prune_idle_candidates(candidates, NOW - 2 * HOUR, NOW)
+    assert [s.entity_id for s in active] == ["light.busy", "automation.morning"]
+
+
+def test_prune_by_activity_index():
+    candidates = [state("light.a", NOW - 10), state("light.b", NOW - 10)]
+    active = prune_idle_candidates(candidates, NOW - 2 * HOUR, NOW, FakeActivity({"light.a"}))
+    assert [s.entity_id for s in active] == ["light.b"]
+
+
+def _event(entity_id, ts, old="off", new="on"):
+    new_state = SimpleNamespace(state=new, last_changed=datetime.fromtimestamp(ts, timezone.utc))
+    old_state = SimpleNamespace(state=old) if old is not None else None
+    return SimpleNamespace(data={"entity_id": entity_id, "new_state": new_state, "old_state": old_state})
+
+
+def test_activity_index_coverage():
+    pytest.importorskip("homeassistant")
+    from logbook_expose.logbook_processor.activity import ActivityIndex
+
+    hass = SimpleNamespace(
+        states=SimpleNamespace(async_entity_ids=lambda: ["light.a", "light.b"]),
+        bus=SimpleNamespace(async_listen=lambda event_type, listener: lambda: None),
+    )
+    index = ActivityIndex(hass, hours=4)
+    index.async_start()
+    start = index._started_at
+
+    index._async_state_changed(_event("light.a", start + 10))
+    # Appears after the start: unknown before its first event, observed after it
+    index._async_state_changed(_event("light.new", start + 2 * HOUR, old=None))
+
+    assert not index.idle("light.a", start, start + 60)
+    assert index.idle("light.a", start + 1.5 * HOUR, start + 2.5 * HOUR)
+    assert index.idle("light.b", start + 10, start + HOUR)
+    assert not index.idle("light.b", start - 10, start + HOUR)
+    assert not index.idle("light.new", start + HOUR, start + 1.5 * HOUR)
+    assert index.idle("light.new", start + 3 * HOUR, start + 3.5 * HOUR)
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from logbook_expose.logbook_processor.archive import DAY, compact_archive, list_days, read_archive
+
+DAY_START = 1_760_054_400  # 2025-10-10 00:00 UTC
+ENTITY_IDS = ["light.a", "light.b"]
+
+
+def _rows():
+    return [
+        ("light.a", "on", DAY_START + 3600, None),
+        ("light.b", "on", DAY_START + 7200, None),
+        ("light.a", "off", DAY_START + DAY - 1, None),
+    ]
+
+
+def test_day_is_sealed_after_the_delay(tmp_path, recorder_engine):
+    engine = recorder_engine(ENTITY_IDS, _rows())
+    directory = str(tmp_path)
+
+    # Just after midnight the recorder may not have committed the end of the day yet
+    assert compact_archive(engine, directory, ENTITY_IDS, DAY_START + DAY + 60, 2, 30, seal_delay=300) == (0, 0, 0)
+    assert list_days(directory) == []
+
+    assert compact_archive(engine, directory, ENTITY_IDS, DAY_START + DAY + 301, 2, 30, seal_delay=300) == (1, 3, 0)
+    assert list_days(directory) == [DAY_START]
+    records = read_archive(directory, {"light.a": "A", "light.b": "B"}, DAY_START, DAY_START + DAY)
+    assert [(r.ts, r.entity_id, r.state, r.name) for r in records] == [
+        (DAY_START + 3600, "light.a", "on", "A"),
+        (DAY_START + 7200, "light.b", "on", "B"),
+        (DAY_START + DAY - 1, "light.a", "off", "A"),
+    ]
+
+
+def test_old_days_are_pruned(tmp_path, recorder_engine):
+    engine = recorder_engine(ENTITY_IDS, _rows())
+    directory = str(tmp_path)
+    compact_archive(engine, directory, ENTITY_IDS, DAY_START + DAY + 3600, 2, 30)
+    assert compact_archive(engine, directory, ENTITY_IDS, DAY_START + 5 * DAY, 2, 2) == (2, 0, 1)
+    assert list_days(directory) == [DAY_START + 3 * DAY, DAY_START + 4 * DAY]
+    assert not os.path.exists(os.path.join(directory, "2025-10-10.lba"))
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from logbook_expose.logbook_processor import buffer as buffer_module
+from logbook_expose.logbook_processor.buffer import EventBuffer
+
+START = 1_760_000_000.0
+
+
+class FakeBus:
+    def __init__(self):
+        self.listeners = []
+
+    def async_listen(self, event_type, listener):
+        self.listeners.append(listener)
+        return lambda: self.listeners.remove(listener)
+
+    def state_changed(self, entity_id, old, new, ts, **attributes):
+        def state(value):
+            if value is None:
+                return None
+            return SimpleNamespace(state=value, attributes=attributes, last_changed=datetime.fromtimestamp(ts, timezone.utc))
+
+        data = {"entity_id": entity_id, "old_state": state(old), "new_state": state(new)}
+        for listener in list(self.listeners):
+            listener(SimpleNamespace(data=data))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [START]
+    monkeypatch.setattr(buffer_module.time, "time", lambda: now[0])
+    return now
+
+
+def _buffer(clock, hours=1, max_events=100):
+    bus = FakeBus()
+    hass = SimpleNamespace(bus=bus)
+    event_buffer = EventBuffer(hass, lambda entity_id: entity_id != "light.hidden", hours, max_events)
+    event_buffer.async_start()
+    return event_buffer, bus
+
+
+def _candidates(*entity_ids):
+    return [SimpleNamespace(entity_id=entity_id, attributes={"friendly_name": entity_id.upper()}) for entity_id in entity_ids]
+
+
+def _window(start, end):
+    return datetime.fromtimestamp(start, timezone.utc), datetime.fromtimestamp(end, timezone.utc)
+
+
+def test_only_state_changes_of_exposed_entities(clock):
+    event_buffer, bus = _buffer(clock)
+    bus.state_changed("light.a", "off", "on", START + 1)
+    # Attribute-only update, new and removed entities
+    bus.state_changed("light.a", "on", "on", START + 2)
+    bus.state_changed("light.b", None, "on", START + 3)
+    bus.state_changed("light.b", "on", None, START + 4)
+    bus.state_changed("light.hidden", "off", "on", START + 5)
+    bus.state_changed("sensor.t", "20", "21", START + 6, unit_of_measurement="°C")
+    bus.state_changed("light.b", "off", "on", START + 7)
+    records = event_buffer.entries(_candidates("light.a", "light.b", "light.hidden", "sensor.t"), *_window(START, START + 10))
+    assert [(r.ts, r.entity_id, r.state, r.name) for r in records] == [
+        (START + 1, "light.a", "on", "LIGHT.A"),
+        (START + 7, "light.b", "on", "LIGHT.B"),
+    ]
+
+
+def test_entries_of_candidates_in_window(clock):
+    event_buffer, bus = _buffer(clock)
+    for i in range(10):
+        bus.state_changed("light.a" if i % 2 else "light.b", "off", "on", START + i)
+    records = event_buffer.entries(_candidates("light.a"), *_window(START + 3, START + 7))
+    assert [r.ts for r in records] == [START + 3, START + 5]
+
+
+def test_horizon_drops_old_events(clock):
+    event_buffer, bus = _buffer(clock, hours=1)
+    bus.state_changed("light.a", "off", "on", START)
+    bus.state_changed("light.a", "on", "off", START + 3600)
+    bus.state_changed("light.a", "off", "on", START + 3601)
+    records = event_buffer.entries(_candidates("light.a"), *_window(START - 10, START + 4000))
+    assert [r.ts for r in records] == [START + 3600, START + 3601]
+
+
+def test_coverage(clock):
+    event_buffer, bus = _buffer(clock, hours=1, max_events=3)
+    # Nothing before the start is known
+    clock[0] = START + 600
+    assert event_buffer.covers(*_window(START, START + 600))
+    assert not event_buffer.covers(*_window(START - 1, START + 600))
+    # Windows may not reach into the future
+    assert not event_buffer.covers(*_window(START, START + 601))
+
+    # Later only the last hour is kept
+    clock[0] = START + 7200
+    assert event_buffer.coverage_start == START + 3600
+
+    # Once maxlen pushes events out, coverage starts at the oldest kept event
+    for ts in (START + 7000, START + 7100, START + 7150, START + 7190):
+        bus.state_changed("light.a", "off", "on", ts)
+    assert event_buffer.coverage_start == START + 7100
+    assert not event_buffer.covers(*_window(START + 7050, START + 7200))
+
+
+def test_stop(clock):
+    event_buffer, bus = _buffer(clock)
+    bus.state_changed("light.a", "off", "on", START)
+    event_buffer.async_stop()
+    assert bus.listeners == []
+    assert event_buffer.entries(_candidates("light.a"), *_window(START, START + 10)) == []
@@ -0,0 +1,89 @@
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from logbook_expose.logbook_processor import cache as cache_module
+from logbook_expose.logbook_processor.cache import QueryCache
+
+START = datetime(2026, 1, 1, 8, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_closed_windows_do_not_expire(clock):
+    cache = QueryCache(open_ttl=30)
+    cache.put("closed", "result", closed=True)
+    clock[0] += 10**6
+    assert cache.get("closed") == "result"
+
+
+def test_open_windows_expire(clock):
+    cache = QueryCache(open_ttl=30)
+    cache.put("open", "result", closed=False)
+    clock[0] += 29
+    assert cache.get("open") == "result"
+    clock[0] += 1
+    assert cache.get("open") is None
+    assert cache.stats == {"entries": 0, "bytes": 0, "hits": 1, "misses": 1, "evictions": 0}
+    # Storing it again restarts the TTL
+    cache.put("open", "newer", closed=False)
+    clock[0] += 29
+    assert cache.get("open") == "newer"
+
+
+def test_least_recently_used_is_evicted():
+    size = sys.getsizeof("a" * 100)
+    cache = QueryCache(max_bytes=3 * size)
+    for key in "abc":
+        cache.put(key, key * 100, closed=True)
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == "a" * 100
+    cache.put("d", "d" * 100, closed=True)
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["bytes"] == 3 * size
+
+
+def test_replacing_a_key_keeps_the_size():
+    cache = QueryCache()
+    cache.put("a", "x" * 100, closed=True)
+    cache.put("a", "y" * 10, closed=True)
+    assert cache.stats["entries"] == 1
+    assert cache.size == sys.getsizeof("y" * 10)
+
+
+def test_oversized_results_are_not_stored():
+    cache = QueryCache(max_bytes=100)
+    cache.put("a", "x" * 1000, closed=True)
+    assert cache.stats["entries"] == 0
+    assert cache.get("a") is None
+
+
+def test_make_key():
+    end = START + timedelta(hours=1)
+    # The order of the candidates does not matter
+    assert QueryCache.make_key(["light.a", "light.b"], START, end, None, True) == QueryCache.make_key(
+        ["light.b", "light.a"], START, end, None, True
+    )
+    # Open windows are keyed on the period name, within one day
+    later = timedelta(minutes=5)
+    assert QueryCache.make_key(["light.a"], START, end, "today", False) == QueryCache.make_key(
+        ["light.a"], START + later, end + later, "today", False
+    )
+    assert QueryCache.make_key(["light.a"], START, end, "today", False) != QueryCache.make_key(
+        ["light.a"], START + timedelta(days=1), end + timedelta(days=1), "today", False
+    )
+    # Closed windows and the extra parts are keyed exactly
+    assert QueryCache.make_key(["light.a"], START, end, "yesterday", True) != QueryCache.make_key(
+        ["light.a"], START + later, end, "yesterday", True
+    )
+    assert QueryCache.make_key(["light.a"], START, end, None, True, "on") != QueryCache.make_key(
+        ["light.a"], START, end, None, True, "off"
+    )
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from logbook_expose.logbook_processor.client import iter_json_array
+
+ENTRIES = [
+    {"when": "2025-10-09T08:00:00.123456+00:00", "entity_id": "light.kitchen", "state": "on", "name": "Kitchen light"},
+    {"when": "2025-10-09T08:05:00+00:00", "entity_id": "sensor.tv", "state": "2.5", "name": "Tévé \"nappali\" \\ ☃"},
+    {"when": "2025-10-09T08:10:00+00:00", "entity_id": "binary_sensor.door", "state": None, "context": {"ids": [1, 2.75, -3e2]}},
+]
+
+
+def _parse(chunks):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_json_array(source())]
+
+    return asyncio.run(collect())
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_whole_response():
+    assert _parse([json.dumps(ENTRIES).encode()]) == ENTRIES
+    assert _parse([b" [ ] "]) == []
+    assert _parse([b"[]"]) == []
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_split_chunks(size):
+    # Chunk borders fall inside strings, escapes, numbers and multi-byte UTF-8 characters
+    for data in (json.dumps(ENTRIES).encode(), json.dumps(ENTRIES, ensure_ascii=False, indent=1).encode()):
+        assert _parse(_split(data, size)) == ENTRIES
+
+
+def test_number_split_at_chunk_border():
+    # "2." must not be decoded as 2 before the rest of the number arrives
+    assert _parse([b"[1, 2.", b"75, 3", b"e2]"]) == [1, 2.75, 300.0]
+
+
+def test_items_are_yielded_while_streaming():
+    # Every item is available once the separator after it has arrived
+    seen = []
+
+    async def source():
+        yield b'[{"state": "on"},'
+        seen.append("first chunk consumed")
+        yield b' {"state": "off"}]'
+
+    async def collect():
+        items = []
+        async for item in iter_json_array(source()):
+            items.append((item, list(seen)))
+        return items
+
+    assert asyncio.run(collect()) == [({"state": "on"}, []), ({"state": "off"}, ["first chunk consumed"])]
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError, match="not a JSON array"):
+        _parse([b'{"state": "on"}'])
+
+
+def test_truncated_response():
+    with pytest.raises(ValueError, match="ended before"):
+        _parse([b'[{"state": "on"}, '])
+    with pytest.raises(json.JSONDecodeError):
+        _parse([b'[{"state": "o'])
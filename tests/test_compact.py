@@ -0,0 +1,83 @@
+from datetime import timezone
+
+import pytest
+
+from logbook_expose.logbook_processor import query
+from logbook_expose.logbook_processor.query import COMPACT_HEADER, format_compact_entries
+from logbook_expose.logbook_processor.records import LogbookEvent
+
+START = 1_760_000_000.0  # 2025-10-09 08:53:20 UTC
+
+
+@pytest.fixture(autouse=True)
+def utc(monkeypatch):
+    monkeypatch.setattr(query, "LOCAL_TZ", timezone.utc)
+
+
+def _event(offset, entity_id, state, name, device_class=None):
+    record = LogbookEvent(START + offset, entity_id, state, name)
+    record.device_class = device_class
+    return record
+
+
+def _records():
+    return [
+        _event(0, "binary_sensor.door", "on", "Front door", "door"),
+        _event(5, "light.hall", "on", "Hall"),
+        _event(65, "light.hall", "off", "Hall"),
+        _event(70, "light.hall", "on", "Hall"),
+        _event(80, "light.hall", "off", "Hall"),
+        _event(90, "light.hall", "on", "Hall"),
+        _event(100, "binary_sensor.door", "off", "Front door", "door"),
+        _event(86400, "light.hall", "off", "Hall"),
+    ]
+
+
+def test_legend_deltas_and_runs():
+    stats = {}
+    output = format_compact_entries(_records(), stats=stats)
+    assert output == COMPACT_HEADER + (
+        "Entities: E1=Front door; E2=Hall\n"
+        "Events: a=door opened; b=state changed to on; c=state changed to off; d=door closed\n"
+        "2025-10-09\n"
+        "08:53:20 E1 a\n"
+        # The alternating hall light events collapse into one run
+        "+0:05 E2 b c x5 over 0:01:25\n"
+        # The delta continues from the last event of the run
+        "+0:10 E1 d\n"
+        # A new day starts with an absolute time again
+        "2025-10-10\n"
+        "08:53:20 E2 c\n"
+    )
+    assert stats == {"events": 8}
+
+
+def test_max_events():
+    stats = {}
+    output = format_compact_entries(_records(), max_events=3, stats=stats)
+    assert output.endswith("2025-10-09\n08:53:20 E1 a\n+0:05 E2 b\n+1:00 E2 c\n")
+    assert "d=door closed" not in output
+    assert stats == {"truncated": "max_events", "events": 3}
+
+
+def _body(output):
+    # The event lines after the header and the legend
+    return output.split("\n", 3)[3]
+
+
+def test_char_limit_counts_the_legend():
+    full = format_compact_entries(_records())
+    empty = format_compact_entries([])
+    assert _body(empty) == ""
+    for char_limit in range(len(empty), len(full) + 1):
+        stats = {}
+        output = format_compact_entries(_records(), char_limit=char_limit, stats=stats)
+        assert len(output) <= char_limit
+        if len(output) < len(full):
+            assert stats["truncated"] == "char_limit"
+            # Only whole lines are written, each with its legend entries
+            assert _body(full).startswith(_body(output))
+            assert stats["events"] < 8
+        else:
+            assert "truncated" not in stats
+    assert format_compact_entries(_records(), char_limit=len(full)) == full
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from logbook_expose.logbook_processor import query
+from logbook_expose.logbook_processor.cache import QueryCache
+from logbook_expose.logbook_processor.planner import STRATEGY_PER_ENTITY, QueryPlan
+from logbook_expose.logbook_processor.query import LogbookFetchError, fetch_sharded, split_time_range
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _shards(count):
+    return split_time_range(START, START + timedelta(hours=count), timedelta(hours=1))
+
+
+def test_fetch_sharded_consumes_in_time_order():
+    shards = _shards(6)
+    consumed = []
+
+    async def fetch_window(shard_start, shard_end):
+        # Later shards finish first
+        await asyncio.sleep(0.001 * (START + timedelta(hours=6) - shard_start).total_seconds() / 3600)
+        return [shard_start]
+
+    async def consume(records):
+        consumed.extend(records)
+        return False
+
+    fetched_to = asyncio.run(fetch_sharded(fetch_window, shards, consume, concurrency=3))
+    assert consumed == [shard_start for shard_start, _ in shards]
+    assert fetched_to == shards[-1][1]
+
+
+def test_fetch_sharded_stops_at_budget():
+    shards = _shards(10)
+    started = []
+
+    async def fetch_window(shard_start, shard_end):
+        started.append(shard_start)
+        await asyncio.sleep(0)
+        return [shard_start]
+
+    async def consume(records):
+        return records[0] == shards[1][0]
+
+    fetched_to = asyncio.run(fetch_sharded(fetch_window, shards, consume, concurrency=2))
+    assert fetched_to == shards[1][1]
+    # Only the shards in flight when the budget was filled were started
+    assert len(started) <= 3
+
+
+def test_fetch_sharded_retries_failed_shard(monkeypatch):
+    monkeypatch.setattr(query, "SHARD_RETRY_DELAY", 0)
+    shards = _shards(3)
+    attempts = {}
+    consumed = []
+
+    async def fetch_window(shard_start, shard_end):
+        attempts[shard_start] = attempts.get(shard_start, 0) + 1
+        if shard_start == shards[1][0] and attempts[shard_start] == 1:
+            raise LogbookFetchError("temporary failure")
+        return [shard_start]
+
+    async def consume(records):
+        consumed.extend(records)
+        return False
+
+    asyncio.run(fetch_sharded(fetch_window, shards, consume))
+    assert consumed == [shard_start for shard_start, _ in shards]
+    assert attempts[shards[1][0]] == 2
+
+
+def test_budget_span():
+    end = START + timedelta(days=4)
+    assert query.budget_span(START, end, None, 10**6) is None
+    assert query.budget_span(START, end, 1000, 500) is None
+    # A quarter of the estimated entries fill the budget
+    assert query.budget_span(START, end, 1000, 4000) == timedelta(days=1)
+    # At most BUDGET_MAX_WINDOWS windows, none shorter than BUDGET_MIN_SPAN
+    assert query.budget_span(START, end, 1, 10**6) == timedelta(hours=12)
+    assert query.budget_span(START, START + timedelta(hours=2), 1, 10**6) == timedelta(hours=1)
+    assert query.budget_span(START, START + timedelta(minutes=30), 1, 10**6) is None
+
+
+class FakeIndex:
+    def __init__(self, states):
+        self.states = states
+
+    def candidates(self, entity_name_or_id=None, domain=None, device_classes=None, area_ids=None):
+        return list(self.states)
+
+
+class ShardingPlanner:
+    # Always fetches the candidates one by one in every shard
+    def plan(self, candidate_ids, hours, total_entities, per_entity_limit, batch_count, shard_count, concurrency, transport="http"):
+        return QueryPlan(STRATEGY_PER_ENTITY, shards=shard_count, transport=transport)
+
+    def learn(self, *args):
+        pass
+
+
+def test_failed_shard_is_not_cached(monkeypatch):
+    monkeypatch.setattr(query, "SHARD_RETRY_DELAY", 0)
+    end_dt = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=1)
+    start_dt = end_dt - timedelta(days=3)
+    failing = {(start_dt + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")}
+    entries = [
+        {"when": (start_dt + timedelta(hours=hours)).isoformat(), "entity_id": "light.hall", "state": state, "name": "Hall"}
+        for hours, state in ((6, "on"), (30, "off"), (54, "on"))
+    ]
+
+    async def logbook(request):
+        if request.match_info["start"] in failing:
+            return web.Response(status=500)
+        window_start = datetime.fromisoformat(request.match_info["start"].replace("Z", "+00:00"))
+        window_end = datetime.fromisoformat(request.query["end_time"].replace("Z", "+00:00"))
+        return web.json_response([
+            entry for entry in entries if window_start <= datetime.fromisoformat(entry["when"]) < window_end
+        ])
+
+    state = SimpleNamespace(entity_id="light.hall", domain="light", attributes={"friendly_name": "Hall"})
+    cache = QueryCache()
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/api/logbook/{start}", logbook)
+        server = TestServer(app)
+        await server.start_server()
+        hass = SimpleNamespace(
+            data={},
+            config=SimpleNamespace(internal_url=str(server.make_url("")).rstrip("/"), external_url=None),
+            states=SimpleNamespace(get=lambda entity_id: state if entity_id == state.entity_id else None),
+        )
+        runtime = {
+            "entry": SimpleNamespace(options={"activity_pruning": False, "shard_hours": 24}, data={}),
+            "index": FakeIndex([state]),
+            "cache": cache,
+            "planner": ShardingPlanner(),
+        }
+        local = query.LOCAL_TZ
+        window = {
+            "start_time": start_dt.astimezone(local).strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": end_dt.astimezone(local).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            partial = await query.run_log_query(hass, "token", "q", "custom", runtime=runtime, **window)
+            cached_after_failure = cache.stats["entries"]
+            failing.clear()
+            complete = await query.run_log_query(hass, "token", "q", "custom", runtime=runtime, **window)
+        finally:
+            await server.close()
+        return partial, cached_after_failure, complete
+
+    partial, cached_after_failure, complete = asyncio.run(main())
+    assert "state changed to off" not in partial
+    assert cached_after_failure == 0
+    # Once every shard is fetched the result is complete and cached
+    assert "state changed to off" in complete
+    assert cache.stats["entries"] == 1
@@ -0,0 +1,184 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from logbook_expose.logbook_processor.index import EntityIndex
+
+
+class FakeBus:
+    def __init__(self):
+        self.listeners = {}
+
+    def async_listen(self, event_type, listener):
+        self.listeners[event_type] = listener
+        return lambda: self.listeners.pop(event_type)
+
+    def fire(self, event_type, **data):
+        self.listeners[event_type](SimpleNamespace(data=data))
+
+
+class FakeHass:
+    def __init__(self):
+        self.bus = FakeBus()
+        self.states_by_id = {}
+        self.states = SimpleNamespace(get=self.states_by_id.get)
+        self.data = {
+            "entity_registry": SimpleNamespace(entities={}),
+            "device_registry": SimpleNamespace(devices={}),
+        }
+
+    def add(self, entity_id, area_id=None, device_id=None, expose=True, aliases=(), **attributes):
+        self.data["entity_registry"].entities[entity_id] = SimpleNamespace(
+            entity_id=entity_id,
+            area_id=area_id,
+            device_id=device_id,
+            options={"conversation": {"should_expose": expose}, "aliases": list(aliases)},
+        )
+        self.set_state(entity_id, **attributes)
+
+    def set_state(self, entity_id, **attributes):
+        self.states_by_id[entity_id] = SimpleNamespace(entity_id=entity_id, state="on", attributes=attributes)
+        return self.states_by_id[entity_id]
+
+    def rename(self, old_entity_id, entity_id):
+        entities = self.data["entity_registry"].entities
+        entities[entity_id] = entities.pop(old_entity_id)
+        entities[entity_id].entity_id = entity_id
+        self.states_by_id[entity_id] = self.states_by_id.pop(old_entity_id)
+        self.states_by_id[entity_id].entity_id = entity_id
+
+
+@pytest.fixture
+def hass():
+    hass = FakeHass()
+    hass.data["device_registry"].devices["dev1"] = SimpleNamespace(area_id="hall")
+    hass.add("light.kitchen", area_id="kitchen", friendly_name="Kitchen light")
+    hass.add("binary_sensor.door", device_id="dev1", device_class="door", friendly_name="Front door", aliases=["Entrance"])
+    hass.add("light.hall", device_id="dev1", friendly_name="Hall light")
+    hass.add("light.hidden", expose=False, friendly_name="Hidden light")
+    hass.add("sensor.date_time")
+    return hass
+
+
+@pytest.fixture
+def index(hass):
+    index = EntityIndex(hass)
+    index.async_start()
+    yield index
+    index.async_stop()
+
+
+def _ids(states):
+    return [state.entity_id for state in states]
+
+
+def assert_consistent(index):
+    # Every set holds exactly the entities whose keys put them there
+    expected = {}
+    for entity_id, (domain, device_classes, area_id, names, device_id, _) in index._keys.items():
+        expected.setdefault(("domain", domain), set()).add(entity_id)
+        for device_class in device_classes:
+            expected.setdefault(("device_class", device_class), set()).add(entity_id)
+        if area_id:
+            expected.setdefault(("area", area_id), set()).add(entity_id)
+        for name in names:
+            expected.setdefault(("name", name), set()).add(entity_id)
+        if device_id:
+            expected.setdefault(("device", device_id), set()).add(entity_id)
+    actual = {}
+    for kind, sets in (
+        ("domain", index.by_domain),
+        ("device_class", index.by_device_class),
+        ("area", index.by_area),
+        ("name", index.by_name),
+        ("device", index.device_entities),
+    ):
+        actual.update({(kind, key): entity_ids for key, entity_ids in sets.items()})
+    assert actual == expected
+    assert set(index._order) >= set(index._keys)
+
+
+def test_build(index):
+    assert _ids(index.candidates()) == ["light.kitchen", "binary_sensor.door", "light.hall"]
+    assert not index.is_exposed("light.hidden")
+    assert not index.is_exposed("sensor.date_time")
+    assert _ids(index.candidates(domain="light")) == ["light.kitchen", "light.hall"]
+    assert _ids(index.candidates(domain=["light", "binary_sensor"], area_ids=["hall"])) == ["binary_sensor.door", "light.hall"]
+    assert _ids(index.candidates(device_classes="door")) == ["binary_sensor.door"]
+    assert _ids(index.candidates("entrance")) == ["binary_sensor.door"]
+    assert _ids(index.candidates("Kitchen Light")) == ["light.kitchen"]
+    assert index.candidates("kitchen light", area_ids=["hall"]) == []
+    assert_consistent(index)
+
+
+def test_entity_registry_updates(hass, index):
+    hass.add("light.garage", area_id="garage", friendly_name="Garage light")
+    hass.bus.fire("entity_registry_updated", action="create", entity_id="light.garage")
+    assert _ids(index.candidates(area_ids=["garage"])) == ["light.garage"]
+
+    # Renamed entities move to their new id
+    hass.rename("light.kitchen", "light.cooking")
+    hass.bus.fire("entity_registry_updated", action="update", entity_id="light.cooking", old_entity_id="light.kitchen")
+    assert _ids(index.candidates(area_ids=["kitchen"])) == ["light.cooking"]
+    assert not index.is_exposed("light.kitchen")
+
+    # Exposing and unexposing
+    hass.data["entity_registry"].entities["light.hidden"].options["conversation"]["should_expose"] = True
+    hass.bus.fire("entity_registry_updated", action="update", entity_id="light.hidden")
+    hass.data["entity_registry"].entities["light.hall"].options["conversation"]["should_expose"] = False
+    hass.bus.fire("entity_registry_updated", action="update", entity_id="light.hall")
+    assert _ids(index.candidates(domain="light")) == ["light.hidden", "light.garage", "light.cooking"]
+
+    hass.bus.fire("entity_registry_updated", action="remove", entity_id="binary_sensor.door")
+    assert index.candidates("entrance") == []
+    assert_consistent(index)
+
+
+def test_registry_order_is_kept_across_updates(hass, index):
+    # An update of an entity keeps its place, a removed and re-added entity goes last
+    hass.data["entity_registry"].entities["light.kitchen"].area_id = "hall"
+    hass.bus.fire("entity_registry_updated", action="update", entity_id="light.kitchen")
+    assert _ids(index.candidates(area_ids=["hall"])) == ["light.kitchen", "binary_sensor.door", "light.hall"]
+    hass.bus.fire("entity_registry_updated", action="remove", entity_id="light.kitchen")
+    hass.bus.fire("entity_registry_updated", action="create", entity_id="light.kitchen")
+    assert _ids(index.candidates()) == ["binary_sensor.door", "light.hall", "light.kitchen"]
+    assert_consistent(index)
+
+
+def test_device_and_area_updates(hass, index):
+    # Entities without an own area follow their device
+    hass.data["device_registry"].devices["dev1"].area_id = "porch"
+    hass.bus.fire("device_registry_updated", action="update", device_id="dev1")
+    assert _ids(index.candidates(area_ids=["porch"])) == ["binary_sensor.door", "light.hall"]
+    assert index.candidates(area_ids=["hall"]) == []
+
+    hass.data["entity_registry"].entities["light.kitchen"].area_id = None
+    hass.bus.fire("area_registry_updated", action="remove", area_id="kitchen")
+    assert index.candidates(area_ids=["kitchen"]) == []
+    assert index.is_exposed("light.kitchen")
+    assert_consistent(index)
+
+
+def test_state_changes(hass, index):
+    new_state = hass.set_state("binary_sensor.door", device_class="window", friendly_name="Back window")
+    hass.bus.fire("state_changed", entity_id="binary_sensor.door", new_state=new_state)
+    assert index.candidates(device_classes="door") == []
+    assert index.candidates("front door") == []
+    assert _ids(index.candidates("back window", device_classes=["window"])) == ["binary_sensor.door"]
+    # Aliases are registry data and stay
+    assert _ids(index.candidates("entrance")) == ["binary_sensor.door"]
+
+    # Unexposed entities and removed states are ignored
+    hidden_state = hass.set_state("light.hidden", friendly_name="Now visible")
+    hass.bus.fire("state_changed", entity_id="light.hidden", new_state=hidden_state)
+    hass.bus.fire("state_changed", entity_id="light.hall", new_state=None)
+    assert index.candidates("now visible") == []
+    assert index.is_exposed("light.hall")
+    assert_consistent(index)
+
+
+def test_stop(hass, index):
+    index.async_stop()
+    assert hass.bus.listeners == {}
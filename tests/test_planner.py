@@ -0,0 +1,87 @@
+import pytest
+
+from logbook_expose.logbook_processor.planner import (
+    DEFAULT_ENTITY_RATE,
+    STRATEGY_BATCHED,
+    STRATEGY_FULL,
+    STRATEGY_PER_ENTITY,
+    QueryPlan,
+    QueryPlanner,
+)
+
+
+def _candidates(count):
+    return [f"light.l{i}" for i in range(count)]
+
+
+def _plan(planner, candidate_ids, transport, hours=1, total_entities=1000, per_entity_limit=20, batch_count=1, shard_count=1):
+    return planner.plan(candidate_ids, hours, total_entities, per_entity_limit, batch_count, shard_count, 4, transport)
+
+
+def test_few_candidates_over_http():
+    plan = _plan(QueryPlanner(), _candidates(3), "http")
+    assert plan.transport == "http"
+    assert plan.strategy == STRATEGY_PER_ENTITY
+    assert plan.requests == 3
+    assert set(plan.alternatives) == {STRATEGY_BATCHED, STRATEGY_FULL}
+    assert all(cost >= plan.cost_ms for cost in plan.alternatives.values())
+
+
+def test_caps_of_the_http_strategies():
+    planner = QueryPlanner()
+    # At per_entity_limit candidates only batches or the whole logbook are left
+    plan = _plan(planner, _candidates(20), "http", batch_count=2)
+    assert plan.strategy == STRATEGY_BATCHED
+    assert plan.requests == 2
+    assert set(plan.alternatives) == {STRATEGY_FULL}
+    # Without batching only the whole logbook is left
+    plan = _plan(planner, _candidates(20), "http", batch_count=None)
+    assert plan.strategy == STRATEGY_FULL
+    assert plan.alternatives == {}
+
+
+@pytest.mark.parametrize("candidate_count", [3, 200])
+def test_websocket_sends_one_command_per_window(candidate_count):
+    # The websocket takes any number of entity ids, so there are no per-entity requests
+    plan = _plan(QueryPlanner(), _candidates(candidate_count), "websocket", batch_count=5)
+    assert plan.transport == "websocket"
+    assert plan.strategy == STRATEGY_BATCHED
+    assert plan.requests == 1
+    assert set(plan.alternatives) == {STRATEGY_FULL}
+    assert plan.cost_ms == QueryPlanner.cost(1, plan.entries, 4, "websocket")
+    assert plan.cost_ms < QueryPlanner.cost(1, plan.entries, 4, "http")
+
+
+def test_websocket_without_batching():
+    plan = _plan(QueryPlanner(), _candidates(3), "websocket", batch_count=None)
+    assert (plan.strategy, plan.transport, plan.requests) == (STRATEGY_FULL, "websocket", 1)
+
+
+def test_whole_logbook_when_most_entities_are_candidates():
+    candidate_ids = _candidates(900)
+    # More batches than parallel requests, for the same entries as the whole logbook
+    plan = _plan(QueryPlanner(), candidate_ids, "http", total_entities=900, batch_count=9)
+    assert plan.entries == len(candidate_ids) * DEFAULT_ENTITY_RATE
+    assert plan.strategy == STRATEGY_FULL
+    assert plan.requests == 1
+
+
+def test_long_windows_are_sharded():
+    plan = _plan(QueryPlanner(), _candidates(900), "http", hours=96, total_entities=900, batch_count=3, shard_count=4)
+    assert plan.shards == 4
+    assert plan.name == f"{plan.strategy}+sharded"
+    assert plan.strategy in plan.alternatives
+
+
+def test_learned_rates_change_the_plan():
+    planner = QueryPlanner()
+    candidate_ids = _candidates(25)
+    # With the default rates the rest of the house dwarfs the candidates
+    assert _plan(planner, candidate_ids, "http", batch_count=9).strategy == STRATEGY_BATCHED
+    # A full fetch shows that only the candidates are busy
+    plan = QueryPlan(STRATEGY_FULL)
+    planner.learn(plan, candidate_ids, {entity_id: 2 for entity_id in candidate_ids}, 1, 100, 100)
+    assert planner.rates[candidate_ids[0]] == 4
+    assert planner.house_rate == 100
+    assert planner.stats["plans"] == [plan.as_dict()]
+    assert _plan(planner, candidate_ids, "http", batch_count=9).strategy == STRATEGY_FULL
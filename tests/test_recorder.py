@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from logbook_expose.logbook_processor.recorder import ENTITY_CHUNK_SIZE, fetch_recorder_entries, query_recorder_states
+from logbook_expose.logbook_processor.records import is_continuous
+
+START = 1_760_000_000.0
+
+def test_state_changes_only(recorder_engine):
+    engine = recorder_engine(["light.a", "light.b"], [
+        # The recorder leaves last_changed_ts empty when the state changed
+        ("light.a", "on", START + 10, None),
+        # Attribute-only update: last_changed_ts stays at the previous state change
+        ("light.a", "on", START + 20, START + 10),
+        ("light.b", "off", START + 15, START + 15),
+        ("light.a", "off", START + 30, None),
+        # Outside the window [START, START + 60)
+        ("light.a", "on", START - 1, None),
+        ("light.b", "on", START + 60, None),
+    ])
+    records = query_recorder_states(engine, ["light.a", "light.b"], START, START + 60)
+    assert [(r.ts, r.entity_id, r.state) for r in records] == [
+        (START + 10, "light.a", "on"),
+        (START + 15, "light.b", "off"),
+        (START + 30, "light.a", "off"),
+    ]
+
+
+def test_only_requested_entities(recorder_engine):
+    engine = recorder_engine(["light.a", "light.b"], [
+        ("light.a", "on", START + 10, None),
+        ("light.b", "on", START + 20, None),
+    ])
+    records = query_recorder_states(engine, ["light.b", "light.missing"], START, START + 60)
+    assert [r.entity_id for r in records] == ["light.b"]
+    assert query_recorder_states(engine, [], START, START + 60) == []
+
+
+def test_chunked_entity_lists_are_merged_in_time_order(recorder_engine):
+    count = 2 * ENTITY_CHUNK_SIZE + 200
+    entity_ids = [f"sensor.s{i:04d}" for i in range(count)]
+    # Consecutive events belong to entities in different chunks of the sorted id list
+    rows = [(entity_ids[(i * 7) % count], str(i), START + i, None) for i in range(3 * count)]
+    engine = recorder_engine(entity_ids, rows)
+
+    records = query_recorder_states(engine, reversed(entity_ids), START, START + 3 * count)
+    assert [r.ts for r in records] == [START + i for i in range(3 * count)]
+    assert [r.entity_id for r in records] == [row[0] for row in rows]
+
+
+def _state(entity_id, **attributes):
+    return SimpleNamespace(entity_id=entity_id, attributes=attributes)
+
+
+def test_is_continuous():
+    assert not is_continuous(_state("light.a", friendly_name="A"))
+    assert is_continuous(_state("sensor.t", unit_of_measurement="°C"))
+    assert is_continuous(_state("sensor.energy", state_class="total_increasing"))
+
+
+def test_fetch_recorder_entries_skips_continuous_entities(monkeypatch, recorder_engine):
+    pytest.importorskip("homeassistant")
+    from homeassistant.components import recorder
+
+    engine = recorder_engine(["light.a", "sensor.t"], [
+        ("light.a", "on", START + 10, None),
+        ("sensor.t", "21.5", START + 20, None),
+        ("sensor.t", "21.6", START + 30, None),
+    ])
+
+    async def async_add_executor_job(func, *args):
+        return func(*args)
+
+    instance = SimpleNamespace(engine=engine, async_add_executor_job=async_add_executor_job)
+    monkeypatch.setattr(recorder, "get_instance", lambda hass: instance)
+    candidates = [_state("light.a", friendly_name="A"), _state("sensor.t", unit_of_measurement="°C")]
+    start_dt = datetime.fromtimestamp(START, timezone.utc)
+    records = asyncio.run(fetch_recorder_entries(None, candidates, start_dt, start_dt + timedelta(minutes=1)))
+    assert [(r.entity_id, r.state, r.name) for r in records] == [("light.a", "on", "A")]
@@ -0,0 +1,35 @@
+from logbook_expose.logbook_processor.query import SUMMARY_HEADER, format_summary
+from logbook_expose.logbook_processor.records import LogbookEvent
+from logbook_expose.logbook_processor.summary import summarize_records
+
+START = 1_760_000_000.0
+
+
+def _summaries():
+    records = []
+    for i in range(20):
+        records.append(LogbookEvent(START + 60 * i, "binary_sensor.door", "on" if i % 2 else "off", "Front door"))
+        records.append(LogbookEvent(START + 60 * i + 30, f"light.room_{i}", "on", f"Room {i} light"))
+    return summarize_records(records, START + 3600)
+
+
+def test_format_summary():
+    stats = {}
+    output = format_summary(_summaries(), stats=stats)
+    lines = output.splitlines()
+    assert output.startswith(SUMMARY_HEADER)
+    assert len(lines) == 1 + 2 + 20
+    assert lines[1].startswith("Front door, ")
+    assert ", 10, " in lines[1]
+    assert "truncated" not in stats
+
+
+def test_format_summary_truncates():
+    stats = {}
+    full = format_summary(_summaries())
+    output = format_summary(_summaries(), char_limit=len(SUMMARY_HEADER) + 200, stats=stats)
+    assert stats["truncated"] == "char_limit"
+    assert output.startswith(SUMMARY_HEADER)
+    assert len(output) <= len(SUMMARY_HEADER) + 200
+    assert full.startswith(output)
+    assert output.endswith("\n")
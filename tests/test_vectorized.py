@@ -0,0 +1,91 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from logbook_expose.logbook_processor import vectorized
+from logbook_expose.logbook_processor.query import (
+    EntryDeduplicator,
+    _deduplicate_vectorized,
+    _iter_congestion,
+    _iter_congestion_vectorized,
+)
+from logbook_expose.logbook_processor.records import LogbookEvent
+
+START = 1_760_000_000.0
+STATES = ["on", "off", "unknown", None, "on"]
+
+
+@pytest.fixture(autouse=True)
+def numpy_engine():
+    assert vectorized.load_numpy() is not None
+
+
+def _random_records(rng, count, entity_ids):
+    # Time-ordered, with several events in the same second and repeated states
+    records = []
+    ts = START
+    for _ in range(count):
+        ts += rng.choice([0, 0, 0, 0.3, 1.2, 5])
+        records.append(LogbookEvent(ts, rng.choice(entity_ids), rng.choice(STATES)))
+    return records
+
+
+def _deduplicator(candidate_ids, last_states):
+    dedup = EntryDeduplicator([SimpleNamespace(entity_id=entity_id) for entity_id in candidate_ids])
+    dedup.last_states = dict(last_states)
+    return dedup
+
+
+def _dedup_state(dedup):
+    return (
+        dict(dedup.last_states),
+        dedup.total,
+        dedup.accepted,
+        dedup.dropped_unknown,
+        dedup.dropped_candidate,
+        dedup.dropped_repeated,
+    )
+
+
+def _cases():
+    rng = random.Random(5)
+    for entity_count in (1, 5, 200):
+        entity_ids = [f"light.l{i}" for i in range(entity_count)]
+        records = _random_records(rng, 3000, entity_ids)
+        seeded = {entity_id: rng.choice(["on", "unknown", "off"]) for entity_id in rng.sample(entity_ids, min(3, entity_count))}
+        filtered = rng.sample(entity_ids, rng.randint(1, entity_count))
+        for candidate_ids in ([], filtered):
+            for last_states in ({}, seeded):
+                yield records, candidate_ids, last_states
+
+
+@pytest.mark.parametrize("records,candidate_ids,last_states", list(_cases()))
+def test_deduplicate_matches_python_engine(records, candidate_ids, last_states):
+    python = _deduplicator(candidate_ids, last_states)
+    expected = [record for record in records if python.accept(record.entity_id, record.state)]
+    vector = _deduplicator(candidate_ids, last_states)
+    assert _deduplicate_vectorized(records, vector) == expected
+    assert _dedup_state(vector) == _dedup_state(python)
+
+
+def _congested(engine, records, events_per_second, congestion):
+    stats = {"dropped_congestion": 0}
+    # Summaries are copies; compare what the formatter sees
+    output = [
+        (record.ts, record.entity_id, record.state, record.description)
+        for record in engine(list(records), events_per_second, congestion, stats)
+    ]
+    return output, stats
+
+
+@pytest.mark.parametrize("events_per_second", [0, 1, 3])
+@pytest.mark.parametrize("congestion", ["skip", "summarize", "other"])
+def test_congestion_matches_python_engine(events_per_second, congestion):
+    rng = random.Random(events_per_second)
+    records = _random_records(rng, 3000, [f"light.l{i}" for i in range(20)])
+    assert _congested(_iter_congestion_vectorized, records, events_per_second, congestion) == _congested(
+        _iter_congestion, records, events_per_second, congestion
+    )
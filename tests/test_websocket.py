@@ -0,0 +1,131 @@
+import asyncio
+import functools
+from types import SimpleNamespace
+
+from aiohttp import WSMsgType, web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from logbook_expose.logbook_processor.query import LogbookFetchError, get_websocket_entries
+from logbook_expose.logbook_processor.websocket import LogbookWebsocket, WebsocketError
+
+TOKEN = "secret"
+EVENTS = [
+    {"when": 1_760_000_030.0, "entity_id": "light.kitchen", "state": "off"},
+    {"when": 1_760_000_010.0, "entity_id": "light.kitchen", "state": "on"},
+    {"when": 1_760_000_020.0, "entity_id": "light.hall", "state": "on"},
+]
+
+
+async def websocket_handler(commands, request):
+    # Stand-in for the Home Assistant websocket API: auth handshake and logbook/get_events
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    await ws.send_json({"type": "auth_required"})
+    auth = await ws.receive_json()
+    if auth.get("access_token") != TOKEN:
+        await ws.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+        await ws.close()
+        return ws
+    await ws.send_json({"type": "auth_ok"})
+    async for message in ws:
+        if message.type != WSMsgType.TEXT:
+            continue
+        command = message.json()
+        commands.append(command)
+        if command["type"] != "logbook/get_events":
+            await ws.send_json({"id": command["id"], "type": "result", "success": False, "error": {"code": "unknown_command", "message": "Unknown command."}})
+            continue
+        entity_ids = command.get("entity_ids")
+        result = [event for event in EVENTS if not entity_ids or event["entity_id"] in entity_ids]
+        await ws.send_json({"id": command["id"], "type": "result", "success": True, "result": result})
+    return ws
+
+
+def run_with_server(test):
+    async def main():
+        commands = []
+        app = web.Application()
+        app.router.add_get("/api/websocket", functools.partial(websocket_handler, commands))
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await test(commands, LogbookWebsocket.url_from_base(str(server.make_url(""))))
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_url_from_base():
+    assert LogbookWebsocket.url_from_base("http://homeassistant.local:8123/") == "ws://homeassistant.local:8123/api/websocket"
+    assert LogbookWebsocket.url_from_base("https://example.com") == "wss://example.com/api/websocket"
+
+
+def test_get_events():
+    async def test(commands, url):
+        websocket = LogbookWebsocket(url, TOKEN)
+        try:
+            events = await websocket.get_events("2025-10-09T08:00:00Z", "2025-10-09T09:00:00Z", ["light.kitchen"])
+            # Concurrent requests share the connection
+            results = await asyncio.gather(*(websocket.get_events("2025-10-09T08:00:00Z") for _ in range(3)))
+        finally:
+            await websocket.async_close()
+        assert [event["state"] for event in events] == ["off", "on"]
+        assert all(len(result) == 3 for result in results)
+        assert commands[0]["entity_ids"] == ["light.kitchen"]
+        assert commands[0]["end_time"] == "2025-10-09T09:00:00Z"
+        assert websocket.stats["connects"] == 1
+        assert websocket.stats["requests"] == 4
+
+    run_with_server(test)
+
+
+def test_get_websocket_entries():
+    candidates = [
+        SimpleNamespace(entity_id="light.kitchen", attributes={"friendly_name": "Kitchen light"}),
+        SimpleNamespace(entity_id="light.hall", attributes={"friendly_name": "Hall light"}),
+    ]
+
+    async def test(commands, url):
+        websocket = LogbookWebsocket(url, TOKEN)
+        try:
+            return await get_websocket_entries(websocket, "2025-10-09T08:00:00Z", "2025-10-09T09:00:00Z", candidates)
+        finally:
+            await websocket.async_close()
+
+    records = run_with_server(test)
+    # Time-ordered, with the friendly names the websocket entries lack
+    assert [(record.entity_id, record.state, record.name) for record in records] == [
+        ("light.kitchen", "on", "Kitchen light"),
+        ("light.hall", "on", "Hall light"),
+        ("light.kitchen", "off", "Kitchen light"),
+    ]
+
+
+def test_authentication_failure():
+    async def test(commands, url):
+        websocket = LogbookWebsocket(url, "wrong")
+        try:
+            with pytest.raises(WebsocketError, match="Authentication failed"):
+                await websocket.get_events("2025-10-09T08:00:00Z")
+            # Further requests fail at once during the reconnect backoff
+            with pytest.raises(LogbookFetchError, match="next attempt"):
+                await get_websocket_entries(websocket, "2025-10-09T08:00:00Z", None, [])
+        finally:
+            await websocket.async_close()
+
+    run_with_server(test)
+
+
+def test_failed_command():
+    async def test(commands, url):
+        websocket = LogbookWebsocket(url, TOKEN)
+        try:
+            with pytest.raises(WebsocketError, match="unknown_command"):
+                await websocket.request({"type": "logbook/unknown"})
+        finally:
+            await websocket.async_close()
+        assert websocket.stats["errors"] == 1
+
+    run_with_server(test)